@@ -0,0 +1,84 @@
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+
+
+class CSVIngestError(Exception):
+    """
+    Invalid rows of an uploaded CSV file, as [{"row": row number, "error": message}]. errors may only list the first
+    of the invalid_rows invalid rows.
+    """
+
+    def __init__(self, errors, invalid_rows=None):
+        self.invalid_rows = len(errors) if invalid_rows is None else invalid_rows
+        message = f"The CSV file contains {self.invalid_rows} invalid rows."
+        if self.invalid_rows > len(errors):
+            message += f" The first {len(errors)} are listed."
+        super().__init__(message)
+        self.errors = errors
+
+
+def iter_csv_rows(uploaded_file, encoding="utf-8", row_offset=0):
+    """
+    Parses an uploaded CSV file one row at a time, without reading the file into memory.
+    Yields (row number, row dict). The header is row 1 + row_offset, e.g. for files uploaded in chunks.
+    """
+    uploaded_file.seek(0)
+    text = io.TextIOWrapper(uploaded_file.file, encoding=encoding, newline="")
+    try:
+        for row_number, row in enumerate(csv.DictReader(text), start=row_offset + 2):
+            yield row_number, row
+    finally:
+        # leave the uploaded file open, Django closes it at the end of the request
+        text.detach()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def ingest_csv(uploaded_file, model, build, row_offset=0, batch_size=None, max_errors=None):
+    """
+    Streams the rows of an uploaded CSV file into model instances, inserted with bulk_create in batches of
+    CSV_INGEST_BATCH_SIZE, so memory use does not grow with the size of the file.
+
+    build(row_number, row) returns the unsaved instance of a row, or raises ValueError with the problem of the row.
+    The whole file is read before CSVIngestError is raised with the number of invalid rows and the details of the
+    first CSV_INGEST_MAX_ERRORS of them.
+    Call it inside transaction.atomic, so that nothing is inserted if a row is invalid.
+    Returns the number of inserted rows.
+    """
+    batch_size = batch_size or settings.CSV_INGEST_BATCH_SIZE
+    max_errors = max_errors or settings.CSV_INGEST_MAX_ERRORS
+    errors = []
+    invalid_rows = 0
+    created = 0
+
+    def build_rows(rows):
+        nonlocal invalid_rows
+        try:
+            for row_number, row in rows:
+                try:
+                    yield build(row_number, row)
+                except ValueError as e:
+                    # every invalid row is counted, only the details are capped
+                    invalid_rows += 1
+                    if len(errors) < max_errors:
+                        errors.append({"row": row_number, "error": str(e)})
+        except (csv.Error, UnicodeDecodeError) as e:
+            # the rest of the file cannot be parsed
+            invalid_rows += 1
+            errors.append({"row": None, "error": f"Malformed CSV file: {e}"})
+
+    for batch in batched(build_rows(iter_csv_rows(uploaded_file, row_offset=row_offset)), batch_size):
+        if not errors:
+            model.objects.bulk_create(batch, batch_size=batch_size)
+            created += len(batch)
+
+    if errors:
+        raise CSVIngestError(errors, invalid_rows=invalid_rows)
+    return created
@@ -0,0 +1,39 @@
+import os
+
+# upper bound for the padded tokens (batch size * longest sequence) of a batch
+DEFAULT_MAX_BATCH_TOKENS = int(os.getenv("METRIC_MAX_BATCH_TOKENS", 8192))
+
+
+def length_bucketed_batches(lengths: list, max_tokens: int = None, max_batch_size: int = None) -> list:
+    """
+    Groups item indices into batches of similar length.
+
+    Items are sorted by length (longest first) and packed into a batch as long as the padded size of the batch,
+    i.e. its number of items times its longest item, stays within max_tokens. Items longer than max_tokens get a
+    batch of their own. Returns a list of index lists, the caller restores the input order with restore_order.
+    """
+    max_tokens = max_tokens or DEFAULT_MAX_BATCH_TOKENS
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches = []
+    batch = []
+    for i in order:
+        # the first item of a batch is its longest one
+        longest = lengths[batch[0]] if batch else lengths[i]
+        full = max_batch_size is not None and len(batch) >= max_batch_size
+        if batch and (full or (len(batch) + 1) * longest > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def restore_order(batches: list, batch_results: list) -> list:
+    """Puts the per-item results of the batches from length_bucketed_batches back into input order"""
+    results = [None] * sum(len(batch) for batch in batches)
+    for batch, batch_result in zip(batches, batch_results):
+        for i, result in zip(batch, batch_result):
+            results[i] = result
+    return results
@@ -1,8 +1,16 @@
+import time
+
 from celery import Task
+from django.conf import settings
+from django.core.cache import cache
+
+from .task_events import publish_task_event
+
+PHASE_COMPLETED = 'completed'
 
 
 class CeleryProgressManager:
-    def __init__(self, task: Task, phase_definitions):
+    def __init__(self, task: Task, phase_definitions, task_id=None, min_interval=None, min_change=None):
         """
         :param task: Celery task instance
         :param phase_definitions: Dict of {
@@ -13,8 +21,15 @@ class CeleryProgressManager:
                 'steps': None|int
             }
         }
+        :param task_id: id of the task that reports the progress, if it is shared by several tasks (e.g. the
+            subtasks of a chord). Every task then works on its own phases, the phase progress is kept in the
+            Django cache and the progress of all phases is reported on task_id.
+        :param min_interval: minimum number of seconds between two progress updates of update_phase
+        :param min_change: minimum change of the total progress (in percent) for update_phase to send an update
+            Phase transitions, the end of the last phase and failures are always sent.
         """
         self.task: Task = task
+        self.task_id = task_id
         self.phases = phase_definitions
         self._validate_weights()
         self.completed_phases = set()
@@ -22,6 +37,15 @@ class CeleryProgressManager:
         self.phase_history = []
         self.total_progress = 0
 
+        self.min_interval = min_interval if min_interval is not None else settings.PROGRESS_UPDATE_MIN_INTERVAL
+        self.min_change = min_change if min_change is not None else settings.PROGRESS_UPDATE_MIN_CHANGE
+        self.started_at = time.monotonic()
+        self.start_progress = None
+        self.last_sent_at = None
+        self.last_sent_progress = None
+        self.phase_started_at = {}  # {phase_id: time the phase was entered}
+        self.phase_steps = {}  # {phase_id: current step}
+
     def _validate_weights(self):
         total_weight = sum(p['weight'] for p in self.phases.values())
         if not 0.99 < total_weight < 1.01:
@@ -34,6 +58,9 @@ class CeleryProgressManager:
 
         self.active_phases[phase_id] = initial_progress
         self.phase_history.append(phase_id)
+        self.phase_started_at[phase_id] = time.monotonic()
+        self.phase_steps.pop(phase_id, None)
+        self._store_phase(phase_id, initial_progress)
         self._update_progress()
 
     def exit_phase(self, phase_id):
@@ -43,6 +70,7 @@ class CeleryProgressManager:
 
         self.completed_phases.add(phase_id)
         del self.active_phases[phase_id]
+        self._store_phase(phase_id, PHASE_COMPLETED)
         self._update_progress()
 
     def handle_failure(self, exception):
@@ -55,10 +83,8 @@ class CeleryProgressManager:
             'active_phases': self.active_phases,
             'message': 'Something went wrong'
         }
-        self.task.update_state(
-            state='FAILURE',
-            meta=error_meta
-        )
+        # sent regardless of the throttling
+        self._send_state('FAILURE', error_meta)
 
     def update_phase(self, phase_id, current_step, total_steps=None):
         """Update progress within a phase"""
@@ -71,42 +97,123 @@ class CeleryProgressManager:
 
         if phase['steps']:
             progress = current_step / phase['steps']
+            self.phase_steps[phase_id] = current_step
         else:  # Indeterminate progress
             progress = min(self.active_phases[phase_id] + 0.05, 0.95)
 
         self.active_phases[phase_id] = progress
-        self._update_progress()
+        # per-item updates are coalesced, the progress is only stored and sent when it is due
+        if self._update_due():
+            self._store_phase(phase_id, progress)
+            self._update_progress()
+
+    def _local_progress(self):
+        """Total progress of the phases of this task, in percent"""
+        completed_weight = sum(self.phases[pid]['weight'] for pid in self.completed_phases)
+        active_contributions = sum(
+            self.phases[pid]['weight'] * progress for pid, progress in self.active_phases.items()
+        )
+        return (completed_weight + active_contributions) * 100
+
+    def _update_due(self):
+        if self.last_sent_at is None:
+            return True
+        if time.monotonic() - self.last_sent_at < self.min_interval:
+            return False
+        return abs(self._local_progress() - self.last_sent_progress) >= self.min_change
+
+    def _phase_rates(self, phase_id):
+        """Items per second and remaining seconds of a phase with a known number of steps"""
+        steps = self.phases[phase_id]['steps']
+        done = self.phase_steps.get(phase_id)
+        if not steps or not done or phase_id not in self.phase_started_at:
+            return None, None
+        elapsed = time.monotonic() - self.phase_started_at[phase_id]
+        if elapsed <= 0:
+            return None, None
+        items_per_second = done / elapsed
+        return items_per_second, max(steps - done, 0) / items_per_second
+
+    def _eta(self):
+        """Remaining seconds of the whole task, extrapolated from the progress made since this manager started"""
+        gained = self.total_progress - self.start_progress
+        if gained <= 0:
+            return None
+        return (time.monotonic() - self.started_at) * (100 - self.total_progress) / gained
+
+    def _phase_cache_key(self, phase_id):
+        return f'task_progress:{self.task_id}:{phase_id}'
+
+    def _store_phase(self, phase_id, progress):
+        """Share the progress of a phase with the other tasks reporting on task_id"""
+        if self.task_id is not None:
+            cache.set(self._phase_cache_key(phase_id), progress, 60 * 60 * 24)
+
+    def _all_phases(self):
+        """Completed and active phases of all tasks reporting on task_id, or of this task only"""
+        if self.task_id is None:
+            return self.completed_phases, self.active_phases
+
+        stored = cache.get_many([self._phase_cache_key(pid) for pid in self.phases])
+        completed_phases, active_phases = set(), {}
+        for pid in self.phases:
+            progress = stored.get(self._phase_cache_key(pid))
+            if progress == PHASE_COMPLETED:
+                completed_phases.add(pid)
+            elif progress is not None:
+                active_phases[pid] = progress
+        return completed_phases, active_phases
+
+    def _send_state(self, state, meta):
+        if self.task_id is None:
+            self.task.update_state(state=state, meta=meta)
+        else:
+            self.task.update_state(task_id=self.task_id, state=state, meta=meta)
+        # clients streaming the task events get the update pushed instead of polling the result backend
+        publish_task_event(self.task_id or self.task.request.id, state, meta)
 
     def _update_progress(self):
         """Calculate and send progress update"""
+        completed_phases, active_phases = self._all_phases()
+
         # Calculate completed weight
         completed_weight = sum(
             self.phases[pid]['weight']
-            for pid in self.completed_phases
+            for pid in completed_phases
         )
 
         # Calculate active weight contributions
         active_contributions = sum(
             self.phases[pid]['weight'] * progress
-            for pid, progress in self.active_phases.items()
+            for pid, progress in active_phases.items()
         )
 
         self.total_progress = (completed_weight + active_contributions) * 100
+        if self.start_progress is None:
+            self.start_progress = self.total_progress
 
         # Prepare phase status
-        active_phases = [{
-            'id': pid,
-            'name': self.phases[pid]['name'],
-            'message': self.phases[pid]['message'],
-            'progress': progress * 100
-        } for pid, progress in self.active_phases.items()]
+        phase_status = []
+        for pid, progress in active_phases.items():
+            items_per_second, eta = self._phase_rates(pid)
+            phase_status.append({
+                'id': pid,
+                'name': self.phases[pid]['name'],
+                'message': self.phases[pid]['message'],
+                'progress': progress * 100,
+                'items_per_second': items_per_second,
+                'eta_seconds': eta,
+            })
 
         # Update task state
-        self.task.update_state(
-            state='PROGRESS',
-            meta={
+        self._send_state(
+            'PROGRESS',
+            {
                 'total_progress': self.total_progress,
-                'active_phases': active_phases,
-                'completed_phases': list(self.completed_phases)
+                'eta_seconds': self._eta(),
+                'active_phases': phase_status,
+                'completed_phases': list(completed_phases)
             }
         )
+        self.last_sent_at = time.monotonic()
+        self.last_sent_progress = self._local_progress()
@@ -1,14 +1,42 @@
+import importlib
+import logging
+import os
+import resource
+import threading
+
 import numpy as np
 
 from base.evaluation.celery_progress_manager import CeleryProgressManager
-from base.evaluation.metrics.bartscore import BartScore
-from base.evaluation.metrics.bertscore import BertScore
-from base.evaluation.metrics.bleu import Bleu
-from base.evaluation.metrics.factscore_metric import FactScoreMetric
-from base.evaluation.metrics.gpt_eval import GPTEval
-from base.evaluation.metrics.meteor import Meteor
-from base.evaluation.metrics.rouge import Rouge
-from base.evaluation.metrics.unieval import UniEval
+
+logger = logging.getLogger(__name__)
+
+# metrics are imported and built on first use, so processes that never score anything do not load them
+METRIC_CLASSES = {
+    "rouge": "base.evaluation.metrics.rouge.Rouge",
+    "meteor": "base.evaluation.metrics.meteor.Meteor",
+    "bleu": "base.evaluation.metrics.bleu.Bleu",
+    "bertscore": "base.evaluation.metrics.bertscore.BertScore",
+    "bartscore": "base.evaluation.metrics.bartscore.BartScore",
+    "unieval": "base.evaluation.metrics.unieval.UniEval",
+    "factscore": "base.evaluation.metrics.factscore_metric.FactScoreMetric",
+}
+
+# the dimensions UniEval can score, see SumEvaluator
+UNIEVAL_DIMENSIONS = ("coherence", "consistency", "fluency", "relevance")
+
+# metrics whose corpus score is built from per-item sufficient statistics (see Metric.compute_batch)
+STATISTICS_METRICS = ("rouge", "bleu", "bertscore", "factscore")
+
+
+def memory_usage_mb() -> float:
+    """Resident set size of the current process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        # no procfs (e.g. macOS), fall back to the peak RSS which is reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** 2
 
 
 class EvaluationHandler():
@@ -23,57 +51,121 @@ class EvaluationHandler():
             "llm_evaluation": self.calc_llm_evaluation,
             "factscore": self.calc_factscore,
         }
-        self.rouge = Rouge()
-        self.meteor = Meteor()
-        self.bleu = Bleu()
-        self.bertscore = BertScore()
-        self.bartscore = BartScore()
-        self.unieval = UniEval()
-        self.factscore = FactScoreMetric()
+        self.metrics = {}
+        self.metric_memory = {}  # {metric_name: MB added to the process when the metric was built}
+        self.lock = threading.Lock()
+
+    def get_metric(self, name):
+        """Returns the metric instance of this process, building it on first use"""
+        metric = self.metrics.get(name)
+        if metric is not None:
+            return metric
+        with self.lock:
+            if name not in self.metrics:
+                module_path, class_name = METRIC_CLASSES[name].rsplit(".", 1)
+                rss_before = memory_usage_mb()
+                metric_class = getattr(importlib.import_module(module_path), class_name)
+                self.metrics[name] = metric_class()
+                self.metric_memory[name] = memory_usage_mb() - rss_before
+                logger.info("Loaded metric %s (+%.0f MB, process RSS %.0f MB)",
+                            name, self.metric_memory[name], memory_usage_mb())
+        return self.metrics[name]
+
+    def warmup(self, metric_names=None):
+        """Builds the given metrics (all by default) ahead of the first task"""
+        for name in metric_names or METRIC_CLASSES:
+            self.get_metric(name)
+
+    def metric_version(self, metric) -> str:
+        """Version of a metric's implementation, stored results of other versions are recomputed"""
+        if metric == "llm_evaluation":
+            from base.evaluation.metrics.gpt_eval import GPTEval
+
+            return GPTEval.metric_version
+        module_path, class_name = METRIC_CLASSES[metric].rsplit(".", 1)
+        return getattr(importlib.import_module(module_path), class_name).metric_version
+
+    def memory_report(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "rss_mb": memory_usage_mb(),
+            "metrics_mb": dict(self.metric_memory),
+        }
 
-    def calc_rogue(self, output, reference):
-        results = []
-        results.append(self.rouge.compute(predictions=output, references=reference))  # calculate total rouge scores
-        # Calculate rouge scores for each output-reference pair
-        for out, ref in zip(output, reference):
-            results.append(self.rouge.compute(predictions=[out], references=[ref]))
+    def evaluate(self, metric, predictions, references, sources=None, api_key=None,
+                 pm: CeleryProgressManager = None, **kwargs):
+        """
+        Runs a metric with the inputs it needs.
+        Returns a list with the total result first, followed by the result of every prediction.
+        """
+        if metric == "unieval":
+            return self.function_map[metric](predictions, references, sources, **kwargs)
+        if metric == "llm_evaluation":
+            return self.function_map[metric](api_key, sources, predictions)
+        if metric == "factscore":
+            return self.function_map[metric](sources, predictions, pm)
+        return self.function_map[metric](predictions, references)
+
+    def evaluate_shard(self, metric, predictions, references, sources=None, api_key=None, progress_callback=None,
+                       **kwargs):
+        """
+        Scores one shard of an experiment. Returns the per-item results and the per-item statistics, the corpus
+        score of all shards is built from the concatenated statistics with merge_statistics.
+        """
+        if metric == "factscore":
+            return self.get_metric(metric).compute_batch(predictions=list(predictions), references=list(sources),
+                                                         progress_callback=progress_callback)
+        if metric in STATISTICS_METRICS:
+            return self.get_metric(metric).compute_batch(predictions=list(predictions), references=list(references))
+
+        # the totals of the other metrics are means of their per-item results, which are the statistics then
+        per_item = self.evaluate(metric, predictions, references, sources=sources, api_key=api_key, **kwargs)[1:]
+        return per_item, per_item
+
+    def merge_statistics(self, metric, statistics):
+        """Corpus score from the statistics returned by evaluate_shard, concatenated in item order"""
+        if metric in STATISTICS_METRICS:
+            return self.get_metric(metric).aggregate(statistics)
+        if not statistics:
+            return {}
+        # llm_evaluation scores that could not be parsed are nan (None once stored) and left out, as in
+        # calc_llm_evaluation
+        # unieval results may cover different dimensions, every key of any summary is merged
+        keys = list(dict.fromkeys(key for item in statistics for key in item))
+        merged = {}
+        for key in keys:
+            values = [item[key] for item in statistics if item.get(key) is not None]
+            merged[key] = np.nanmean(values) if values else float("nan")
+        return merged
 
-        return results
+    def calc_rogue(self, output, reference):
+        return self._calc_batched(self.get_metric("rouge"), output, reference)
 
     def calc_meteor(self, output, reference):
         results = []
+        meteor = self.get_metric("meteor")
         for out, ref in zip(output, reference):
-            meteor_score = self.meteor.compute([out], [ref])
+            meteor_score = meteor.compute([out], [ref])
             results.append({"meteor": meteor_score["meteor"]})
         results.insert(0, {"meteor": np.mean(
             [result["meteor"] for result in results])})  # insert total meteor score by averaging all meteor scores
         return results
 
     def calc_bleu(self, output, reference):
-        results = []
-        results.append(self.bleu.compute(predictions=output, references=reference))  # calculate total bleu scores
-        # Calculate bleu scores for each output-reference pair
-        for out, ref in zip(output, reference):
-            results.append(self.bleu.compute(predictions=[out], references=[ref]))
-
-        return results
+        return self._calc_batched(self.get_metric("bleu"), output, reference)
 
     def calc_bert(self, output, reference):
-        results = []
-        total_result = self.bertscore.compute(predictions=output, references=reference)
-        total_result.pop('hashcode', None)
-        results.append(total_result)  # calculate total bert scores
-        # Calculate bert scores for each output-reference pair
-        for out, ref in zip(output, reference):
-            single_result = self.bertscore.compute(predictions=[out], references=[ref])
-            single_result.pop('hashcode', None)
-            results.append(single_result)
+        return self._calc_batched(self.get_metric("bertscore"), output, reference)
 
-        return results
+    @staticmethod
+    def _calc_batched(metric, output, reference):
+        # score all output-reference pairs in one pass and derive the total scores from the per-pair statistics
+        per_item, statistics = metric.compute_batch(predictions=list(output), references=list(reference))
+        return [metric.aggregate(statistics)] + per_item
 
     def calc_bart(self, output, reference):
         results = []
-        bart_scores = self.bartscore.compute(predictions=output, references=reference)
+        bart_scores = self.get_metric("bartscore").compute(predictions=output, references=reference)
         results.append({"f_score": bart_scores["f_score_overall"], "precision": bart_scores["precision_overall"],
                         "recall": bart_scores["recall_overall"]})
         # Calculate bart scores for each output-reference pair
@@ -82,24 +174,19 @@ class EvaluationHandler():
                             "recall": bart_scores["recall"][i]})
         return results
 
-    def calc_unieval(self, output, reference, source):
-        results = []
-        unieval = self.unieval.compute(output, reference, source)
-        coherence = [item["coherence"] for item in unieval]
-        consistency = [item["consistency"] for item in unieval]
-        fluency = [item["fluency"] for item in unieval]
-        relevance = [item["relevance"] for item in unieval]
-        overall = [item["overall"] for item in unieval]
-
-        results.append(
-            {"coherence": np.mean(coherence), "consistency": np.mean(consistency), "fluency": np.mean(fluency),
-             "relevance": np.mean(relevance), "overall": np.mean(overall)})
-        for i in range(len(output)):
-            results.append({"coherence": coherence[i], "consistency": consistency[i], "fluency": fluency[i],
-                            "relevance": relevance[i], "overall": overall[i]})
+    def calc_unieval(self, output, reference, source, dims=None):
+        unieval = self.get_metric("unieval").compute(output, reference, source, dims=dims)
+        # the evaluated dimensions followed by overall, in the order returned by the evaluator
+        keys = list(unieval[0].keys()) if unieval else []
+
+        results = [{key: np.mean([item[key] for item in unieval]) for key in keys}]
+        for item in unieval:
+            results.append({key: item[key] for key in keys})
         return results
 
     def calc_llm_evaluation(self, api_key, input_articles, predicted_summary):
+        from base.evaluation.metrics.gpt_eval import GPTEval
+
         eval_model = GPTEval(api_key)
         results = eval_model.evaluate(input_articles, predicted_summary)
 
@@ -109,36 +196,24 @@ class EvaluationHandler():
         relevance = [item["Relevance"] for item in results]
         consistency = [item["Consistency"] for item in results]
 
-        results.insert(0, {"Domain_Adaptation": np.mean(domain_adaptation), "Coherence": np.mean(coherence),
-                           "Fluency": np.mean(fluency), "Relevance": np.mean(relevance),
-                           "Consistency": np.mean(consistency)})
-        print(results)
+        # scores that could not be parsed are nan and left out of the totals
+        results.insert(0, {"Domain_Adaptation": np.nanmean(domain_adaptation), "Coherence": np.nanmean(coherence),
+                           "Fluency": np.nanmean(fluency), "Relevance": np.nanmean(relevance),
+                           "Consistency": np.nanmean(consistency)})
 
         return results
 
     def calc_factscore(self, input_articles, predicted_summaries, pm: CeleryProgressManager):
-        results = []
+        factscore = self.get_metric("factscore")
+        total_steps = len(predicted_summaries)
 
-        pm.update_phase('calculate_metrics_factscore', 1, total_steps=len(predicted_summaries) + 1)
-        overall_fact_score = self.factscore.compute(references=input_articles, predictions=predicted_summaries)
+        def update_progress(done, total):
+            pm.update_phase('calculate_metrics_factscore', done, total_steps=total)
 
-        # filter out atomic facts metadata
-        overall_fact_score.pop('decisions', None)
-        overall_fact_score.pop('wrong_facts', None)
-        overall_fact_score.pop('init_score', None)
-        overall_fact_score.pop('respond_ratio', None)
-        results.append(overall_fact_score)
+        pm.update_phase('calculate_metrics_factscore', 0, total_steps=total_steps)
+        # a single FactScorer pass yields the per summary scores, the total fact_score is derived from them
+        per_item, statistics = factscore.compute_batch(predictions=list(predicted_summaries),
+                                                       references=list(input_articles),
+                                                       progress_callback=update_progress)
 
-        # compute fact_score for each individual summary
-        for i, (article, summary) in enumerate(zip(input_articles, predicted_summaries)):
-            pm.update_phase('calculate_metrics_factscore', 2 + i, total_steps=len(predicted_summaries) + 1)
-
-            single_fact_score = self.factscore.compute(references=[article], predictions=[summary])
-            # filter out atomic facts metadata
-            single_fact_score.pop('decisions', None)
-            single_fact_score.pop('wrong_facts', None)
-            single_fact_score.pop('init_score', None)
-            single_fact_score.pop('respond_ratio', None)
-            results.append(single_fact_score)
-
-        return results
+        return [factscore.aggregate(statistics)] + per_item
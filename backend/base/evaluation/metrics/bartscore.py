@@ -9,6 +9,8 @@ import torch
 import torch.nn as nn
 from transformers import BartForConditionalGeneration, BartTokenizer
 
+from base.evaluation.batching import length_bucketed_batches, restore_order
+from base.evaluation.model_pool import model_pool
 from .metric import Metric
 
 logger = logging.getLogger(__name__)
@@ -48,16 +50,20 @@ class BartScore(Metric):
         """
         returns the the vanilla bart scorer
         """
-        bart_scorer = BARTScorer(device="cpu", checkpoint="facebook/bart-large")
-        return bart_scorer
+        return model_pool.get(
+            ("facebook/bart-large", "cpu"),
+            lambda: BARTScorer(device="cpu", checkpoint="facebook/bart-large"),
+        )
 
     @staticmethod
     def get_cnn_scorer():
         """
         returns the the cnn version of bart sore
         """
-        bart_scorer = BARTScorer(device="cpu", checkpoint="facebook/bart-large-cnn")
-        return bart_scorer
+        return model_pool.get(
+            ("facebook/bart-large-cnn", "cpu"),
+            lambda: BARTScorer(device="cpu", checkpoint="facebook/bart-large-cnn"),
+        )
 
     @staticmethod
     def get_para_scorer():
@@ -67,9 +73,13 @@ class BartScore(Metric):
         # for the parabank model, first init a bart model, then load the local para model from BARTScore/bart.pth
         #  See the documentation from https://github.com/neulab/BARTScore for reference
 
-        bart_scorer = BARTScorer(device="cpu", checkpoint="facebook/bart-large-cnn")
-        bart_scorer.load(path="metrics/BARTScore/bart.pth")
-        return bart_scorer
+        def load_para_scorer():
+            bart_scorer = BARTScorer(device="cpu", checkpoint="facebook/bart-large-cnn")
+            bart_scorer.load(path="metrics/BARTScore/bart.pth")
+            return bart_scorer
+
+        # the para weights differ from the cnn checkpoint they are loaded into, so they get their own pool entry
+        return model_pool.get(("facebook/bart-large-cnn", "cpu", "metrics/BARTScore/bart.pth"), load_para_scorer)
 
     def compute_bart_score(self, prediction, gold_labels, scorer):
         """
@@ -78,16 +88,15 @@ class BartScore(Metric):
 
         # num_gold_labels
         num_gold_labels = len(gold_labels)
-        print(num_gold_labels)
 
         # ref to hypo scores are the precision
         ref_hypo_scores = np.array(
-            scorer.score(gold_labels, prediction * num_gold_labels, batch_size=4)
+            scorer.score(gold_labels, prediction * num_gold_labels)
         )
 
         # hypo to ref scores are the recall
         hypo_ref_scores = np.array(
-            scorer.score(prediction * num_gold_labels, gold_labels, batch_size=4)
+            scorer.score(prediction * num_gold_labels, gold_labels)
         )
 
         # take max and average
@@ -97,24 +106,39 @@ class BartScore(Metric):
 
         return {"f_score": max_avg_f, "precision": ref_hypo, "recall": hypo_ref}
 
+    def compute_batched_bart_scores(self, predictions, references, scorer):
+        """
+        calculate the bart scores of all predictions at once. Both directions of every prediction-reference pair are
+        scored in a single scorer.score call, so the forward passes run in large length-bucketed batches.
+        A reference can be a string or a list of gold labels, the scores are the maxima over the gold labels as in
+        compute_bart_score.
+        """
+        # flatten to one (item, gold label) pair per row, items may have different numbers of gold labels
+        item_ids, hypos, golds = [], [], []
+        for i, (pred, ref) in enumerate(zip(predictions, references)):
+            gold_labels = [ref] if isinstance(ref, str) else list(ref)
+            item_ids += [i] * len(gold_labels)
+            hypos += [pred] * len(gold_labels)
+            golds += gold_labels
+
+        # ref to hypo scores are the precision, hypo to ref scores are the recall
+        scores = np.array(scorer.score(golds + hypos, hypos + golds))
+        ref_hypo_scores, hypo_ref_scores = scores[:len(golds)], scores[len(golds):]
+        avg_f_scores = 0.5 * (ref_hypo_scores + hypo_ref_scores)
+
+        item_ids = np.array(item_ids)
+        result = {"f_score": [], "precision": [], "recall": []}
+        for i in range(len(predictions)):
+            rows = item_ids == i
+            result["f_score"].append(avg_f_scores[rows].max())
+            result["precision"].append(ref_hypo_scores[rows].max())
+            result["recall"].append(hypo_ref_scores[rows].max())
+        return result
+
     def compute(self, predictions, references, scorer_str="cnn"):
         scorer = self.bart_scorers_initializers[scorer_str]()
 
-        result = {
-            "f_score": [],
-            "precision": [],
-            "recall": [],
-            "f_score_overall": None,
-            "precision_overall": None,
-            "recall_overall": None,
-        }
-
-        for pred, ref in zip(predictions, references):
-            result_value = self.compute_bart_score([pred], [ref], scorer)
-            result["f_score"].append(result_value["f_score"])
-            result["precision"].append(result_value["precision"])
-            result["recall"].append(result_value["recall"])
-
+        result = self.compute_batched_bart_scores(list(predictions), list(references), scorer)
         result["f_score_overall"] = np.mean(result["f_score"])
         result["precision_overall"] = np.mean(result["precision"])
         result["recall_overall"] = np.mean(result["recall"])
@@ -146,27 +170,28 @@ class BARTScorer:
             path = "models/bart.pth"
         self.model.load_state_dict(torch.load(path, map_location=self.device))
 
-    def score(self, srcs, tgts, batch_size=4):
-        """Score a batch of examples"""
-        score_list = []
-        for i in range(0, len(srcs), batch_size):
-            src_list = srcs[i : i + batch_size]
-            tgt_list = tgts[i : i + batch_size]
+    def score(self, srcs, tgts, batch_size=None, max_tokens=None):
+        """
+        Score a batch of examples.
+        Pairs are tokenized once and grouped by length into batches of at most max_tokens padded tokens,
+        batch_size optionally caps the number of pairs per batch. Scores are returned in input order.
+        """
+        encoded_srcs = self.tokenizer(srcs, max_length=self.max_length, truncation=True)["input_ids"]
+        encoded_tgts = self.tokenizer(tgts, max_length=self.max_length, truncation=True)["input_ids"]
+        lengths = [len(src) + len(tgt) for src, tgt in zip(encoded_srcs, encoded_tgts)]
+
+        batches = length_bucketed_batches(lengths, max_tokens=max_tokens, max_batch_size=batch_size)
+        batch_scores = []
+        for batch in batches:
+            src_list = [srcs[i] for i in batch]
+            tgt_list = [tgts[i] for i in batch]
             try:
                 with torch.no_grad():
-                    encoded_src = self.tokenizer(
-                        src_list,
-                        max_length=self.max_length,
-                        truncation=True,
-                        padding=True,
-                        return_tensors="pt",
+                    encoded_src = self.tokenizer.pad(
+                        {"input_ids": [encoded_srcs[i] for i in batch]}, return_tensors="pt"
                     )
-                    encoded_tgt = self.tokenizer(
-                        tgt_list,
-                        max_length=self.max_length,
-                        truncation=True,
-                        padding=True,
-                        return_tensors="pt",
+                    encoded_tgt = self.tokenizer.pad(
+                        {"input_ids": [encoded_tgts[i] for i in batch]}, return_tensors="pt"
                     )
                     src_tokens = encoded_src["input_ids"].to(self.device)
                     src_mask = encoded_src["attention_mask"].to(self.device)
@@ -182,17 +207,16 @@ class BARTScorer:
                     loss = self.loss_fct(self.lsm(logits), tgt_tokens.view(-1))
                     loss = loss.view(tgt_tokens.shape[0], -1)
                     loss = loss.sum(dim=1) / tgt_len
-                    curr_score_list = [-x.item() for x in loss]
-                    score_list += curr_score_list
+                    batch_scores.append([-x.item() for x in loss])
 
             except RuntimeError:
                 traceback.print_exc()
                 print(f"source: {src_list}")
                 print(f"target: {tgt_list}")
                 exit(0)
-        return score_list
+        return restore_order(batches, batch_scores)
 
-    def multi_ref_score(self, srcs, tgts: List[List[str]], agg="mean", batch_size=4):
+    def multi_ref_score(self, srcs, tgts: List[List[str]], agg="mean", batch_size=None):
         # Assert we have the same number of references
         ref_nums = [len(x) for x in tgts]
         if len(set(ref_nums)) > 1:
@@ -22,3 +22,17 @@ class BertScore(Metric):
         res['hashcode'] = hashcode
 
         return res
+
+    def compute_batch(self, predictions: list, references: list) -> tuple[list, list]:
+        # a single batched forward pass returns precision, recall and f1 arrays with one entry per pair
+        res = self.metric.compute(
+            predictions=predictions, references=references, lang="en"
+        )
+        res.pop('hashcode', None)
+        # the per-item results keep the shape compute() gives for a single pair, which is what was stored before:
+        # {"precision": float, "recall": float, "f1": float}, not the per-pair lists evaluate returns
+        per_item = [
+            {k: float(v[i]) for k, v in res.items()}
+            for i in range(len(predictions))
+        ]
+        return per_item, per_item
@@ -1,17 +1,101 @@
+import collections
+import math
+
 import evaluate
 import nltk
+from sacrebleu.tokenizers.tokenizer_13a import Tokenizer13a
 
 from .metric import Metric
 
 
 class Bleu(Metric):
     metric_name = "bleu"
+    max_order = 4
 
     def __init__(self) -> None:
         nltk.download("punkt", quiet=True)
         self.metric = evaluate.load(self.metric_name)
+        # the evaluate bleu module tokenizes with a copy of the sacrebleu 13a tokenizer, so the n-gram statistics
+        # match compute()
+        self.tokenizer = Tokenizer13a()
 
     def compute(self, predictions: list, references: list) -> dict:
         return self.metric.compute(
             predictions=predictions, references=references
         )
+
+    def compute_batch(self, predictions: list, references: list) -> tuple[list, list]:
+        """
+        Collects the n-gram statistics of every pair once. The per-item scores and the corpus score are both
+        derived from these statistics, the corpus score by summing them (see aggregate).
+        """
+        statistics = [self.ngram_statistics(pred, ref) for pred, ref in zip(predictions, references)]
+        per_item = [self.aggregate([stats]) for stats in statistics]
+        return per_item, statistics
+
+    def ngram_statistics(self, prediction: str, references) -> dict:
+        if isinstance(references, str):
+            references = [references]
+        translation = self.tokenizer(prediction)
+        references = [self.tokenizer(reference) for reference in references]
+
+        merged_ref_ngram_counts = collections.Counter()
+        for reference in references:
+            merged_ref_ngram_counts |= _get_ngrams(reference, self.max_order)
+        overlap = _get_ngrams(translation, self.max_order) & merged_ref_ngram_counts
+
+        matches_by_order = [0] * self.max_order
+        for ngram, count in overlap.items():
+            matches_by_order[len(ngram) - 1] += count
+        possible_matches_by_order = [max(len(translation) - order + 1, 0) for order in range(1, self.max_order + 1)]
+
+        return {
+            "matches_by_order": matches_by_order,
+            "possible_matches_by_order": possible_matches_by_order,
+            "translation_length": len(translation),
+            "reference_length": min(len(reference) for reference in references),
+        }
+
+    def aggregate(self, statistics: list) -> dict:
+        """
+        Computes BLEU from summed n-gram statistics, mirroring compute_bleu of the evaluate bleu module.
+        """
+        matches_by_order = [sum(stats["matches_by_order"][i] for stats in statistics) for i in range(self.max_order)]
+        possible_matches_by_order = [sum(stats["possible_matches_by_order"][i] for stats in statistics)
+                                     for i in range(self.max_order)]
+        translation_length = sum(stats["translation_length"] for stats in statistics)
+        reference_length = sum(stats["reference_length"] for stats in statistics)
+
+        precisions = [
+            matches / possible if possible > 0 else 0.0
+            for matches, possible in zip(matches_by_order, possible_matches_by_order)
+        ]
+        if min(precisions) > 0:
+            geo_mean = math.exp(sum((1.0 / self.max_order) * math.log(p) for p in precisions))
+        else:
+            geo_mean = 0
+
+        ratio = translation_length / reference_length if reference_length > 0 else 0.0
+        if ratio > 1.0:
+            brevity_penalty = 1.0
+        elif ratio > 0:
+            brevity_penalty = math.exp(1 - 1.0 / ratio)
+        else:
+            brevity_penalty = 0.0
+
+        return {
+            "bleu": geo_mean * brevity_penalty,
+            "precisions": precisions,
+            "brevity_penalty": brevity_penalty,
+            "length_ratio": ratio,
+            "translation_length": translation_length,
+            "reference_length": reference_length,
+        }
+
+
+def _get_ngrams(segment, max_order):
+    ngram_counts = collections.Counter()
+    for order in range(1, max_order + 1):
+        for i in range(0, len(segment) - order + 1):
+            ngram_counts[tuple(segment[i:i + order])] += 1
+    return ngram_counts
@@ -2,6 +2,7 @@ import json
 import os
 import re
 import string
+import threading
 
 import nltk
 import numpy as np
@@ -12,11 +13,10 @@ from dotenv import load_dotenv, dotenv_values
 
 from .openai_lm import OpenAIModel
 
-nltk.download("punkt")
-
 
 class AtomicFactGenerator(object):
     def __init__(self, openai_key, demon_dir, gpt3_cache_file=None):
+        nltk.download("punkt", quiet=True)
         self.nlp = spacy.load("en_core_web_sm")
         self.is_bio = True
         self.demon_path = os.path.join(
@@ -47,52 +47,25 @@ class AtomicFactGenerator(object):
             paragraphs, cost_estimate=cost_estimate
         )
 
-    def get_atomic_facts_from_paragraph(self, paragraphs, cost_estimate=None):
-        sentences = []
-        para_breaks = []
-        for para_idx, paragraph in enumerate(paragraphs):
-            if para_idx > 0:
-                para_breaks.append(len(sentences))
-
-            initials = detect_initials(paragraph)
-
-            curr_sentences = sent_tokenize(paragraph)
-            curr_sentences_2 = sent_tokenize(paragraph)
-
-            curr_sentences = fix_sentence_splitter(curr_sentences, initials)
-            curr_sentences_2 = fix_sentence_splitter(curr_sentences_2, initials)
-
-            # checking this, just to ensure the crediability of the sentence splitter fixing algorithm
-            assert curr_sentences == curr_sentences_2, (
-                paragraph,
-                curr_sentences,
-                curr_sentences_2,
-            )
+    def prefetch(self, generations):
+        """
+        Send the atomic fact prompts of all generations concurrently, so that the following run calls are
+        answered from the cache.
+        """
+        prompts = []
+        for generation in generations:
+            paragraphs = [
+                para.strip() for para in generation.split("\n") if len(para.strip()) > 0
+            ]
+            sentences, _ = self.split_sentences(paragraphs)
+            prompts += self.get_prompts(self.sentences_to_atomize(sentences))[0]
+        self.openai_lm.generate_batch(prompts)
 
-            sentences += curr_sentences
+    def get_atomic_facts_from_paragraph(self, paragraphs, cost_estimate=None):
+        sentences, para_breaks = self.split_sentences(paragraphs)
 
         atoms_or_estimate = self.get_init_atomic_facts_from_sentence(
-            [
-                sent
-                for i, sent in enumerate(sentences)
-                if not (
-                    not self.is_bio
-                    and (
-                        (
-                            i == 0
-                            and (sent.startswith("Sure") or sent.startswith("Here are"))
-                        )
-                        or (
-                            i == len(sentences) - 1
-                            and (
-                                sent.startswith("Please")
-                                or sent.startswith("I hope")
-                                or sent.startswith("Here are")
-                            )
-                        )
-                    )
-                )
-            ],
+            self.sentences_to_atomize(sentences),
             cost_estimate=cost_estimate,
         )
 
@@ -139,8 +112,57 @@ class AtomicFactGenerator(object):
 
         return atomic_facts_pairs, para_breaks
 
-    def get_init_atomic_facts_from_sentence(self, sentences, cost_estimate=None):
-        """Get the initial atomic facts from the sentences. Return a total words cost if cost_estimate != None."""
+    def split_sentences(self, paragraphs):
+        sentences = []
+        para_breaks = []
+        for para_idx, paragraph in enumerate(paragraphs):
+            if para_idx > 0:
+                para_breaks.append(len(sentences))
+
+            initials = detect_initials(paragraph)
+
+            curr_sentences = sent_tokenize(paragraph)
+            curr_sentences_2 = sent_tokenize(paragraph)
+
+            curr_sentences = fix_sentence_splitter(curr_sentences, initials)
+            curr_sentences_2 = fix_sentence_splitter(curr_sentences_2, initials)
+
+            # checking this, just to ensure the crediability of the sentence splitter fixing algorithm
+            assert curr_sentences == curr_sentences_2, (
+                paragraph,
+                curr_sentences,
+                curr_sentences_2,
+            )
+
+            sentences += curr_sentences
+
+        return sentences, para_breaks
+
+    def sentences_to_atomize(self, sentences):
+        return [
+            sent
+            for i, sent in enumerate(sentences)
+            if not (
+                not self.is_bio
+                and (
+                    (
+                        i == 0
+                        and (sent.startswith("Sure") or sent.startswith("Here are"))
+                    )
+                    or (
+                        i == len(sentences) - 1
+                        and (
+                            sent.startswith("Please")
+                            or sent.startswith("I hope")
+                            or sent.startswith("Here are")
+                        )
+                    )
+                )
+            )
+        ]
+
+    def get_prompts(self, sentences):
+        """Build the few-shot prompt of every sentence. Returns the prompts and a prompt to sentence mapping."""
 
         is_bio = self.is_bio
         demons = self.demons
@@ -150,10 +172,7 @@ class AtomicFactGenerator(object):
 
         prompts = []
         prompt_to_sent = {}
-        atoms = {}
         for sentence in sentences:
-            if sentence in atoms:
-                continue
             top_machings = best_demos(sentence, self.bm25, list(demons.keys()), k)
             prompt = ""
 
@@ -187,22 +206,31 @@ class AtomicFactGenerator(object):
             prompts.append(prompt)
             prompt_to_sent[prompt] = sentence
 
+        return prompts, prompt_to_sent
+
+    def get_init_atomic_facts_from_sentence(self, sentences, cost_estimate=None):
+        """Get the initial atomic facts from the sentences. Return a total words cost if cost_estimate != None."""
+
+        prompts, prompt_to_sent = self.get_prompts(sentences)
+        atoms = {}
+
         if cost_estimate:
             total_words_estimate = 0
             for prompt in prompts:
                 if (
                     cost_estimate == "consider_cache"
-                    and (prompt.strip() + "_0") in self.openai_lm.cache_dict
+                    and self.openai_lm.in_cache(prompt)
                 ):
                     continue
                 total_words_estimate += len(prompt.split())
             return total_words_estimate
         else:
-            for prompt in prompts:
-                output, _ = self.openai_lm.generate(prompt)
+            # the prompts of all sentences are independent and sent concurrently
+            outputs = self.openai_lm.generate_batch(prompts)
+            for prompt, (output, _) in zip(prompts, outputs):
                 atoms[prompt_to_sent[prompt]] = text_to_sentences(output)
 
-            for key, value in demons.items():
+            for key, value in self.demons.items():
                 if key not in atoms:
                     atoms[key] = value
 
@@ -458,23 +486,44 @@ def fix_sentence_splitter(curr_sentences, initials):
     return sentences
 
 
-def get_atomic_facts_for_paragraph(paragraph: str):
-    working_dir = os.path.dirname(os.path.realpath(__file__))
-    factscore_cache_dir = os.path.join(working_dir, ".cache/factscore")
-    factscore_demos_dir = os.path.join(factscore_cache_dir, "demos")
+_atomic_fact_generator = None
+_atomic_fact_generator_lock = threading.Lock()
+
 
-    # get openai key from relative path
-    base_dir = os.path.abspath(os.path.join(working_dir, "../../../.."))  # Go 4 levels up
-    env_path = os.path.join(base_dir, "summeval/.env")
+def get_atomic_fact_generator() -> AtomicFactGenerator:
+    """
+    Returns the AtomicFactGenerator of this process, built on first use so the spaCy model, the BM25 demos
+    and the response cache are not reloaded for every paragraph. The generator is built under a lock, as thread pool
+    workers call this concurrently.
+    """
+    global _atomic_fact_generator
+    if _atomic_fact_generator is not None:
+        return _atomic_fact_generator
+    with _atomic_fact_generator_lock:
+        if _atomic_fact_generator is not None:
+            return _atomic_fact_generator
+        working_dir = os.path.dirname(os.path.realpath(__file__))
+        factscore_cache_dir = os.path.join(working_dir, ".cache/factscore")
+        factscore_demos_dir = os.path.join(factscore_cache_dir, "demos")
 
-    load_dotenv(dotenv_path=env_path)
-    dotenv_values(dotenv_path=env_path)
+        # get openai key from relative path
+        base_dir = os.path.abspath(os.path.join(working_dir, "../../../.."))  # Go 4 levels up
+        env_path = os.path.join(base_dir, "summeval/.env")
 
-    api_key = os.getenv("OPENAI_API_KEY")
+        load_dotenv(dotenv_path=env_path)
+        dotenv_values(dotenv_path=env_path)
 
-    generator = AtomicFactGenerator(openai_key=api_key,
-                                    demon_dir=factscore_demos_dir,
-                                    gpt3_cache_file=os.path.join(factscore_cache_dir, "GPT4o-mini.pkl"))
+        api_key = os.getenv("OPENAI_API_KEY")
+
+        _atomic_fact_generator = AtomicFactGenerator(openai_key=api_key,
+                                                     demon_dir=factscore_demos_dir,
+                                                     gpt3_cache_file=os.path.join(factscore_cache_dir,
+                                                                                  "GPT4o-mini.sqlite"))
+    return _atomic_fact_generator
+
+
+def get_atomic_facts_for_paragraph(paragraph: str):
+    generator = get_atomic_fact_generator()
     atomic_facts, paragraph_breaks = generator.run(generation=paragraph)
     generator.save_cache()
 
@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import string
+import threading
 from typing import List
 
 import numpy as np
@@ -54,24 +55,37 @@ class FactScorer(object):
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir)
 
+        # the scorer is shared by all threads of a worker, the generator is built once under this lock
         self.af_generator = None
+        self._af_generator_lock = threading.Lock()
         self.cost_estimate = cost_estimate
 
         if "llama" in model_name:
             self.lm = CLM(
                 "inst-llama-7B",
                 model_dir=os.path.join(model_dir, "inst-llama-7B"),
-                cache_file=os.path.join(cache_dir, "inst-llama-7B.pkl"),
+                cache_file=os.path.join(cache_dir, "inst-llama-7B.sqlite"),
             )
         elif "GPT-4" in model_name.upper():
             self.lm = OpenAIModel(
                 "gpt-4o-mini",
-                cache_file=os.path.join(cache_dir, "GPT4o-mini.pkl"),
+                cache_file=os.path.join(cache_dir, "GPT4o-mini.sqlite"),
                 openai_key=openai_key,
             )
         else:
             self.lm = None
 
+    def get_af_generator(self):
+        if self.af_generator is None:
+            with self._af_generator_lock:
+                if self.af_generator is None:
+                    self.af_generator = AtomicFactGenerator(
+                        openai_key=self.openai_key,
+                        demon_dir=os.path.join(self.data_dir, "demos"),
+                        gpt3_cache_file=os.path.join(self.cache_dir, "GPT4o-mini.sqlite"),
+                    )
+        return self.af_generator
+
     def save_cache(self):
         if self.lm:
             self.lm.save_cache()
@@ -104,7 +118,7 @@ class FactScorer(object):
             self.npm[name] = NPM(
                 Retrieval(self.db[name], cache_path, embed_cache_path, "bm25"),
                 "npm-single",
-                cache_file=os.path.join(self.cache_dir, f"npm-{name}.pkl"),
+                cache_file=os.path.join(self.cache_dir, f"npm-{name}.sqlite"),
             )
 
     def print_cost_estimates(self, total_words, task, model):
@@ -139,7 +153,15 @@ class FactScorer(object):
             knowledge_source=None,
             verbose=False,
             grounding_provided=False,
+            progress_callback=None,
     ):
+        """
+        Scores all generations in one pass.
+
+        Besides the corpus level results, `summary_scores` holds the (length penalized) score of every generation in
+        input order, or None if the generation was abstained or has no atomic facts. `progress_callback` is called
+        with (done, total) after each scored generation.
+        """
         if knowledge_source is None:
             # use the default knowledge source
             knowledge_source = "enwiki-20230401"
@@ -163,12 +185,7 @@ class FactScorer(object):
                 atomic_facts
             ), "`topics` and `atomic_facts` should have the same length"
         else:
-            if self.af_generator is None:
-                self.af_generator = AtomicFactGenerator(
-                    openai_key=self.openai_key,
-                    demon_dir=os.path.join(self.data_dir, "demos"),
-                    gpt3_cache_file=os.path.join(self.cache_dir, "GPT4o-mini.pkl"),
-                )
+            self.get_af_generator()
 
             # estimate the total cost of atomic fact generation
             total_words = 0
@@ -182,8 +199,13 @@ class FactScorer(object):
             if verbose:
                 topics = tqdm(topics)
 
+            # send the prompts of all generations concurrently, the loop below is then answered from the cache
+            self.af_generator.prefetch(
+                [gen for gen in generations if not is_response_abstained(gen, self.abstain_detection_type)]
+            )
+
             atomic_facts = []
-            print(f"Generating Atomic Facts for {len(generations)} generations")
+            logging.info(f"Generating Atomic Facts for {len(generations)} generations")
             for topic, gen in tqdm(zip(topics, generations), total=len(generations)):
                 # optionally, first detect if the response is abstained
                 response_abstained = is_response_abstained(
@@ -230,18 +252,33 @@ class FactScorer(object):
         if verbose:
             topics = tqdm(topics)
 
+        if isinstance(self.lm, OpenAIModel):
+            # verify the atomic facts of all generations concurrently, the loop below is then answered from the cache
+            prompts = []
+            for topic, generation, facts, grounding in zip(topics, generations, atomic_facts, groundings):
+                if facts is not None:
+                    prompts += [
+                        prompt for _, _, prompt, _ in self._get_prompts(
+                            topic, generation, facts, knowledge_source, grounding=grounding,
+                            grounding_provided=grounding_provided,
+                        )
+                    ]
+            self.lm.generate_batch(prompts)
+
         scores = []
         init_scores = []
         decisions = []
         wrong_facts = []
+        summary_scores = []
 
-        print("Getting score from FS.")
-        for topic, generation, facts, grounding in tqdm(
+        logging.info("Getting score from FS.")
+        for i, (topic, generation, facts, grounding) in enumerate(tqdm(
                 zip(topics, generations, atomic_facts, groundings), total=len(generations)
-        ):
+        )):
             # print (f"Running for the follow facts. {facts}")
             if facts is None:
                 decisions.append(None)
+                summary_scores.append(None)
             else:
                 decision = self._get_score(
                     topic,
@@ -267,14 +304,19 @@ class FactScorer(object):
 
                 decisions.append(decision)
                 scores.append(score)
+                summary_scores.append(score)
                 wrong_facts.append(wrong_fact)
                 if len(scores) % 10 == 0:
                     self.save_cache()
 
+            if progress_callback is not None:
+                progress_callback(i + 1, len(generations))
+
         self.save_cache()
 
         out = {
             "score": np.mean(scores),
+            "summary_scores": summary_scores,
             "respond_ratio": respond_ratio,
             "decisions": decisions,
             "wrong_facts": wrong_facts,
@@ -400,7 +442,7 @@ class FactScorer(object):
 
         self.save_cache()
 
-        self.extrinsic_out = {
+        extrinsic_out = {
             "score": np.mean(scores),
             # "respond_ratio": respond_ratio,
             "decisions": decisions,
@@ -415,7 +457,7 @@ class FactScorer(object):
                 extrinsic_facts
             )
         )
-        return self.extrinsic_out
+        return extrinsic_out
 
     def search_passage_till_success(
             self, topic, atom, generation, knowledge_source
@@ -456,7 +498,7 @@ class FactScorer(object):
                     idx += 1
         return passages
 
-    def _get_score(
+    def _get_prompts(
             self,
             topic,
             generation,
@@ -464,12 +506,14 @@ class FactScorer(object):
             knowledge_source,
             grounding=None,
             grounding_provided=False,
-            cost_estimate=None,
             check_extrinsic=False,
             get_topic_per_af=False,
     ):
-        decisions = []
-        total_words = 0
+        """
+        Builds the verification prompt of every atomic fact.
+        Returns a list of (atom, idx, prompt, context) tuples, prompt and context are None if no lm is used.
+        """
+        prompts = []
         passages = None
         for atomic_fact in atomic_facts:
             if not isinstance(atomic_fact, str):
@@ -479,106 +523,106 @@ class FactScorer(object):
                 atom = atomic_fact
                 idx = None
             atom = atom.strip()
-            if self.lm:
-                if grounding_provided:
-                    if isinstance(grounding, str):
-                        grounding = [grounding]
-                    passages = [
-                        {"title": "Article", "text": ground} for ground in grounding
-                    ]
-                elif get_topic_per_af:
-                    # passing empty topic would force the retriever the get a llm generated topic
+            if not self.lm:
+                prompts.append((atom, idx, None, None))
+                continue
+
+            if grounding_provided:
+                if isinstance(grounding, str):
+                    grounding = [grounding]
+                passages = [
+                    {"title": "Article", "text": ground} for ground in grounding
+                ]
+            elif get_topic_per_af:
+                # passing empty topic would force the retriever the get a llm generated topic
+                passages = self.search_passage_till_success(
+                    topic="",
+                    atom=atom,
+                    generation=atom,
+                    knowledge_source=knowledge_source,
+                )
+            else:
+                if passages is None:
                     passages = self.search_passage_till_success(
-                        topic="",
-                        atom=atom,
-                        generation=atom,
-                        knowledge_source=knowledge_source,
+                        topic, atom, generation, knowledge_source
                     )
-                else:
-                    if passages is None:
-                        passages = self.search_passage_till_success(
-                            topic, atom, generation, knowledge_source
-                        )
 
-                if check_extrinsic:
-                    definition = "Does the provided text contain any information related to the Input statement?.\n\n"
-                else:
-                    definition = "Answer the question about {} based on the given context.\n\n".format(
-                        topic
-                    )
+            if check_extrinsic:
+                definition = "Does the provided text contain any information related to the Input statement?.\n\n"
+            else:
+                definition = "Answer the question about {} based on the given context.\n\n".format(
+                    topic
+                )
 
-                context = ""
-                for psg_idx, psg in enumerate(reversed(passages)):
-                    context += "Title: {}\nText: {}\n\n".format(
-                        psg["title"], psg["text"].replace("<s>", "").replace("</s>", "")
-                    )
-                definition += context.strip()
-                if definition[-1] not in string.punctuation:
-                    definition += "."
-
-                if check_extrinsic:
-                    definition.replace("Title: Article", "")
-                    prompt = "{}\n\nInput: {} \n This statement is discussed in the above provided text. True or False?\nOutput:".format(
-                        definition.strip(), atom.strip()
-                    )
-                else:
-                    prompt = "{}\n\nInput: {} True or False?\nOutput:".format(
-                        definition.strip(), atom.strip()
-                    )
+            context = ""
+            for psg_idx, psg in enumerate(reversed(passages)):
+                context += "Title: {}\nText: {}\n\n".format(
+                    psg["title"], psg["text"].replace("<s>", "").replace("</s>", "")
+                )
+            definition += context.strip()
+            if definition[-1] not in string.punctuation:
+                definition += "."
+
+            if check_extrinsic:
+                definition.replace("Title: Article", "")
+                prompt = "{}\n\nInput: {} \n This statement is discussed in the above provided text. True or False?\nOutput:".format(
+                    definition.strip(), atom.strip()
+                )
+            else:
+                prompt = "{}\n\nInput: {} True or False?\nOutput:".format(
+                    definition.strip(), atom.strip()
+                )
+            prompts.append((atom, idx, prompt, context))
 
-                if cost_estimate:
-                    if (
-                            cost_estimate == "consider_cache"
-                            and (prompt.strip() + "_0") not in self.lm.cache_dict
-                    ):
-                        total_words += len(prompt.split())
-                    elif cost_estimate == "ignore_cache":
-                        total_words += len(prompt.split())
-                    continue
+        return prompts
+
+    def _get_score(
+            self,
+            topic,
+            generation,
+            atomic_facts,
+            knowledge_source,
+            grounding=None,
+            grounding_provided=False,
+            cost_estimate=None,
+            check_extrinsic=False,
+            get_topic_per_af=False,
+    ):
+        prompts = self._get_prompts(
+            topic,
+            generation,
+            atomic_facts,
+            knowledge_source,
+            grounding=grounding,
+            grounding_provided=grounding_provided,
+            check_extrinsic=check_extrinsic,
+            get_topic_per_af=get_topic_per_af,
+        )
 
-                output = self.lm.generate(prompt)
+        if cost_estimate:
+            total_words = 0
+            for _, _, prompt, _ in prompts:
+                if prompt is None:
+                    continue
+                if (
+                        cost_estimate == "consider_cache"
+                        and not self.lm.in_cache(prompt)
+                ):
+                    total_words += len(prompt.split())
+                elif cost_estimate == "ignore_cache":
+                    total_words += len(prompt.split())
+            return total_words
 
-                if type(output[1]) == np.ndarray:
-                    # when logits are available
-                    logits = np.array(output[1])
-                    assert logits.shape[0] in [32000, 32001]
-                    true_score = logits[5852]
-                    false_score = logits[7700]
-                    is_supported = true_score > false_score
-                else:
-                    # when logits are unavailable
-                    generated_answer = output[0].lower()
-                    if "true" in generated_answer or "false" in generated_answer:
-                        if (
-                                "true" in generated_answer
-                                and "false" not in generated_answer
-                        ):
-                            is_supported = True
-                        elif (
-                                "false" in generated_answer
-                                and "true" not in generated_answer
-                        ):
-                            is_supported = False
-                        else:
-                            is_supported = generated_answer.index(
-                                "true"
-                            ) > generated_answer.index("false")
-                    else:
-                        is_supported = all(
-                            [
-                                keyword
-                                not in generated_answer.lower()
-                                .translate(str.maketrans("", "", string.punctuation))
-                                .split()
-                                for keyword in [
-                                "not",
-                                "cannot",
-                                "unknown",
-                                "information",
-                            ]
-                            ]
-                        )
+        if self.lm:
+            # the atomic facts are verified independently, so their prompts are sent as one concurrent batch
+            outputs = self.lm.generate_batch([prompt for _, _, prompt, _ in prompts])
+        else:
+            outputs = [None] * len(prompts)
 
+        decisions = []
+        for (atom, idx, prompt, context), output in zip(prompts, outputs):
+            if output is not None:
+                is_supported = self._is_supported(output)
             else:
                 is_supported = True
 
@@ -595,93 +639,120 @@ class FactScorer(object):
                 }
             )
 
-        if cost_estimate:
-            return total_words
+        return decisions
+
+    @staticmethod
+    def _is_supported(output):
+        if type(output[1]) == np.ndarray:
+            # when logits are available
+            logits = np.array(output[1])
+            assert logits.shape[0] in [32000, 32001]
+            true_score = logits[5852]
+            false_score = logits[7700]
+            return true_score > false_score
+
+        # when logits are unavailable
+        generated_answer = output[0].lower()
+        if "true" in generated_answer or "false" in generated_answer:
+            if (
+                    "true" in generated_answer
+                    and "false" not in generated_answer
+            ):
+                return True
+            elif (
+                    "false" in generated_answer
+                    and "true" not in generated_answer
+            ):
+                return False
+            else:
+                return generated_answer.index(
+                    "true"
+                ) > generated_answer.index("false")
         else:
-            return decisions
+            return all(
+                [
+                    keyword
+                    not in generated_answer.lower()
+                    .translate(str.maketrans("", "", string.punctuation))
+                    .split()
+                    for keyword in [
+                    "not",
+                    "cannot",
+                    "unknown",
+                    "information",
+                ]
+                ]
+            )
+
+
+_fact_scorer = None
+_fact_scorer_lock = threading.Lock()
+
+
+def get_fact_scorer() -> FactScorer:
+    """
+    Returns the FactScorer of this process. It is built on first use and reused afterwards, so the api key, the
+    spaCy model, the BM25 demos and the response cache are only loaded once per worker. Thread pool workers call
+    this concurrently, so the scorer is built under a lock.
+    """
+    global _fact_scorer
+    if _fact_scorer is not None:
+        return _fact_scorer
+    with _fact_scorer_lock:
+        if _fact_scorer is not None:
+            return _fact_scorer
+        working_dir = os.path.dirname(os.path.realpath(__file__))
+        factscore_cache_dir = os.path.join(working_dir, ".cache/factscore")
+
+        # get openai key from relative path
+        base_dir = os.path.abspath(os.path.join(working_dir, "../../../.."))  # Go 4 levels up
+        env_path = os.path.join(base_dir, "summeval/.env")
+
+        load_dotenv(dotenv_path=env_path)
+        dotenv_values(dotenv_path=env_path)
 
+        api_key = os.getenv("OPENAI_API_KEY")
 
-def get_factscore_for_summaries(input_articles: list, predicted_summaries: list) -> dict:
+        _fact_scorer = FactScorer(
+            model_name="gpt-4o-mini",
+            data_dir=factscore_cache_dir,
+            model_dir=factscore_cache_dir,
+            cache_dir=factscore_cache_dir,
+            openai_key=api_key,
+            grounding_provided=True,
+            abstain_detection_type=None,
+        )
+    return _fact_scorer
+
+
+def get_factscore_for_summaries(input_articles: list, predicted_summaries: list, progress_callback=None) -> dict:
     """
     Calculates the factscore for the corresponding input_articles and their predicted_summaries
 
     @param input_articles: full-text articles
     @param predicted_summaries: summaries predicted by llm
+    @param progress_callback: optional callable, called with (done, total) after each scored summary
     @return:
     """
-    fs_result = _get_factscore_for_summary(input_articles, predicted_summaries)
+    fs_result = _get_factscore_for_summary(input_articles, predicted_summaries, progress_callback)
 
     return fs_result
 
 
-def _get_factscore_for_summary(input_articles: list[str], summaries: list[str]) -> dict:
-    fs_temp_view = {}
-
-    # construct input parameters for FactScore
-    working_dir = os.path.dirname(os.path.realpath(__file__))
-    factscore_cache_dir = os.path.join(working_dir, ".cache/factscore")
-    data_dir = os.path.join(working_dir, "data")
-
-    # get openai key from relative path
-    base_dir = os.path.abspath(os.path.join(working_dir, "../../../.."))  # Go 4 levels up
-    env_path = os.path.join(base_dir, "summeval/.env")
-
-    load_dotenv(dotenv_path=env_path)
-    dotenv_values(dotenv_path=env_path)
-
-    api_key = os.getenv("OPENAI_API_KEY")
-
+def _get_factscore_for_summary(input_articles: list[str], summaries: list[str], progress_callback=None) -> dict:
     # In order to not break api, have an empty topic for each summary, since they are not used in our project
     topics = ['' for _ in range(len(summaries))]
-    fs_temp_view['topics'] = topics
-
-    # generations == summary
-    generations = summaries
-    fs_temp_view['generations'] = generations
-
-    # groundings == input_articles
-    groundings = input_articles
-    fs_temp_view['groundings'] = groundings
-
-    grounding_provided = True
-    fs_temp_view['grounding_provided'] = grounding_provided
-
-    # gamma: hyperparameter for length penalty
-    gamma = 10
-    fs_temp_view['gamma'] = gamma
-
-    # set atomic facts to None to auto-generate them
-    initial_atomic_facts = None
-    fs_temp_view['initial_atomic_facts'] = initial_atomic_facts
-
-    args = {
-        'model_name': 'gpt-4o-mini',
-        'data_dir': data_dir,
-        'factscore_cache_dir': factscore_cache_dir,
-        'api_key': api_key,
-        'grounding_provided': grounding_provided,
-        'abstain_detection_type': None,
-    }
-    fs_temp_view['args'] = args
-
-    fs = FactScorer(
-        model_name=args["model_name"],
-        data_dir=args["factscore_cache_dir"],
-        model_dir=args["factscore_cache_dir"],
-        cache_dir=args["factscore_cache_dir"],
-        openai_key=args['api_key'],
-        grounding_provided=args['grounding_provided'],
-        abstain_detection_type=args['abstain_detection_type'],
-    )
 
-    output = fs.get_score(
+    # generations == summary, groundings == input_articles
+    output = get_fact_scorer().get_score(
         topics=topics,
-        generations=generations,
-        groundings=groundings,
-        atomic_facts=initial_atomic_facts,
-        gamma=gamma,
+        generations=list(summaries),
+        groundings=list(input_articles),
+        atomic_facts=None,  # auto-generate the atomic facts
+        gamma=10,  # hyperparameter for length penalty
         verbose=True,
-        grounding_provided=grounding_provided,
+        grounding_provided=True,
+        progress_callback=progress_callback,
     )
 
     return output
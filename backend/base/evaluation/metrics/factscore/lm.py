@@ -1,6 +1,9 @@
-import pickle
+import argparse
 import os
-import time
+import pickle
+
+from base.evaluation.response_cache import ResponseCache
+
 
 class LM(object):
 
@@ -14,12 +17,20 @@ class LM(object):
         # load the model and put it as self.model
         raise NotImplementedError()
 
+    def cache_key(self, prompt, sample_idx=0):
+        # responses depend on the model and the sampling temperature, not only on the prompt
+        return self.model_name, prompt.strip(), sample_idx, getattr(self, "temp", None)
+
+    def in_cache(self, prompt, sample_idx=0):
+        return self.cache_key(prompt, sample_idx) in self.cache_dict
+
     def generate(self, prompt, sample_idx=0, max_sequence_length=2048, max_output_length=128):
         prompt = prompt.strip() # it's important not to end with a whitespace
-        cache_key = f"{prompt}_{sample_idx}"
+        cache_key = self.cache_key(prompt, sample_idx)
 
-        if cache_key in self.cache_dict:
-            return self.cache_dict[cache_key]
+        cached = self.cache_dict.get(cache_key)
+        if cached is not None:
+            return cached
 
         if self.model is None:
             self.load_model()
@@ -33,33 +44,58 @@ class LM(object):
         self.add_n += 1
         return generated
 
+    def generate_batch(self, prompts, sample_idx=0, max_sequence_length=2048, max_output_length=128):
+        """Generate a response for every prompt, in input order. Subclasses may send the prompts concurrently."""
+        return [
+            self.generate(prompt, sample_idx=sample_idx, max_sequence_length=max_sequence_length,
+                          max_output_length=max_output_length)
+            for prompt in prompts
+        ]
+
     def save_cache(self):
-        if self.add_n == 0:
-            return
-
-        # load the latest cache first, since if there were other processes running in parallel,
-        # cache might have been updated
-        for k, v in self.load_cache().items():
-            self.cache_dict[k] = v
-
-        with open(self.cache_file, "wb") as f:
-            pickle.dump(self.cache_dict, f)
-
-    def load_cache(self, allow_retry=True):
-        if os.path.exists(self.cache_file):
-            while True:
-                try:
-                    with open(self.cache_file, "rb") as f:
-                        cache = pickle.load(f)
-                    break
-                except Exception:
-                    if not allow_retry:
-                        assert False
-                    print("Pickle Error: Retry in 5sec...")
-                    time.sleep(5)        
-        else:
-            cache = {}
-        return cache
+        # entries are persisted as soon as they are added to the cache, nothing is left to write here
+        pass
+
+    def load_cache(self):
+        return ResponseCache(self.cache_file)
+
+
+def migrate_pickle_cache(pickle_file, cache_file, model_name=None, temperature=None):
+    """
+    Copies a legacy pickle cache into a ResponseCache.
+
+    Entries of LM response caches are keyed by "{prompt}_{sample_idx}". When model_name is given, these keys are
+    converted to the (model, prompt, sample_idx, temperature) keys used by LM.cache_key. Otherwise (e.g. for NPM
+    caches) the keys are copied unchanged.
+    """
+    with open(pickle_file, "rb") as f:
+        legacy_cache = pickle.load(f)
+
+    def convert_key(key):
+        if model_name is None:
+            return key
+        prompt, sample_idx = key.rsplit("_", 1)
+        return model_name, prompt.strip(), int(sample_idx), temperature
+
+    cache = ResponseCache(cache_file)
+    cache.update((convert_key(key), value) for key, value in legacy_cache.items())
+    count = len(cache)
+    cache.close()
+    return count
+
 
+if __name__ == "__main__":
+    # e.g. python -m base.evaluation.metrics.factscore.lm .cache/factscore/GPT4o-mini.pkl \
+    #   .cache/factscore/GPT4o-mini.sqlite --model-name gpt-4o-mini --temperature 0.7
+    parser = argparse.ArgumentParser(description="Migrate a pickle response cache to the SQLite cache.")
+    parser.add_argument("pickle_file")
+    parser.add_argument("cache_file")
+    parser.add_argument("--model-name", default=None)
+    parser.add_argument("--temperature", type=float, default=None)
+    args = parser.parse_args()
 
+    if not os.path.exists(args.pickle_file):
+        raise SystemExit(f"{args.pickle_file} does not exist")
 
+    n_entries = migrate_pickle_cache(args.pickle_file, args.cache_file, args.model_name, args.temperature)
+    print(f"{args.cache_file} now holds {n_entries} entries")
@@ -6,17 +6,24 @@ import time
 import numpy as np
 from openai import BadRequestError, OpenAI
 
+from base.evaluation.request_engine import RequestEngine, retry_after_seconds
 from .lm import LM
 
 
 class OpenAIModel(LM):
-    def __init__(self, model_name, cache_file=None, openai_key="api.key"):
+    def __init__(self, model_name, cache_file=None, openai_key="api.key", max_in_flight=None,
+                 requests_per_minute=None):
 
         self.model_name = model_name
         self.openai_key = openai_key
         self.client = None  # Initialized with load_model() method
         self.temp = 0.7
-        self.save_interval = 100
+        # prompts of generate_batch are sent concurrently, limited by the number of requests in flight and a
+        # token bucket shared by all requests of this model
+        self.engine = RequestEngine(
+            max_in_flight=max_in_flight or int(os.getenv("OPENAI_MAX_IN_FLIGHT", 8)),
+            requests_per_minute=requests_per_minute or float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500)),
+        )
         super().__init__(cache_file)
 
     def load_model(self):
@@ -25,8 +32,9 @@ class OpenAIModel(LM):
         self.model = self.model_name
 
     def _generate(self, prompt, max_sequence_length=16384, max_output_length=128):
-        if self.add_n % self.save_interval == 0:
-            self.save_cache()
+        return self._request(prompt, max_sequence_length=max_sequence_length)
+
+    def _request(self, prompt, max_sequence_length=16384):
         # return a tuple of string (generated text) and metadata (any format)
         # This should be about generating a response from the prompt, no matter what the application is
         if self.model_name == "ChatGPT":
@@ -34,20 +42,43 @@ class OpenAIModel(LM):
             message = [{"role": "user", "content": prompt}]
             # Call API
             response = call_ChatGPT(
-                message, self.client, temp=self.temp, max_len=max_sequence_length
+                message, self.client, temp=self.temp, max_len=max_sequence_length, engine=self.engine
             )
             # Get the output from the response
             output = response.choices[0].message.content.strip()
             return output, response
         elif self.model_name == "gpt-4o-mini":
             # Call API
-            response = call_GPT4(prompt, self.client, temp=self.temp)
+            response = call_GPT4(prompt, self.client, temp=self.temp, engine=self.engine)
             # Get the output from the response
             output = response.choices[0].message.content
             return output, response
         else:
             raise NotImplementedError()
 
+    def generate_batch(self, prompts, sample_idx=0, max_sequence_length=2048, max_output_length=128):
+        """
+        Generate a response for every prompt, in input order. Cached prompts are answered from the cache,
+        the remaining unique prompts are sent concurrently through the request engine.
+        """
+        prompts = [prompt.strip() for prompt in prompts]  # it's important not to end with a whitespace
+        missing = list(dict.fromkeys(
+            prompt for prompt in prompts if not self.in_cache(prompt, sample_idx)
+        ))
+
+        if missing:
+            if self.model is None:
+                self.load_model()
+            outputs = self.engine.map(
+                lambda prompt: self._request(prompt, max_sequence_length=max_sequence_length), missing
+            )
+            self.cache_dict.update(
+                (self.cache_key(prompt, sample_idx), generated) for prompt, generated in zip(missing, outputs)
+            )
+            self.add_n += len(missing)
+
+        return [self.cache_dict[self.cache_key(prompt, sample_idx)] for prompt in prompts]
+
 
 def call_ChatGPT(
     message,
@@ -56,12 +87,15 @@ def call_ChatGPT(
     max_len=16384,
     temp=0.7,
     verbose=False,
+    engine=None,
 ):
     # call GPT-3 API until result is provided and then return it
     response = None
     received = False
     num_rate_errors = 0
     while not received:
+        if engine is not None:
+            engine.acquire()
         try:
             response = openai_client.chat.completions.create(
                 model=model_name,
@@ -72,7 +106,7 @@ def call_ChatGPT(
                 temperature=temp,
             )
             received = True
-        except:
+        except Exception as e:
             # print(message)
             num_rate_errors += 1
             error = sys.exc_info()[0]
@@ -81,11 +115,13 @@ def call_ChatGPT(
                 logging.critical(f"BadRequestError\nPrompt passed in:\n\n{message}\n\n")
                 assert False
 
+            # honor the delay requested by the server, fall back to exponential backoff
+            wait = retry_after_seconds(e) or np.power(2, num_rate_errors)
             logging.error(
                 "API error: %s (%d). Waiting %dsec"
-                % (error, num_rate_errors, np.power(2, num_rate_errors))
+                % (error, num_rate_errors, wait)
             )
-            time.sleep(np.power(2, num_rate_errors))
+            time.sleep(wait)
     return response
 
 
@@ -96,12 +132,15 @@ def call_GPT4(
     max_len=16384,
     temp=0.7,
     num_log_probs=0,
+    engine=None,
 ):
     # call GPT-3 API until result is provided and then return it
     response = None
     received = False
     num_rate_errors = 0
     while not received:
+        if engine is not None:
+            engine.acquire()
         try:
             response = openai_client.chat.completions.create(
                 model="gpt-4o-mini",
@@ -114,7 +153,7 @@ def call_GPT4(
                 top_logprobs=num_log_probs,
             )
             received = True
-        except:
+        except Exception as e:
             error = sys.exc_info()[0]
             num_rate_errors += 1
             if error == BadRequestError:
@@ -122,5 +161,6 @@ def call_GPT4(
                 logging.critical(f"BadRequestError\nPrompt passed in:\n\n{prompt}\n\n")
                 assert False
             logging.error("API error: %s (%d)" % (error, num_rate_errors))
-            time.sleep(np.power(2, num_rate_errors))
+            # honor the delay requested by the server, fall back to exponential backoff
+            time.sleep(retry_after_seconds(e) or np.power(2, num_rate_errors))
     return response
@@ -1,3 +1,5 @@
+import numpy as np
+
 from base.evaluation.metrics.factscore.factscorer import get_factscore_for_summaries
 from .metric import Metric
 
@@ -15,3 +17,35 @@ class FactScoreMetric(Metric):
         results = get_factscore_for_summaries(input_articles=references, predicted_summaries=predictions)
 
         return results
+
+    def compute_batch(self, predictions: list, references: list, progress_callback=None) -> tuple[list, list]:
+        """
+        Scores all summaries in a single FactScorer pass and splits the decisions per summary.
+
+        @param predictions: A list of predicted summaries
+        @param references: A list of full-text articles. Not to be confused with reference summaries
+        @param progress_callback: optional callable, called with (done, total) after each scored summary
+        """
+        results = get_factscore_for_summaries(input_articles=references, predicted_summaries=predictions,
+                                              progress_callback=progress_callback)
+
+        # summaries without atomic facts have neither a score nor decisions
+        statistics = [
+            {"score": score, "num_facts": len(decision) if decision is not None else None}
+            for score, decision in zip(results["summary_scores"], results["decisions"])
+        ]
+        # "no facts" is kept as None, so it cannot be mistaken for a summary whose facts are all unsupported
+        per_item = [
+            self.aggregate([stats]) if stats["score"] is not None
+            else {"score": None, "num_facts_per_response": None}
+            for stats in statistics
+        ]
+        return per_item, statistics
+
+    def aggregate(self, statistics: list) -> dict:
+        scores = [stats["score"] for stats in statistics if stats["score"] is not None]
+        num_facts = [stats["num_facts"] for stats in statistics if stats["num_facts"] is not None]
+        return {
+            "score": float(np.mean(scores)) if scores else float("nan"),
+            "num_facts_per_response": float(np.mean(num_facts)) if num_facts else float("nan"),
+        }
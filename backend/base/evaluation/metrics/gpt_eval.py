@@ -1,4 +1,16 @@
-from openai import OpenAI
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+
+from django.conf import settings
+from openai import BadRequestError, OpenAI
+
+from base.evaluation.request_engine import RequestEngine, retry_after_seconds
+from base.evaluation.response_cache import ResponseCache
 
 # Evaluation prompt template based on G-Eval
 EVALUATION_PROMPT_TEMPLATE = """
@@ -32,6 +44,42 @@ Please provide your response in two parts. First the score as a numeric value fo
 - {metric_name}
 """
 
+# Evaluation prompt scoring all dimensions in a single call
+COMBINED_EVALUATION_PROMPT_TEMPLATE = """
+You will be given one summary written for an article. Your task is to rate the summary on several metrics.
+Please make sure you read and understand these instructions very carefully.
+Please keep this document open while reviewing, and refer to it as needed.
+
+{metrics}
+
+Example:
+
+Source Text:
+
+{document}
+
+Summary:
+
+{summary}
+
+Evaluation Form:
+
+Rate the summary on every metric above, following its Evaluation Criteria and Evaluation Steps.
+Respond only with a JSON object that maps each of the metric names {metric_names} to its integer score.
+"""
+
+COMBINED_METRIC_TEMPLATE = """
+Metric: {metric_name}
+
+Evaluation Criteria:
+
+{criteria}
+
+Evaluation Steps:
+
+{steps}
+"""
+
 # Metric 1: Coherence
 
 COHERENCE_SCORE_CRITERIA = """
@@ -107,10 +155,70 @@ CONSISTENCY_SCORE_STEPS = """
 """
 
 
+
+EVALUATION_METRICS = {
+    "Domain_Adaptation": (DOMAIN_ADAPTATION_SCORE_CRITERIA, DOMAIN_ADAPTATION_SCORE_STEPS,),
+    "Coherence": (COHERENCE_SCORE_CRITERIA, COHERENCE_SCORE_STEPS),
+    "Fluency": (FLUENCY_SCORE_CRITERIA, FLUENCY_SCORE_STEPS),
+    "Relevance": (RELEVANCY_SCORE_CRITERIA, RELEVANCY_SCORE_STEPS),
+    "Consistency": (CONSISTENCY_SCORE_CRITERIA, CONSISTENCY_SCORE_STEPS),
+}
+
+
 class GPTEval:
+  """
+  G-Eval scores for the dimensions in EVALUATION_METRICS.
+
+  Requests are sent concurrently through a RequestEngine and retried with backoff. Every score is cached under
+  (model, dimension, document hash, summary hash), so only new article-summary pairs are sent to the API.
+  With combined=True all dimensions of a pair are scored in a single call that answers with a JSON object.
+  """
+  metric_version = "1"
 
-  def __init__(self, api_key: str) -> None:
+  def __init__(self, api_key: str, model: str = None, combined: bool = None, cache_file: str = None,
+               max_in_flight: int = None, requests_per_minute: float = None, max_retries: int = 6) -> None:
     self.model = OpenAI(api_key=api_key)
+    self.model_name = model or os.getenv("GEVAL_MODEL", "gpt-4")
+    if combined is None:
+      combined = os.getenv("GEVAL_COMBINED", "false").lower() in ("1", "true", "yes")
+    self.combined = combined
+    self.max_retries = max_retries
+    self.engine = RequestEngine(
+        max_in_flight=max_in_flight or int(os.getenv("OPENAI_MAX_IN_FLIGHT", 8)),
+        requests_per_minute=requests_per_minute or float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500)),
+    )
+    self.cache = ResponseCache(cache_file or settings.GEVAL_CACHE_FILE)
+
+  @staticmethod
+  def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+  def cache_key(self, eval_type: str, document_hash: str, summary_hash: str):
+    return self.model_name, eval_type, document_hash, summary_hash
+
+  def _create(self, prompt: str, max_tokens: int):
+    # retry transient errors, honoring the delay requested by the server and falling back to exponential backoff
+    for attempt in range(self.max_retries + 1):
+      self.engine.acquire()
+      try:
+        return self.model.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=max_tokens,
+            top_p=1,
+            frequency_penalty=0,
+            presence_penalty=0,
+        )
+      except BadRequestError:
+        # retrying does not help, e.g. the prompt is too long
+        raise
+      except Exception as e:
+        if attempt == self.max_retries:
+          raise
+        wait = retry_after_seconds(e) or 2 ** attempt
+        logging.error("G-Eval API error: %s (%d). Waiting %dsec", e, attempt + 1, wait)
+        time.sleep(wait)
 
   def get_geval_score(self, criteria: str, steps: str, document: str, summary: str, metric_name: str):
     prompt = EVALUATION_PROMPT_TEMPLATE.format(
@@ -120,39 +228,87 @@ class GPTEval:
         document=document,
         summary=summary,
     )
-    response = self.model.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0,
-        max_tokens=5,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0,
-    )
+    response = self._create(prompt, max_tokens=5)
     return response.choices[0].message.content
 
-  def evaluate(self, input_articles: list, predicted_summary: list) -> str:
-    evaluation_metrics = {
-        "Domain_Adaptation": (DOMAIN_ADAPTATION_SCORE_CRITERIA, DOMAIN_ADAPTATION_SCORE_STEPS,),
-        "Coherence": (COHERENCE_SCORE_CRITERIA, COHERENCE_SCORE_STEPS),
-        "Fluency": (FLUENCY_SCORE_CRITERIA, FLUENCY_SCORE_STEPS),
-        "Relevance": (RELEVANCY_SCORE_CRITERIA, RELEVANCY_SCORE_STEPS),
-        "Consistency": (CONSISTENCY_SCORE_CRITERIA, CONSISTENCY_SCORE_STEPS),
-    }
-
-    final_result = []
-    
-    for article, summary in zip(input_articles, predicted_summary):
-        summary_result = {}
-        for eval_type, (criteria, steps) in evaluation_metrics.items():
-            result = self.get_geval_score(criteria, steps, article, summary, eval_type)
-
-            print("Result:", result)
-            print("Score:", result.split()[1])
-            score_num = float(result.split()[1].replace(",", ""))
-            print("Score num:", score_num)
-            summary_result[eval_type] = score_num
-        final_result.append(summary_result)
-
-    return final_result
+  def get_combined_geval_scores(self, document: str, summary: str) -> dict:
+    metrics = "".join(
+        COMBINED_METRIC_TEMPLATE.format(metric_name=eval_type, criteria=criteria, steps=steps)
+        for eval_type, (criteria, steps) in EVALUATION_METRICS.items()
+    )
+    prompt = COMBINED_EVALUATION_PROMPT_TEMPLATE.format(
+        metrics=metrics,
+        metric_names=", ".join(EVALUATION_METRICS),
+        document=document,
+        summary=summary,
+    )
+    response = self._create(prompt, max_tokens=100)
+    return self.parse_combined_scores(response.choices[0].message.content)
+
+  @staticmethod
+  def parse_score(result: str) -> float:
+    # responses look like "Score: 4, Reason: ..." but are cut off after a few tokens
+    match = re.search(r"[0-9]+(?:\.[0-9]+)?", result.split("Score:", 1)[-1])
+    if match is None:
+      logging.error("Could not parse G-Eval score from %r", result)
+      return float("nan")
+    return float(match.group(0))
+
+  @staticmethod
+  def parse_combined_scores(result: str) -> dict:
+    match = re.search(r"\{.*\}", result, re.DOTALL)
+    try:
+      scores = json.loads(match.group(0)) if match else {}
+    except json.JSONDecodeError:
+      scores = {}
+    parsed = {}
+    for eval_type in EVALUATION_METRICS:
+      try:
+        parsed[eval_type] = float(scores[eval_type])
+      except (KeyError, TypeError, ValueError):
+        logging.error("Could not parse G-Eval %s score from %r", eval_type, result)
+        parsed[eval_type] = float("nan")
+    return parsed
+
+  def _store(self, document_hash: str, summary_hash: str, scores: dict):
+    # unparsable scores are not cached, so they are requested again on the next run
+    self.cache.update(
+        (self.cache_key(eval_type, document_hash, summary_hash), value)
+        for eval_type, value in scores.items() if not math.isnan(value)
+    )
+
+  def evaluate(self, input_articles: list, predicted_summary: list) -> list:
+    pairs = [(self.content_hash(article), self.content_hash(summary), article, summary)
+             for article, summary in zip(input_articles, predicted_summary)]
+
+    # only the dimensions of unique (document, summary) pairs that are missing from the cache are requested
+    missing = {}
+    for document_hash, summary_hash, article, summary in pairs:
+      eval_types = [eval_type for eval_type in EVALUATION_METRICS
+                    if self.cache_key(eval_type, document_hash, summary_hash) not in self.cache]
+      if eval_types:
+        missing.setdefault((document_hash, summary_hash), (article, summary, eval_types))
+
+    if self.combined:
+      def score(item):
+        (document_hash, summary_hash), (article, summary, _) = item
+        self._store(document_hash, summary_hash, self.get_combined_geval_scores(article, summary))
+
+      requests = list(missing.items())
+    else:
+      def score(item):
+        (document_hash, summary_hash), (article, summary, eval_type) = item
+        criteria, steps = EVALUATION_METRICS[eval_type]
+        result = self.get_geval_score(criteria, steps, article, summary, eval_type)
+        self._store(document_hash, summary_hash, {eval_type: self.parse_score(result)})
+
+      requests = [(pair, (article, summary, eval_type))
+                  for pair, (article, summary, eval_types) in missing.items() for eval_type in eval_types]
+
+    self.engine.map(score, requests)
 
+    return [
+        {eval_type: self.cache.get(self.cache_key(eval_type, document_hash, summary_hash), float("nan"))
+         for eval_type in EVALUATION_METRICS}
+        for document_hash, summary_hash, _, _ in pairs
+    ]
@@ -1,9 +1,38 @@
+import numpy as np
+
+
 class Metric:
 
     metric_name: str = ""
+    # bump when a change alters the scores, stored results of other versions are then recomputed
+    metric_version: str = "1"
 
     def __init__(self) -> None:
         pass
 
     def compute(self, predictions: list, references: list) -> dict:
         pass
+
+    def compute_batch(self, predictions: list, references: list) -> tuple[list, list]:
+        """
+        Scores every prediction-reference pair in a single pass.
+
+        Returns the per-item results together with the per-item sufficient statistics the corpus score is built
+        from (see aggregate). The default falls back to one compute call per pair, metrics that can score a whole
+        batch at once should override it.
+        """
+        per_item = [self.compute(predictions=[pred], references=[ref]) for pred, ref in zip(predictions, references)]
+        return per_item, per_item
+
+    def aggregate(self, statistics: list) -> dict:
+        """
+        Builds the corpus score from per-item sufficient statistics. By default the statistics are the per-item
+        results and every numeric value is averaged.
+        """
+        if not statistics:
+            return {}
+        return {
+            key: float(np.mean([item[key] for item in statistics]))
+            for key, value in statistics[0].items()
+            if isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+        }
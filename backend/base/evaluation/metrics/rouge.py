@@ -16,3 +16,14 @@ class Rouge(Metric):
         return self.metric.compute(
             predictions=predictions, references=references, use_stemmer=True
         )
+
+    def compute_batch(self, predictions: list, references: list) -> tuple[list, list]:
+        # without the aggregator rouge returns one f-measure per pair for every rouge type
+        scores = self.metric.compute(
+            predictions=predictions, references=references, use_stemmer=True, use_aggregator=False
+        )
+        per_item = [
+            {rouge_type: float(values[i]) for rouge_type, values in scores.items()}
+            for i in range(len(predictions))
+        ]
+        return per_item, per_item
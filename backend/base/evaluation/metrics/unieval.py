@@ -5,6 +5,9 @@ from nltk import sent_tokenize
 from tqdm import tqdm
 from transformers import AutoConfig, AutoModelForSeq2SeqLM, AutoTokenizer
 
+from base.evaluation.batching import length_bucketed_batches, restore_order
+from base.evaluation.evaluation_handler import UNIEVAL_DIMENSIONS
+from base.evaluation.model_pool import model_pool
 from .metric import Metric
 
 def get_device() -> str:
@@ -110,14 +113,17 @@ def convert_to_json(
 class UniEval(Metric):
     metric_name = "unieval"
 
-    def compute(self, predictions: list, references: list, source: list) -> dict:
+    def compute(self, predictions: list, references: list, source: list, dims: list = None) -> dict:
+        """
+        dims: subset of the dimensions coherence, consistency, fluency and relevance, all of them if None
+        """
         data = convert_to_json(
             output_list=predictions, src_list=source, ref_list=references
         )
         # Initialize evaluator for a specific task
         evaluator = SumEvaluator(max_length=1024, device="cuda:0", cache_dir=None)
         # Get multi-dimensional evaluation scores
-        eval_scores = evaluator.evaluate(data, print_result=True)
+        eval_scores = evaluator.evaluate(data, dims=dims, print_result=True)
         return eval_scores
 
 
@@ -147,83 +153,85 @@ class UniEvaluator:
         self.pos_id = self.tokenizer("Yes")["input_ids"][0]
         self.neg_id = self.tokenizer("No")["input_ids"][0]
 
-    def score(self, inputs, batch_size=8):
+    def score(self, inputs, batch_size=None, max_tokens=None):
         """
         Get scores for the given samples.
         final_score = postive_score / (postive_score + negative_score)
+        Inputs are tokenized once and grouped by length into batches of at most max_tokens padded tokens,
+        batch_size optionally caps the number of inputs per batch. Scores are returned in input order.
         """
 
+        encoded_inputs = self.tokenizer(inputs, max_length=self.max_length, truncation=True)["input_ids"]
+        return self.score_encoded(encoded_inputs, batch_size=batch_size, max_tokens=max_tokens)
+
+    def encode(self, text):
+        """Token ids of a text without special tokens, used to encode parts of an input separately"""
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def join(self, *parts):
+        """Concatenates token ids from encode, truncated to max_length like a tokenizer call with truncation"""
+        input_ids = [token_id for part in parts for token_id in part]
+        return input_ids[:self.max_length - 1] + [self.tokenizer.eos_token_id]
+
+    def score_encoded(self, encoded_inputs, batch_size=None, max_tokens=None):
+        """Same as score, for inputs that are already tokenized"""
+
         # The implementation of "forward" in T5 still requires decoder_input_ids.
         # Therefore, we construct a random one-word target sequence.
         # The content of the target has no effect on the final scores.
-        tgts = ["No" for _ in range(len(inputs))]
+        tgt_id = self.tokenizer("No")["input_ids"][0]
+
+        batches = length_bucketed_batches(
+            [len(ids) for ids in encoded_inputs], max_tokens=max_tokens, max_batch_size=batch_size
+        )
 
-        pos_score_list, neg_score_list = [], []
-        for i in tqdm(range(0, len(inputs), batch_size)):
-            src_list = inputs[i : i + batch_size]
-            tgt_list = tgts[i : i + batch_size]
+        batch_scores = []
+        for batch in tqdm(batches):
             try:
                 with torch.no_grad():
-                    encoded_src = self.tokenizer(
-                        src_list,
-                        max_length=self.max_length,
-                        truncation=True,
-                        padding=True,
-                        return_tensors="pt",
-                    )
-                    encoded_tgt = self.tokenizer(
-                        tgt_list,
-                        max_length=self.max_length,
-                        truncation=True,
-                        padding=True,
-                        return_tensors="pt",
+                    encoded_src = self.tokenizer.pad(
+                        {"input_ids": [encoded_inputs[i] for i in batch]}, return_tensors="pt"
                     )
 
                     src_tokens = encoded_src["input_ids"].to(self.device)
                     src_mask = encoded_src["attention_mask"].to(self.device)
 
-                    tgt_tokens = (
-                        encoded_tgt["input_ids"].to(self.device)[:, 0].unsqueeze(-1)
-                    )
+                    tgt_tokens = torch.full((len(batch), 1), tgt_id, dtype=torch.long, device=self.device)
 
                     output = self.model(
                         input_ids=src_tokens, attention_mask=src_mask, labels=tgt_tokens
                     )
                     logits = output.logits.view(-1, self.model.config.vocab_size)
 
-                    pos_score = self.softmax(logits)[:, self.pos_id]  # Yes
-                    neg_score = self.softmax(logits)[:, self.neg_id]  # No
+                    probs = self.softmax(logits)
+                    pos_score = probs[:, self.pos_id]  # Yes
+                    neg_score = probs[:, self.neg_id]  # No
 
-                    cur_pos_score = [x.item() for x in pos_score]
-                    cur_neg_score = [x.item() for x in neg_score]
-                    pos_score_list += cur_pos_score
-                    neg_score_list += cur_neg_score
+                    batch_scores.append((pos_score / (pos_score + neg_score)).tolist())
 
             except RuntimeError:
-                print(f"source: {src_list}")
-                print(f"target: {tgt_list}")
+                print(f"source: {self.tokenizer.batch_decode([encoded_inputs[i] for i in batch])}")
                 exit(0)
 
-        score_list = []
-        for i in range(len(pos_score_list)):
-            score_list.append(
-                pos_score_list[i] / (pos_score_list[i] + neg_score_list[i])
-            )
-
-        return score_list
+        return restore_order(batches, batch_scores)
 
 
 class SumEvaluator:
     def __init__(self, max_length=1024, device="cuda:0", cache_dir=None):
         """Set up evaluator for text summarization"""
-        self.scorer = UniEvaluator(
-            model_name_or_path="MingZhong/unieval-sum",
-            max_length=max_length,
-            device=get_device(),
-            cache_dir=cache_dir,
+        device = get_device()
+        # the model is loaded once per process and shared through the model pool
+        self.scorer = model_pool.get(
+            ("MingZhong/unieval-sum", device),
+            lambda: UniEvaluator(
+                model_name_or_path="MingZhong/unieval-sum",
+                max_length=max_length,
+                device=device,
+                cache_dir=cache_dir,
+            ),
         )
         self.task = "summarization"
-        self.dimensions = ["coherence", "consistency", "fluency", "relevance"]
+        self.dimensions = list(UNIEVAL_DIMENSIONS)
 
     def evaluate(self, data, dims=None, overall=True, print_result=False):
         """
@@ -248,58 +256,53 @@ class SumEvaluator:
             eval_dims = dims
 
         for dim in eval_dims:
-            print("Evaluating {} of {} samples !!!".format(dim, n_data))
-
-            # Calculate average sentence-level scores for 'consistency' and 'fluency'
-            if dim == "consistency" or dim == "fluency":
-                src_list, output_list = [], []
-                n_sents = []  # the number of sentences in each generated summary
-                for i in range(n_data):
-                    source = data[i]["source"]
-                    system_outputs = sent_tokenize(data[i]["system_output"])
-                    n_sents.append(len(system_outputs))
-                    for j in range(len(system_outputs)):
-                        src_list.append(source)
-                        output_list.append(system_outputs[j])
-                input_list = add_question(
-                    dimension=dim, output=output_list, src=src_list
-                )
-                sent_score = self.scorer.score(input_list)
-
-                # Get average score for each sample
-                start_idx = 0
-                score = []
-                for cur_n_sent in n_sents:
-                    score.append(
-                        sum(sent_score[start_idx : start_idx + cur_n_sent]) / cur_n_sent
-                    )
-                    start_idx += cur_n_sent
-
-            # Calculate summary-level score for 'coherence' and 'relevance'
-            elif dim == "coherence" or dim == "relevance":
-                src_list, output_list, ref_list = [], [], []
-                for i in range(n_data):
-                    src_list.append(data[i]["source"])
-                    output_list.append(data[i]["system_output"])
-                    if dim == "relevance":
-                        ref_list.append(data[i]["reference"])
-                input_list = add_question(
-                    dimension=dim,
-                    output=output_list,
-                    src=src_list,
-                    ref=ref_list,
-                )
-                score = self.scorer.score(input_list)
-
             # Please customize other dimensions here for summarization
-            else:
+            if dim not in self.dimensions:
                 raise NotImplementedError(
                     "The input format for this dimension is still undefined. \
                                            Please customize it first."
                 )
 
+        # Sentence splits and source encodings are computed once per text and shared by all dimensions
+        sentences = {}  # {system output: its sentences}
+        source_ids = {}  # {source: token ids of the source}
+
+        def split_sentences(output):
+            if output not in sentences:
+                # an output without sentence boundaries is scored as a single sentence
+                sentences[output] = sent_tokenize(output) or [output]
+            return sentences[output]
+
+        def encode_input(dim, output, item):
+            if dim == "coherence" or dim == "consistency":
+                if item["source"] not in source_ids:
+                    source_ids[item["source"]] = self.scorer.encode(item["source"])
+                # the question up to "document:", followed by the cached encoding of the source
+                question = add_question(dimension=dim, output=[output], src=[""])[0].rstrip()
+                return self.scorer.join(self.scorer.encode(question), source_ids[item["source"]])
+            ref = [item["reference"]] if dim == "relevance" else None
+            question = add_question(dimension=dim, output=[output], src=None, ref=ref)[0]
+            return self.scorer.join(self.scorer.encode(question))
+
+        # Inputs of all dimensions are scored in one pass, so they share the length-bucketed batches
+        input_list = []
+        spans = []  # (dimension, sample index, first input, end of inputs)
+        for dim in eval_dims:
+            print("Evaluating {} of {} samples !!!".format(dim, n_data))
             for i in range(n_data):
-                eval_scores[i][dim] = score[i]
+                # Calculate average sentence-level scores for 'consistency' and 'fluency'
+                if dim == "consistency" or dim == "fluency":
+                    outputs = split_sentences(data[i]["system_output"])
+                # Calculate summary-level score for 'coherence' and 'relevance'
+                else:
+                    outputs = [data[i]["system_output"]]
+                start_idx = len(input_list)
+                input_list += [encode_input(dim, output, data[i]) for output in outputs]
+                spans.append((dim, i, start_idx, len(input_list)))
+
+        score = self.scorer.score_encoded(input_list)
+        for dim, i, start_idx, end_idx in spans:
+            eval_scores[i][dim] = sum(score[start_idx:end_idx]) / (end_idx - start_idx)
 
         # Customize your overall score here.
         if overall == True:
@@ -0,0 +1,89 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def model_memory_mb(scorer) -> float:
+    """Size of the parameters and buffers of the torch model held by a scorer (or of the model itself) in MB"""
+    import torch.nn as nn
+
+    model = scorer if isinstance(scorer, nn.Module) else getattr(scorer, "model", None)
+    if not isinstance(model, nn.Module):
+        return 0.0
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) / 1024 ** 2
+
+
+class ModelPool:
+    """
+    Process-level pool of loaded models, shared by all transformer-based metrics.
+
+    Models are keyed by (checkpoint, device), followed by anything else that changes the loaded weights (e.g. a
+    fine-tuned state dict). When loading a model would exceed the memory budget, the least recently used models are
+    evicted first. A budget of 0 disables eviction.
+    """
+
+    def __init__(self, memory_budget_mb: float = None):
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.getenv("MODEL_POOL_MEMORY_BUDGET_MB", 8192))
+        self.memory_budget_mb = memory_budget_mb
+        self.models = OrderedDict()  # {key: (model, size_mb)}, least recently used first
+        self.lock = threading.RLock()
+
+    def get(self, key: tuple, loader):
+        """Returns the model stored under key, calling loader() to load it if it is not in the pool"""
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key][0]
+
+            start = time.perf_counter()
+            model = loader()
+            size_mb = model_memory_mb(model)
+            logger.info("Loaded %s (%.0f MB) in %.1fs", key, size_mb, time.perf_counter() - start)
+
+            self._evict(size_mb)
+            self.models[key] = (model, size_mb)
+            return model
+
+    def memory_mb(self) -> float:
+        return sum(size_mb for _, size_mb in self.models.values())
+
+    def _evict(self, required_mb: float):
+        if not self.memory_budget_mb:
+            return
+        evicted = []
+        while self.models and self.memory_mb() + required_mb > self.memory_budget_mb:
+            key, (_, size_mb) = self.models.popitem(last=False)
+            logger.info("Evicted %s (%.0f MB) from the model pool", key, size_mb)
+            evicted.append(key)
+        if evicted:
+            self._release(evicted)
+
+    @staticmethod
+    def _release(keys):
+        # free the memory of evicted models right away instead of at the next garbage collection
+        gc.collect()
+        if any("cuda" in str(key[1]) for key in keys if len(key) > 1):
+            import torch
+
+            torch.cuda.empty_cache()
+
+    def collect(self):
+        """Frees memory left behind by an interrupted task, the pooled models are kept"""
+        with self.lock:
+            self._release(list(self.models))
+
+    def clear(self):
+        with self.lock:
+            keys = list(self.models)
+            self.models.clear()
+            self._release(keys)
+
+
+model_pool = ModelPool()
@@ -0,0 +1,84 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter that can be shared between threads.
+    Every request takes one token, tokens are refilled continuously at `requests_per_minute`.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: int = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1, int(self.rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestEngine:
+    """
+    Sends independent requests concurrently with a bounded number of requests in flight.
+    The rate limiter is exposed so that request functions can take a token before every attempt, retries included.
+    """
+
+    def __init__(self, max_in_flight: int = 8, requests_per_minute: float = None):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.rate_limiter = TokenBucket(requests_per_minute) if requests_per_minute else None
+
+    def acquire(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def map(self, fn, items) -> list:
+        """Apply fn to all items concurrently, results are returned in input order"""
+        items = list(items)
+        if len(items) <= 1 or self.max_in_flight == 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(items))) as executor:
+            return list(executor.map(fn, items))
+
+
+def retry_after_seconds(exception):
+    """
+    Returns the delay requested by the server through the Retry-After (or retry-after-ms) header of a failed
+    API call, or None if the response did not contain one.
+    """
+    response = getattr(exception, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            # Retry-After may also be an HTTP date
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+
+
+class ResponseCache:
+    """
+    Persistent cache for model responses backed by SQLite.
+
+    Every entry is inserted and looked up on its own, so the cost of a write does not depend on the size of the
+    cache. The database runs in WAL mode, which lets several processes (e.g. celery workers) read and write the
+    same file concurrently. Keys can be strings or tuples and are stored as their sha256 hash, values are pickled.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(key) -> str:
+        if isinstance(key, str):
+            key = [key]
+        return hashlib.sha256(json.dumps(list(key), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM cache WHERE key = ?", (self.make_key(key),)
+            ).fetchone()
+        return row is not None
+
+    def __getitem__(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM cache WHERE key = ?", (self.make_key(key),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self.update([(key, value)])
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, items):
+        """Insert or replace several (key, value) pairs in one transaction"""
+        rows = [(self.make_key(key), pickle.dumps(value)) for key, value in items]
+        if not rows:
+            return
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+
+from ..models.experiment_model import Experiment
+from ..models.project_invite_model import ProjectInvite
+
+TASK_EXPERIMENT_TIMEOUT = 60 * 60 * 24 * 7
+EVENTS_TOKEN_SALT = 'task-events'
+
+
+def _task_experiment_key(task_id):
+    return f'task_experiment:{task_id}'
+
+
+def record_task_experiment(task_id, experiment_id):
+    """Records the experiment a task works on, access to the task is then granted like access to the experiment"""
+    cache.set(_task_experiment_key(task_id), experiment_id, TASK_EXPERIMENT_TIMEOUT)
+
+
+def can_access_task(user, task_id):
+    """Whether the user is the author of, or invited to, the project of the task's experiment"""
+    if user is None or not user.is_authenticated:
+        return False
+    experiment_id = cache.get(_task_experiment_key(task_id))
+    if experiment_id is None:
+        return False
+    experiment = Experiment.objects.select_related("project").filter(pk=experiment_id).first()
+    if experiment is None:
+        return False
+    project = experiment.project
+    return project.author_id == user.pk or ProjectInvite.objects.filter(project=project, user=user).exists()
+
+
+def events_endpoint(task_id, user):
+    """
+    URL of the event stream of a task. EventSource cannot send an Authorization header, so the URL carries a signed
+    token of the user, valid for TASK_EVENTS_TOKEN_MAX_AGE seconds.
+    """
+    token = signing.dumps({'task': task_id, 'user': user.pk}, salt=EVENTS_TOKEN_SALT)
+    return f'/api/tasks/{task_id}/events?token={token}'
+
+
+def events_token_user(token, task_id):
+    """The user of a valid events token for task_id, None if the token is invalid, expired or for another task"""
+    try:
+        payload = signing.loads(token, salt=EVENTS_TOKEN_SALT, max_age=settings.TASK_EVENTS_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if payload.get('task') != task_id:
+        return None
+    return get_user_model().objects.filter(pk=payload.get('user')).first()
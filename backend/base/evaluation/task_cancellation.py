@@ -0,0 +1,56 @@
+from django.core.cache import cache
+
+CANCELLATION_TIMEOUT = 60 * 60 * 24
+CHORD_TIMEOUT = 60 * 60 * 24 * 7
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task whose cancellation was requested, with the items it scored so far"""
+
+    def __init__(self, task_id, scored=None):
+        super().__init__(f"Task {task_id} was cancelled")
+        self.task_id = task_id
+        self.scored = scored or []
+
+
+def _cancellation_key(task_id):
+    return f'task_cancel:{task_id}'
+
+
+def _chord_key(task_id):
+    return f'task_chord:{task_id}'
+
+
+def request_cancellation(task_id, save_partial=False):
+    """Asks the tasks reporting on task_id to stop at their next check"""
+    cache.set(_cancellation_key(task_id), {'save_partial': save_partial}, CANCELLATION_TIMEOUT)
+
+
+def cancellation_request(task_id):
+    """The cancellation request of a task, i.e. {'save_partial': bool}, or None if it was not cancelled"""
+    if task_id is None:
+        return None
+    return cache.get(_cancellation_key(task_id))
+
+
+def raise_if_cancelled(task_id, scored=None):
+    """
+    Raises TaskCancelled if the cancellation of task_id was requested. scored is a callable returning the items scored
+    so far, it is only called once the task is actually cancelled.
+    """
+    if cancellation_request(task_id) is not None:
+        raise TaskCancelled(task_id, scored() if scored is not None else None)
+
+
+def register_chord(task_id):
+    """
+    Records that task_id is replaced by a chord whose callback keeps the id. Such a task must not be revoked when it
+    is cancelled, as the worker would then drop the callback that saves or discards the results of the chord.
+    Returns False if the cancellation was requested before, the chord should then not be started.
+    """
+    cache.set(_chord_key(task_id), True, CHORD_TIMEOUT)
+    return cancellation_request(task_id) is None
+
+
+def is_chord(task_id):
+    return cache.get(_chord_key(task_id)) is not None
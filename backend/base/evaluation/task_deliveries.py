@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.cache import cache
+
+DELIVERY_COUNT_TIMEOUT = 60 * 60 * 24 * 7
+
+
+class TooManyDeliveries(Exception):
+    """Raised by a task that was redelivered more often than MAX_TASK_DELIVERIES allows"""
+
+    def __init__(self, task_id, deliveries):
+        super().__init__(f"Task {task_id} was delivered {deliveries} times, its worker was probably killed every "
+                         f"time (e.g. out of memory). Giving up.")
+        self.task_id = task_id
+        self.deliveries = deliveries
+
+
+def check_deliveries(task):
+    """
+    Counts the deliveries of a task and raises TooManyDeliveries after MAX_TASK_DELIVERIES of them.
+    Tasks with acks_late and reject_on_worker_lost are redelivered when their worker dies. Without this check a task
+    that reliably kills its worker would be redelivered forever.
+    """
+    key = f'task_deliveries:{task.request.id}'
+    cache.add(key, 0, DELIVERY_COUNT_TIMEOUT)
+    deliveries = cache.incr(key)
+    if deliveries > settings.MAX_TASK_DELIVERIES:
+        raise TooManyDeliveries(task.request.id, deliveries)
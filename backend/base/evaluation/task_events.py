@@ -0,0 +1,45 @@
+import json
+import logging
+
+import redis
+from celery import states
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def channel_name(task_id):
+    return f'task_events:{task_id}'
+
+
+def status_event(state, meta=None, result=None):
+    """Task status in the format of the task_status endpoint"""
+    if state == 'PROGRESS':
+        return {
+            'state': state,
+            'progress': meta['total_progress'],
+            'eta_seconds': meta.get('eta_seconds'),
+            'active_phases': meta.get('active_phases', []),
+            'completed_phases': meta.get('completed_phases', [])
+        }
+    return {
+        'state': state,
+        'result': result if state == states.SUCCESS else None,
+        'error': meta if state == states.FAILURE else None
+    }
+
+
+def publish_task_event(task_id, state, meta=None, result=None):
+    """
+    Publishes a status update of a task to the clients streaming its events.
+    Publishing is best effort, a task never fails because its progress could not be published.
+    """
+    global _client
+    try:
+        if _client is None:
+            _client = redis.Redis.from_url(settings.TASK_EVENTS_REDIS_URL)
+        _client.publish(channel_name(task_id), json.dumps(status_event(state, meta, result), default=str))
+    except redis.RedisError as e:
+        logger.warning("Could not publish event of task %s: %s", task_id, e)
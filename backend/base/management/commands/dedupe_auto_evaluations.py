@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min
+
+from base.models.auto_evaluation_model import AutoEvaluation
+
+
+class Command(BaseCommand):
+    help = ("Deletes duplicate AutoEvaluation rows of an object, keeping the oldest one that was read and updated. "
+            "Run this before migrating to the unique (content_type, object_id) constraint")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the number of duplicate rows")
+
+    def handle(self, *args, **options):
+        if AutoEvaluation._meta.db_table not in connection.introspection.table_names():
+            # a new database, there is nothing to deduplicate before the first migration
+            self.stdout.write(self.style.SUCCESS("No AutoEvaluation table yet, nothing to deduplicate"))
+            return
+
+        duplicates = (
+            AutoEvaluation.objects.values("content_type", "object_id")
+            .annotate(rows=Count("pk"), keep=Min("pk"))
+            .filter(rows__gt=1)
+        )
+        total = 0
+        with transaction.atomic():
+            for duplicate in list(duplicates):
+                extra = AutoEvaluation.objects.filter(
+                    content_type=duplicate["content_type"], object_id=duplicate["object_id"]
+                ).exclude(pk=duplicate["keep"])
+                total += duplicate["rows"] - 1
+                if not options["dry_run"]:
+                    extra.delete()
+
+        action = "Found" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{action} {total} duplicate AutoEvaluation rows"))
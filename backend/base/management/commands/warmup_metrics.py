@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base.evaluation.evaluation_handler import METRIC_CLASSES
+
+
+class Command(BaseCommand):
+    help = "Builds the evaluation metrics (downloads models and NLTK data) and reports the memory they use"
+
+    def add_arguments(self, parser):
+        parser.add_argument("metrics", nargs="*", choices=list(METRIC_CLASSES),
+                            help="Metrics to build, all metrics if omitted")
+
+    def handle(self, *args, **options):
+        handler = settings.EVALUATION_HANDLER
+        handler.warmup(options["metrics"] or None)
+
+        report = handler.memory_report()
+        for name, memory in report["metrics_mb"].items():
+            self.stdout.write(f"{name}: +{memory:.0f} MB")
+        self.stdout.write(self.style.SUCCESS(f"Process {report['pid']} RSS: {report['rss_mb']:.0f} MB"))
@@ -1,6 +1,59 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
+
+
+class AutoEvaluationManager(models.Manager):
+    def results_for(self, model_class, object_ids, batch_size=None):
+        """
+        {object_id: evaluation results} of many objects, looked up in batches of object ids.
+        Objects without a row are left out.
+        """
+        batch_size = batch_size or settings.AUTO_EVALUATION_BATCH_SIZE
+        content_type = ContentType.objects.get_for_model(model_class)
+        object_ids = list(object_ids)
+        results = {}
+        for start in range(0, len(object_ids), batch_size):
+            rows = self.filter(
+                content_type=content_type, object_id__in=object_ids[start:start + batch_size]
+            ).values(*RESULT_FIELDS)
+            for row in rows:
+                results[row["object_id"]] = row
+        return results
+
+    def bulk_upsert(self, model_class, results, batch_size=None):
+        """
+        Sets metric results on the AutoEvaluation rows of many objects.
+
+        :param model_class: model of the evaluated objects, e.g. Summary or Experiment
+        :param results: Dict of {object_id: {metric_field: value}}
+        :param batch_size: number of rows per query, defaults to settings.AUTO_EVALUATION_BATCH_SIZE
+
+        Existing rows keep their other metrics, objects without a row get a new one. The rows are written with
+        INSERT ... ON CONFLICT on the unique (content_type, object_id) constraint, so concurrent workers cannot
+        create a second row for the same object.
+        """
+        batch_size = batch_size or settings.AUTO_EVALUATION_BATCH_SIZE
+        content_type = ContentType.objects.get_for_model(model_class)
+
+        # rows are inserted with all fields, so only objects that set the same fields share a query, otherwise
+        # the defaults of the missing fields would overwrite the stored results
+        by_fields = defaultdict(list)
+        for object_id, values in results.items():
+            by_fields[tuple(sorted(values))].append(
+                self.model(content_type=content_type, object_id=object_id, **values)
+            )
+
+        with transaction.atomic():
+            for fields, rows in by_fields.items():
+                if fields:
+                    self.bulk_create(rows, batch_size=batch_size, update_conflicts=True,
+                                     unique_fields=["content_type", "object_id"], update_fields=list(fields))
+                else:
+                    self.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
 
 
 class AutoEvaluation(models.Model):
@@ -20,3 +73,18 @@ class AutoEvaluation(models.Model):
     unieval = models.JSONField(default=dict)
     llm_evaluation = models.JSONField(default=dict)
     factscore = models.JSONField(default=dict)
+    # {metric: {"hash": content hash of the scored inputs, "statistics": per-item statistics of the metric}}
+    metric_state = models.JSONField(default=dict)
+
+    objects = AutoEvaluationManager()
+
+    class Meta:
+        # one row per evaluated object, see the dedupe_auto_evaluations command for databases that have duplicates
+        constraints = [
+            models.UniqueConstraint(fields=["content_type", "object_id"], name="unique_auto_evaluation_object"),
+        ]
+
+
+# fields returned by the API, metric_state is internal bookkeeping of the evaluation tasks
+RESULT_FIELDS = ("id", "content_type_id", "object_id", "bartscore", "bertscore", "bleu", "meteor", "rouge",
+                 "token_shift_dist", "unieval", "llm_evaluation", "factscore")
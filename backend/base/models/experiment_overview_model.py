@@ -0,0 +1,78 @@
+from django.db import models
+from django.utils import timezone
+
+from .auto_evaluation_model import AutoEvaluation
+from .experiment_model import Experiment
+from .summary_model import Summary
+
+
+class ExperimentOverviewManager(models.Manager):
+    def refresh(self, experiment_ids):
+        """Recomputes the overviews of the given experiments from their summaries and evaluation results"""
+        experiment_ids = list(experiment_ids)
+        counts = {experiment_id: 0 for experiment_id in experiment_ids}
+        ranges = {experiment_id: [] for experiment_id in experiment_ids}
+        # the indices are streamed in order and compressed into [first, last] ranges of consecutive indices
+        summaries = Summary.objects.filter(experiment__in=experiment_ids).order_by("experiment", "index").values_list(
+            "experiment", "index"
+        )
+        for experiment_id, index in summaries.iterator():
+            counts[experiment_id] += 1
+            if index is None:
+                continue
+            experiment_ranges = ranges[experiment_id]
+            if experiment_ranges and experiment_ranges[-1][1] + 1 >= index:
+                experiment_ranges[-1][1] = index
+            else:
+                experiment_ranges.append([index, index])
+        evaluation_results = AutoEvaluation.objects.results_for(Experiment, experiment_ids)
+
+        overviews = []
+        for experiment_id in experiment_ids:
+            index_ranges = ranges[experiment_id]
+            overview, _ = self.update_or_create(
+                experiment_id=experiment_id,
+                defaults={
+                    "summary_count": counts[experiment_id],
+                    "index_start": index_ranges[0][0] if index_ranges else None,
+                    "index_end": index_ranges[-1][1] if index_ranges else None,
+                    "index_ranges": index_ranges,
+                    "evaluation_results": evaluation_results.get(experiment_id),
+                },
+            )
+            overviews.append(overview)
+        return overviews
+
+    def refresh_results(self, experiment_ids):
+        """
+        Updates only the evaluation results of the overviews, for metric saves, which leave the summaries unchanged.
+        Experiments without an overview get a full one.
+        """
+        experiment_ids = list(experiment_ids)
+        evaluation_results = AutoEvaluation.objects.results_for(Experiment, experiment_ids)
+        existing = set(self.filter(experiment_id__in=experiment_ids).values_list("experiment_id", flat=True))
+        for experiment_id in existing:
+            self.filter(experiment_id=experiment_id).update(
+                evaluation_results=evaluation_results.get(experiment_id), updated_at=timezone.now()
+            )
+        missing = [experiment_id for experiment_id in experiment_ids if experiment_id not in existing]
+        if missing:
+            self.refresh(missing)
+
+
+class ExperimentOverview(models.Model):
+    """
+    Summary counts, indices and total evaluation results of an experiment, for the project overview.
+    The indices are stored as [first, last] ranges of consecutive indices, e.g. [[0, 99], [200, 249]].
+    Kept up to date when summaries are created or deleted and when metric results are saved.
+    """
+    experiment = models.OneToOneField(Experiment, on_delete=models.CASCADE, primary_key=True,
+                                      related_name="overview")
+    summary_count = models.PositiveIntegerField(default=0)
+    index_start = models.PositiveIntegerField(null=True, blank=True)
+    index_end = models.PositiveIntegerField(null=True, blank=True)
+    index_ranges = models.JSONField(default=list)
+    evaluation_results = models.JSONField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ExperimentOverviewManager()
@@ -1,9 +1,15 @@
 import os
+from functools import lru_cache
 from openai import OpenAI
 import tiktoken 
 from dotenv import load_dotenv
 import re
 
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name):
+    return tiktoken.encoding_for_model(model_name)
+
+
 class OpenAISummarization:
     def __init__(self, api_key=None):
         # Initialize the OpenAI client with an API key
@@ -40,7 +46,7 @@ class OpenAISummarization:
 
 
         try:
-            tokenizer = tiktoken.encoding_for_model(model_name)
+            tokenizer = get_tokenizer(model_name)
             print(f"Tokenizer for model {model_name} loaded successfully.")
         except Exception as e:
             print(f"Error loading tokenizer for model {model_name}: {e}")
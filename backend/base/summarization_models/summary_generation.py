@@ -0,0 +1,71 @@
+import os
+import threading
+
+import requests
+
+from base.evaluation.request_engine import RequestEngine
+
+OPENAI_MODELS = ('gpt-4o-mini', 'o1-mini', 'o1-preview')
+# summaries generated by a user provided API link are rate limited as one provider
+API_LINK_PROVIDER = 'api_link'
+API_LINK_TIMEOUT = float(os.getenv("API_LINK_TIMEOUT", 300))
+
+_lock = threading.Lock()
+_clients = {}  # {provider: summarization client}
+_engines = {}  # {provider: RequestEngine}
+
+
+def provider_for(model_name):
+    return 'openai' if model_name in OPENAI_MODELS else 'togetherai'
+
+
+def summarization_client(provider):
+    """One client per provider and process, shared by all generation jobs and their threads"""
+    with _lock:
+        if provider not in _clients:
+            if provider == 'openai':
+                from .open_ai_summarization import OpenAISummarization
+
+                _clients[provider] = OpenAISummarization()
+            else:
+                from .together_ai_summarization import TogetherAISummarization
+
+                _clients[provider] = TogetherAISummarization()
+        return _clients[provider]
+
+
+def request_engine(provider):
+    """
+    Concurrency and rate limit of a provider, shared by all generation jobs of a process.
+    Configured with {OPENAI,TOGETHERAI,API_LINK}_MAX_IN_FLIGHT and {OPENAI,TOGETHERAI,API_LINK}_REQUESTS_PER_MINUTE.
+    """
+    with _lock:
+        if provider not in _engines:
+            prefix = provider.upper()
+            _engines[provider] = RequestEngine(
+                max_in_flight=int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", 8)),
+                requests_per_minute=float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", 500)),
+            )
+        return _engines[provider]
+
+
+def generate_summary(model_name, prompt, full_text, context_window, max_tokens):
+    """Generates one summary with the shared client of the model's provider, within the provider's rate limit"""
+    provider = provider_for(model_name)
+    request_engine(provider).acquire()
+    return summarization_client(provider).generate_summary(model_name, prompt, full_text, context_window, max_tokens)
+
+
+def generate_summary_from_api(api_link, prompt, full_text, max_tokens):
+    """Generates one summary with a user provided API, which answers {"response": summary}"""
+    request_engine(API_LINK_PROVIDER).acquire()
+    text_content = full_text.strip()
+    payload = {
+        "prompt": f"{prompt} {text_content}",
+        "full_text": text_content,
+        "max_new_tokens": max_tokens,
+    }
+    # 192.168.0.77 needs to be replaced by actual localhost address
+    response = requests.post(api_link.replace("localhost", "192.168.0.77"), json=payload, timeout=API_LINK_TIMEOUT)
+    response.raise_for_status()
+    return response.json().get("response", "")
@@ -1,10 +1,16 @@
 import os
+from functools import lru_cache
 from together import Together
 from transformers import AutoTokenizer, LlamaTokenizerFast
 from tqdm import tqdm
 import re
 from dotenv import load_dotenv
 
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    return LlamaTokenizerFast.from_pretrained("hf-internal-testing/llama-tokenizer")
+
+
 class TogetherAISummarization:
     def __init__(self, api_key=None):
 
@@ -60,7 +66,7 @@ class TogetherAISummarization:
         print(f"Loading tokenizer for model: {model_name}")
         
         try:
-            tokenizer = LlamaTokenizerFast.from_pretrained("hf-internal-testing/llama-tokenizer")
+            tokenizer = get_tokenizer()
             print(f"Tokenizer for model: {model_name} loaded successfully.")
         except Exception as e:
             print(f"Error loading tokenizer for model {model_name}: {e}")
@@ -0,0 +1,119 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from base.models.auto_evaluation_model import AutoEvaluation
+from base.models.experiment_model import Experiment
+from base.models.fulltext_model import FullText
+from base.models.project_model import Project
+from base.models.summary_model import Summary
+from base.views.auto_evaluation_view import save_scored_results, scorable_summary_ids, score_summaries, \
+    stale_summary_ids
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def create_experiment(num_summaries):
+    user = get_user_model().objects.create_user(username="author", email="author@example.com",
+                                                password="password", first_name="A", last_name="Author")
+    project = Project.objects.create(name="project", author=user)
+    experiment = Experiment.objects.create(project=project, name="experiment")
+    for index in range(num_summaries):
+        full_text = FullText.objects.create(project=project, full_text=f"text {index}",
+                                            reference_summary=f"reference {index}", index=index)
+        Summary.objects.create(experiment=experiment, full_text=full_text, prompt="", summary=f"summary {index}",
+                               index=index)
+    return experiment
+
+
+class BulkUpsertTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.experiment = create_experiment(2)
+        cls.summary_ids = list(Summary.objects.filter(experiment=cls.experiment).values_list("pk", flat=True))
+
+    def rows(self):
+        return AutoEvaluation.objects.filter(content_type=ContentType.objects.get_for_model(Summary),
+                                             object_id__in=self.summary_ids)
+
+    def test_repeated_upserts_keep_one_row_per_object(self):
+        results = {summary_id: {"meteor": {"meteor": 0.5}} for summary_id in self.summary_ids}
+
+        AutoEvaluation.objects.bulk_upsert(Summary, results)
+        AutoEvaluation.objects.bulk_upsert(Summary, results)
+
+        self.assertEqual(self.rows().count(), len(self.summary_ids))
+        for auto_eval in self.rows():
+            self.assertEqual(auto_eval.meteor, {"meteor": 0.5})
+
+    def test_upsert_keeps_the_other_metrics(self):
+        summary_id = self.summary_ids[0]
+
+        AutoEvaluation.objects.bulk_upsert(Summary, {summary_id: {"meteor": {"meteor": 0.5}}})
+        AutoEvaluation.objects.bulk_upsert(Summary, {summary_id: {"bleu": {"bleu": 0.25}}})
+        AutoEvaluation.objects.bulk_upsert(Summary, {summary_id: {"meteor": {"meteor": 0.75}}})
+
+        auto_eval = self.rows().get(object_id=summary_id)
+        self.assertEqual(auto_eval.meteor, {"meteor": 0.75})
+        self.assertEqual(auto_eval.bleu, {"bleu": 0.25})
+
+
+def fake_evaluate_shard(metric, predictions, references, **kwargs):
+    # the score of a summary is its length, so changed texts get other scores
+    per_item = [{"meteor": float(len(prediction))} for prediction in predictions]
+    return per_item, per_item
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class IncrementalScoringTest(TestCase):
+    def setUp(self):
+        self.experiment = create_experiment(3)
+        self.summary_ids = scorable_summary_ids(self.experiment.pk)
+        handler = settings.EVALUATION_HANDLER
+        patches = [
+            mock.patch.object(handler, "metric_version", return_value="1"),
+            mock.patch.object(handler, "evaluate_shard", side_effect=fake_evaluate_shard),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.evaluate_shard = handler.evaluate_shard
+
+    def score(self, incremental):
+        """Runs the steps of calculate_and_save_metric"""
+        ids = stale_summary_ids("meteor", self.summary_ids) if incremental else self.summary_ids
+        scored = score_summaries(self.experiment.pk, "meteor", ids)
+        save_scored_results(self.experiment.pk, "meteor", self.summary_ids, scored)
+        return ids
+
+    def test_only_changed_summaries_are_rescored(self):
+        self.score(incremental=False)
+        changed = Summary.objects.get(pk=self.summary_ids[1])
+        changed.summary = "a longer summary 1"
+        changed.save()
+        self.evaluate_shard.reset_mock()
+
+        rescored = self.score(incremental=True)
+
+        self.assertEqual(rescored, [changed.pk])
+        self.evaluate_shard.assert_called_once()
+        self.assertEqual(self.evaluate_shard.call_args.args[1], ["a longer summary 1"])
+
+        results = AutoEvaluation.objects.results_for(Summary, self.summary_ids)
+        self.assertEqual(results[changed.pk]["meteor"], {"meteor": float(len("a longer summary 1"))})
+        # the total covers the summaries that were not scored again
+        total = AutoEvaluation.objects.results_for(Experiment, [self.experiment.pk])[self.experiment.pk]
+        expected = (2 * len("summary 0") + len("a longer summary 1")) / 3
+        self.assertAlmostEqual(total["meteor"]["meteor"], expected)
+
+    def test_unchanged_experiment_is_not_rescored(self):
+        self.score(incremental=False)
+        self.evaluate_shard.reset_mock()
+
+        rescored = self.score(incremental=True)
+
+        self.assertEqual(rescored, [])
+        self.evaluate_shard.assert_not_called()
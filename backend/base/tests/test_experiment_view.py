@@ -0,0 +1,59 @@
+import json
+from base64 import urlsafe_b64encode
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from base.models.experiment_model import Experiment
+from base.models.fulltext_model import FullText
+from base.models.project_model import Project
+from base.models.summary_model import Summary
+from base.views.experiment_view import encode_cursor
+
+PAGINATED_SUMMARIES_URL = "/api/experiments/get-paginated-summaries/"
+
+
+class PaginatedSummariesCursorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(username="author", email="author@example.com",
+                                                    password="password", first_name="A", last_name="Author")
+        project = Project.objects.create(name="project", author=user)
+        cls.experiment = Experiment.objects.create(project=project, name="experiment")
+        for index in range(3):
+            full_text = FullText.objects.create(project=project, full_text=f"text {index}", index=index)
+            Summary.objects.create(experiment=cls.experiment, full_text=full_text, prompt="",
+                                   summary=f"summary {index}", index=index)
+
+    def get_page(self, cursor):
+        return self.client.get(PAGINATED_SUMMARIES_URL, {
+            "experiment": self.experiment.pk, "cursor": cursor, "page_size": 2, "fields": "summary,index",
+        })
+
+    def test_garbage_cursor_returns_400(self):
+        response = self.get_page("not-a-cursor")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Invalid cursor."})
+
+    def test_cursor_with_wrong_types_returns_400(self):
+        cursor = urlsafe_b64encode(json.dumps(["0", "1"]).encode()).decode()
+
+        response = self.get_page(cursor)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_next_cursor_returns_the_following_page(self):
+        first_page = self.get_page("").json()
+        second_page = self.get_page(first_page["next_cursor"]).json()
+
+        self.assertEqual([summary["fields"]["index"] for summary in first_page["fields"]["summaries"]], [0, 1])
+        self.assertEqual([summary["fields"]["index"] for summary in second_page["fields"]["summaries"]], [2])
+        self.assertIsNone(second_page["next_cursor"])
+
+    def test_encoded_cursor_is_accepted(self):
+        summary = Summary.objects.get(experiment=self.experiment, index=0)
+
+        response = self.get_page(encode_cursor(summary))
+
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from base.models.fulltext_model import FullText
+from base.models.project_model import Project
+
+FULLTEXTS_URL = "/api/fulltexts/"
+
+
+class FullTextUploadTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username="author", email="author@example.com",
+                                                        password="password", first_name="A", last_name="Author")
+        cls.project = Project.objects.create(name="project", author=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content):
+        return self.client.post(FULLTEXTS_URL, {
+            "csv_file": SimpleUploadedFile("texts.csv", content.encode(), content_type="text/csv"),
+            "chunk_index": 0,
+            "chunk_size": 100,
+            "project": self.project.pk,
+            "full_text_column": "text",
+            "reference_summary_column": "reference",
+        }, format="multipart")
+
+    def test_valid_file_reports_the_created_rows(self):
+        response = self.upload("text,reference\nfirst text,first summary\nsecond text,second summary\n")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"created": 2})
+        self.assertEqual(FullText.objects.filter(project=self.project).count(), 2)
+
+    @override_settings(CSV_INGEST_MAX_ERRORS=2)
+    def test_every_invalid_row_is_counted(self):
+        response = self.upload("text,reference\nfirst text,a\n,b\n,c\nfourth text,d\n,e\n")
+
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertEqual(body["invalid_rows"], 3)
+        # only the details of the first CSV_INGEST_MAX_ERRORS rows are listed
+        self.assertEqual([row["row"] for row in body["rows"]], [3, 4])
+        self.assertFalse(FullText.objects.filter(project=self.project).exists())
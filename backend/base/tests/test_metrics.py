@@ -0,0 +1,75 @@
+from django.test import SimpleTestCase
+
+from base.evaluation.metrics.bleu import Bleu
+from base.evaluation.metrics.rouge import Rouge
+
+PREDICTIONS = [
+    "the cat sat on the mat and looked out of the window",
+    "a quick brown fox jumps over the lazy dog",
+    "the patients received the new treatment for six weeks",
+]
+REFERENCES = [
+    "the cat was sitting on the mat looking out of the window",
+    "the quick brown fox jumped over the lazy dog",
+    "patients were given the new treatment over six weeks",
+]
+
+
+class BleuBatchTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bleu = Bleu()
+
+    def test_per_item_scores_match_per_pair_compute(self):
+        per_item, _ = self.bleu.compute_batch(PREDICTIONS, REFERENCES)
+
+        for result, prediction, reference in zip(per_item, PREDICTIONS, REFERENCES):
+            expected = self.bleu.compute(predictions=[prediction], references=[reference])
+            self.assertAlmostEqual(result["bleu"], expected["bleu"], places=9)
+            self.assertAlmostEqual(result["brevity_penalty"], expected["brevity_penalty"], places=9)
+            for precision, expected_precision in zip(result["precisions"], expected["precisions"]):
+                self.assertAlmostEqual(precision, expected_precision, places=9)
+
+    def test_aggregate_matches_corpus_compute(self):
+        _, statistics = self.bleu.compute_batch(PREDICTIONS, REFERENCES)
+
+        total = self.bleu.aggregate(statistics)
+        expected = self.bleu.compute(predictions=PREDICTIONS, references=REFERENCES)
+        self.assertAlmostEqual(total["bleu"], expected["bleu"], places=9)
+        self.assertEqual(total["translation_length"], expected["translation_length"])
+        self.assertEqual(total["reference_length"], expected["reference_length"])
+
+    def test_aggregate_of_shards_matches_aggregate_of_all(self):
+        _, statistics = self.bleu.compute_batch(PREDICTIONS, REFERENCES)
+        _, first_shard = self.bleu.compute_batch(PREDICTIONS[:1], REFERENCES[:1])
+        _, second_shard = self.bleu.compute_batch(PREDICTIONS[1:], REFERENCES[1:])
+
+        self.assertAlmostEqual(self.bleu.aggregate(first_shard + second_shard)["bleu"],
+                               self.bleu.aggregate(statistics)["bleu"], places=12)
+
+
+class RougeBatchTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.rouge = Rouge()
+
+    def test_per_item_scores_match_per_pair_compute(self):
+        per_item, _ = self.rouge.compute_batch(PREDICTIONS, REFERENCES)
+
+        for result, prediction, reference in zip(per_item, PREDICTIONS, REFERENCES):
+            expected = self.rouge.compute(predictions=[prediction], references=[reference])
+            self.assertEqual(set(result), set(expected))
+            for rouge_type, value in expected.items():
+                self.assertAlmostEqual(result[rouge_type], float(value), places=9)
+
+    def test_aggregate_is_the_mean_of_the_per_pair_scores(self):
+        _, statistics = self.rouge.compute_batch(PREDICTIONS, REFERENCES)
+
+        total = self.rouge.aggregate(statistics)
+        expected = [self.rouge.compute(predictions=[prediction], references=[reference])
+                    for prediction, reference in zip(PREDICTIONS, REFERENCES)]
+        for rouge_type in total:
+            mean = sum(float(item[rouge_type]) for item in expected) / len(expected)
+            self.assertAlmostEqual(total[rouge_type], mean, places=9)
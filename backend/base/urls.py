@@ -2,12 +2,13 @@ from django.urls import path
 
 from .views.atomic_facts_view import AtomicFactsView
 from .views.auto_evaluation_view import AutoEvaluationView
-from .views.celery_tasks_view import task_status, get_task_id_from_cache
+from .views.celery_tasks_view import task_status, task_events, get_task_id_from_cache, cancel_task
 from .views.correlation_view import CorrelationView
 from .views.evaluation_view import EvaluationView
 from .views.experiment_view import ExperimentOwnershipView
 from .views.experiment_view import ExperimentSummaryView
 from .views.experiment_view import ExperimentView
+from .views.experiment_view import GenerateSummariesView
 from .views.fulltext_view import FullTextView
 from .views.invitation_view import InvitationView
 from .views.project_invitation_view import ProjectInvitationView
@@ -18,6 +19,7 @@ urlpatterns = [
     path('projects/', ProjectView.as_view(), name='projects'),
     path('experiments/get-by-id/', ExperimentView.get_by_experiment_id, name='experiments-by-id'),
     path('experiments/get-paginated-summaries/', ExperimentView.get_paginated_summaries, name='get_paginated_summaries'),
+    path('experiments/generate-summaries/', GenerateSummariesView.as_view(), name='experiments-generate-summaries'),
     path('experiments/', ExperimentView.as_view(), name='experiments'),
     path('fulltexts/', FullTextView.as_view(), name='fulltexts'),
     path("evaluation/", EvaluationView.as_view(), name="submit_evaluation"),
@@ -35,5 +37,7 @@ urlpatterns = [
     path("get-atomic-facts-for-paragraph/", AtomicFactsView.as_view(), name="get_atomic_facts_for_paragraph"),
     path('experiments/ownership/', ExperimentOwnershipView.as_view(), name='experiment-ownership'),
     path('tasks/<str:task_id>/status', task_status, name='task-status'),
+    path('tasks/<str:task_id>/events', task_events, name='task-events'),
+    path('tasks/<str:task_id>/cancel', cancel_task, name='task-cancel'),
     path('tasks/from-cache/<str:cache_key>', get_task_id_from_cache, name='get_task_id_from_cache'),
 ]
@@ -1,42 +1,398 @@
+import hashlib
 import json
 import traceback
 import math
-from celery import shared_task
+import time
+
+import numpy as np
+from celery import chord, group, shared_task
+from celery.exceptions import Ignore
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
 from django.http import HttpResponseServerError, JsonResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 
 from ..evaluation.celery_progress_manager import CeleryProgressManager
+from ..evaluation.evaluation_handler import UNIEVAL_DIMENSIONS
+from ..evaluation.model_pool import model_pool
+from ..evaluation.task_deliveries import check_deliveries
+from ..evaluation.task_events import publish_task_event
+from ..evaluation.task_access import events_endpoint, record_task_experiment
+from ..evaluation.task_cancellation import TaskCancelled, cancellation_request, raise_if_cancelled, register_chord
 from ..models.auto_evaluation_model import AutoEvaluation
 from ..models.experiment_model import Experiment
-from ..models.fulltext_model import FullText
+from ..models.experiment_overview_model import ExperimentOverview
 from ..models.summary_model import Summary
 
 logger = get_task_logger(__name__)
 
 
-def clean_json(data):
+def clean_json(data, replace_nan=True, nan_value=0.0):
     if isinstance(data, dict):
-        return {k: clean_json(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [clean_json(v) for v in data]
+        return {k: clean_json(v, replace_nan, nan_value) for k, v in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return [clean_json(v, replace_nan, nan_value) for v in data]
+    elif isinstance(data, np.generic):
+        # numpy scalars (e.g. np.float32 from the metric libraries) are not JSON serializable
+        return clean_json(data.item(), replace_nan, nan_value)
     elif isinstance(data, float):
-        if math.isnan(data) or math.isinf(data):
-            return 0.0
+        if replace_nan and (math.isnan(data) or math.isinf(data)):
+            return nan_value
         return data
     else:
         return data
-@shared_task(bind=True)
-def calculate_and_save_metric(self, experimentId, metric, api_key):
+
+
+# metrics whose nan results mean "no score" (e.g. an unparsable G-Eval answer, a summary without atomic facts)
+# rather than a failed computation. They are stored as None, so they cannot be mistaken for the worst score.
+MISSING_SCORE_METRICS = ("llm_evaluation", "factscore")
+
+
+def result_nan_value(metric):
+    """What nan results of the metric are stored as"""
+    return None if metric in MISSING_SCORE_METRICS else 0.0
+
+
+def scorable_summary_ids(experimentId):
+    """Ids of the summaries of an experiment that have a text, summaries whose generation failed are left out"""
+    return list(
+        Summary.objects.filter(experiment=experimentId)
+        .filter(Q(summary__gt="") | Q(generated_summary__gt=""))
+        .order_by("pk").values_list("pk", flat=True)
+    )
+
+
+def fetch_metric_inputs(summary_ids, chunk_size=None):
+    """
+    Summary texts, reference summaries and full texts of the given summaries, in the order of summary_ids.
+    Only the text columns are loaded, streamed from the database in chunks of METRIC_FETCH_CHUNK_SIZE rows.
+    """
+    chunk_size = chunk_size or settings.METRIC_FETCH_CHUNK_SIZE
+    texts = {}
+    for start in range(0, len(summary_ids), chunk_size):
+        summaries = Summary.objects.filter(pk__in=summary_ids[start:start + chunk_size]).select_related(
+            "full_text"
+        ).only(
+            "summary", "generated_summary", "full_text", "full_text__full_text", "full_text__reference_summary"
+        )
+        for summary in summaries.iterator(chunk_size=chunk_size):
+            texts[summary.pk] = (summary.summary or summary.generated_summary, summary.full_text.reference_summary,
+                                 summary.full_text.full_text)
+
+    summary_texts = [texts[summary_id][0] for summary_id in summary_ids]
+    ref_summaries = [texts[summary_id][1] for summary_id in summary_ids]
+    full_texts = [texts[summary_id][2] for summary_id in summary_ids]
+    return summary_texts, ref_summaries, full_texts
+
+
+def content_hash(metric, summary_text, reference, source):
+    """
+    Hash of the inputs a stored result of the metric depends on, including the version of the metric.
+    The unieval dimensions are not part of it, the dimensions a stored unieval result covers are kept in its state.
+    """
+    payload = [metric, settings.EVALUATION_HANDLER.metric_version(metric), summary_text, reference, source]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def scored_dims(metric, dims):
+    """The unieval dimensions scored for the requested dims, None for the other metrics"""
+    if metric != "unieval":
+        return None
+    return [dim for dim in UNIEVAL_DIMENSIONS if not dims or dim in dims]
+
+
+def merge_unieval_result(state, hash_, result):
+    """
+    Merges a unieval result of some dimensions into the stored result of the same inputs, so dimensions scored
+    before are kept. overall is the mean of the merged dimensions, as the evaluator computes it.
+    Returns the merged result and the dimensions it covers.
+    """
+    merged = dict(state["statistics"]) if state.get("hash") == hash_ else {}
+    merged.update(result)
+    dims = [dim for dim in UNIEVAL_DIMENSIONS if dim in merged]
+    merged = {dim: merged[dim] for dim in dims}
+    # unparsable scores are nan, or None once stored
+    values = [value for value in merged.values() if value is not None]
+    merged["overall"] = np.nanmean(values) if values else float("nan")
+    return merged, dims
+
+
+def load_stored_results(metric, summary_ids, chunk_size=None, lock=False):
+    """
+    {summary_id: AutoEvaluation} of the given summaries, with only the metric and metric_state loaded.
+    With lock=True the rows are locked until the end of the transaction.
+    """
+    chunk_size = chunk_size or settings.AUTO_EVALUATION_BATCH_SIZE
+    content_type = ContentType.objects.get_for_model(Summary)
+    stored = {}
+    for start in range(0, len(summary_ids), chunk_size):
+        rows = AutoEvaluation.objects.filter(
+            content_type=content_type, object_id__in=summary_ids[start:start + chunk_size]
+        ).only("object_id", metric, "metric_state").order_by("pk")  # concurrent tasks lock rows in the same order
+        if lock:
+            rows = rows.select_for_update()
+        for auto_eval in rows:
+            stored[auto_eval.object_id] = auto_eval
+    return stored
+
+
+def stale_summary_ids(metric, summary_ids, dims=None):
+    """Summaries without a stored result of the metric, or whose stored result was computed on other inputs"""
+    summary_texts, ref_summaries, full_texts = fetch_metric_inputs(summary_ids)
+    stored = load_stored_results(metric, summary_ids)
+    stale_ids = []
+    for summary_id, summary_text, reference, source in zip(summary_ids, summary_texts, ref_summaries, full_texts):
+        auto_eval = stored.get(summary_id)
+        state = auto_eval.metric_state.get(metric, {}) if auto_eval is not None else {}
+        if state.get("hash") != content_hash(metric, summary_text, reference, source):
+            stale_ids.append(summary_id)
+        elif metric == "unieval" and not set(scored_dims(metric, dims)) <= set(state.get("dims", [])):
+            # the stored result does not cover all requested dimensions
+            stale_ids.append(summary_id)
+    return stale_ids
+
+
+def checkpoint_key(experimentId, metric, hash_, dims=None):
+    # checkpoints are kept per experiment, so tasks of other experiments with the same texts neither resume from nor
+    # delete them
+    if metric == "unieval":
+        # a checkpoint holds the scores of the dimensions that were requested
+        return f'metric_checkpoint:{experimentId}:{metric}:{hash_}:{",".join(scored_dims(metric, dims))}'
+    return f'metric_checkpoint:{experimentId}:{metric}:{hash_}'
+
+
+def score_summaries(experimentId, metric, summary_ids, api_key=None, dims=None, progress_callback=None, chunk_size=None,
+                    cancel_task_id=None):
+    """
+    Scores the given summaries of an experiment.
+    The results are checkpointed in the Django cache every METRIC_CHECKPOINT_CHUNK_SIZE summaries, under the
+    experiment and the content hash of the summary. Summaries that already have a checkpoint, e.g. from a task whose
+    worker died, are not scored again, so a retried or resubmitted task resumes where the last one stopped.
+    If the cancellation of cancel_task_id is requested, TaskCancelled is raised with the summaries scored so far.
+    Returns a [summary_id, result, statistics, content hash] list per summary, which can be sent through the broker.
+    """
+    if not summary_ids:
+        return []
+    chunk_size = chunk_size or settings.METRIC_CHECKPOINT_CHUNK_SIZE
+    summary_texts, ref_summaries, full_texts = fetch_metric_inputs(summary_ids)
+    hashes = [content_hash(metric, summary_text, reference, source)
+              for summary_text, reference, source in zip(summary_texts, ref_summaries, full_texts)]
+    keys = [checkpoint_key(experimentId, metric, hash_, dims=dims) for hash_ in hashes]
+
+    checkpoints = cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in checkpoints]
+    done = len(keys) - len(missing)
+    if done:
+        logger.info(f"Resuming {metric}: {done} of {len(keys)} summaries were scored before")
+
+    def scored_so_far():
+        scored = [[summary_id, *checkpoints[key], hash_]
+                  for summary_id, key, hash_ in zip(summary_ids, keys, hashes) if key in checkpoints]
+        # the statistics keep nan values, so that merging them gives the same corpus score as scoring all at once
+        return clean_json(scored, replace_nan=False)
+
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        raise_if_cancelled(cancel_task_id, scored_so_far)
+        last_cancel_check = time.monotonic()
+
+        def update_progress(chunk_done, chunk_total, offset=done):
+            # metrics that report progress per item (FactScore) can also be stopped within a chunk. Like the progress
+            # updates, the cancellation is looked up at most every PROGRESS_UPDATE_MIN_INTERVAL seconds.
+            nonlocal last_cancel_check
+            if cancel_task_id is not None \
+                    and time.monotonic() - last_cancel_check >= settings.PROGRESS_UPDATE_MIN_INTERVAL:
+                last_cancel_check = time.monotonic()
+                raise_if_cancelled(cancel_task_id, scored_so_far)
+            if progress_callback is not None:
+                progress_callback(offset + chunk_done, len(keys))
+
+        results, statistics = settings.EVALUATION_HANDLER.evaluate_shard(
+            metric, [summary_texts[i] for i in chunk], [ref_summaries[i] for i in chunk],
+            sources=[full_texts[i] for i in chunk], api_key=api_key, progress_callback=update_progress, dims=dims
+        )
+        chunk_checkpoints = {keys[i]: (result, stats) for i, result, stats in zip(chunk, results, statistics)}
+        cache.set_many(chunk_checkpoints, settings.METRIC_CHECKPOINT_TIMEOUT)
+        checkpoints.update(chunk_checkpoints)
+        done += len(chunk)
+        if progress_callback is not None:
+            progress_callback(done, len(keys))
+
+    return scored_so_far()
+
+
+def save_scored_results(experimentId, metric, summary_ids, scored, save_total=True, dims=None, refresh_overview=True):
+    """
+    Saves the results of the scored summaries and the total result of the experiment.
+    The total is merged from the statistics of all summaries, the ones that were not scored again included.
+    With save_total=False only the results of the scored summaries are saved.
+    Callers that save several metrics pass refresh_overview=False and refresh the experiment overview once.
+    unieval results of a subset of the dimensions are merged into the stored results, see merge_unieval_result.
+    """
+    scored = {summary_id: (result, stats, hash_) for summary_id, result, stats, hash_ in scored}
+    with transaction.atomic():
+        stored = load_stored_results(metric, summary_ids, lock=True)
+        statistics, updates = [], {}
+        for summary_id in summary_ids:
+            if summary_id not in scored:
+                statistics.append(stored[summary_id].metric_state[metric]["statistics"])
+                continue
+            result, stats, hash_ = scored[summary_id]
+            metric_state = dict(stored[summary_id].metric_state) if summary_id in stored else {}
+            # nan is not valid JSON, unparsable scores are kept as None so they stay out of the total
+            if metric == "unieval":
+                # the per summary results are the statistics of unieval
+                result, merged_dims = merge_unieval_result(metric_state.get(metric, {}), hash_, result)
+                stats = result
+                metric_state[metric] = {"hash": hash_, "dims": merged_dims,
+                                        "statistics": clean_json(stats, nan_value=None)}
+            else:
+                metric_state[metric] = {"hash": hash_, "statistics": clean_json(stats, nan_value=None)}
+            statistics.append(stats)
+            updates[summary_id] = {metric: clean_json(result, nan_value=result_nan_value(metric)),
+                                   "metric_state": metric_state}
+
+        if save_total:
+            total = settings.EVALUATION_HANDLER.merge_statistics(metric, statistics)
+            AutoEvaluation.objects.bulk_upsert(
+                Experiment, {experimentId: {metric: clean_json(total, nan_value=result_nan_value(metric))}}
+            )
+            if refresh_overview:
+                ExperimentOverview.objects.refresh_results([experimentId])
+        AutoEvaluation.objects.bulk_upsert(Summary, updates)
+
+        # the results are saved now, their checkpoints are dropped once the transaction is committed
+        checkpoint_keys = [checkpoint_key(experimentId, metric, hash_, dims=dims) for _, _, hash_ in scored.values()]
+        transaction.on_commit(lambda: cache.delete_many(checkpoint_keys))
+
+
+def handle_task_failure(task, pm, e):
+    if pm is not None:
+        pm.handle_failure(e)
+    else:
+        task.update_state(
+            state='FAILURE',
+            meta={
+                'error': str(e),
+                'message': 'Failed during evaluation',
+                'exc_type': type(e).__name__,
+                'exc_message': e.__str__(),
+            }
+        )
+
+
+def finish_cancelled_metric(experimentId, metric, scored, save_partial, dims=None):
+    """Saves the results a cancelled metric scored so far if save_partial is set, otherwise drops their checkpoints"""
+    if not scored:
+        return
+    if save_partial:
+        # the experiment total is left as it was, it would only cover part of the summaries
+        save_scored_results(experimentId, metric, [item[0] for item in scored], scored, save_total=False, dims=dims)
+    else:
+        cache.delete_many([checkpoint_key(experimentId, metric, hash_, dims=dims) for _, _, _, hash_ in scored])
+
+
+def mark_cancelled(task, task_id):
+    # marks the task the client polls as revoked
+    task.backend.mark_as_revoked(task_id, reason='cancelled')
+    publish_task_event(task_id, 'REVOKED')
+
+
+def handle_task_cancellation(task, experimentId, metric, e, dims=None):
+    """
+    Saves or discards the results a cancelled task scored so far, frees the memory the task held and marks the task
+    the client polls as revoked.
+    """
+    request = cancellation_request(e.task_id) or {}
+    finish_cancelled_metric(experimentId, metric, e.scored, request.get('save_partial', False), dims=dims)
+    model_pool.collect()
+    mark_cancelled(task, e.task_id)
+    logger.info(f"Cancelled {metric} for experiment {experimentId}, {len(e.scored)} summaries were scored")
+
+
+def handle_chord_cancellation(task, experimentId, metrics, metric_results, dims=None):
+    """
+    Called by chord callbacks, which run even if the chord was cancelled, as the cancelled subtasks return the
+    results they scored so far. Returns False if the chord was not cancelled, otherwise the partial results of all
+    subtasks are saved or discarded, including the ones of subtasks that finished before the cancellation.
+    """
+    request = cancellation_request(task.request.id)
+    if request is None:
+        return False
+    with transaction.atomic():
+        for metric, scored in zip(metrics, metric_results):
+            finish_cancelled_metric(experimentId, metric, scored, request.get('save_partial', False), dims=dims)
+    mark_cancelled(task, task.request.id)
+    logger.info(f"Cancelled {', '.join(sorted(set(metrics)))} for experiment {experimentId}, "
+                f"{sum(len(scored) for scored in metric_results)} results were scored")
+    return True
+
+
+def sharded_phases(num_shards):
+    phases = {
+        'fetch_summaries': {
+            'name': 'Fetch Summaries',
+            'message': 'Fetching summaries',
+            'weight': 0.1,
+            'steps': None,
+        },
+        'update_database': {
+            'name': 'Update Database',
+            'message': 'Saving results',
+            'weight': 0.1,
+            'steps': None,
+        }
+    }
+    for shard in range(num_shards):
+        phases[f'calculate_metrics_shard_{shard}'] = {
+            'name': f'Calculate Metrics: shard {shard + 1}/{num_shards}',
+            'message': 'Calculating metrics',
+            'weight': 0.8 / num_shards,
+            'steps': None,
+        }
+    return phases
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def calculate_and_save_metric(self, experimentId, metric, api_key, dims=None, incremental=False):
+    """
+    Scores the summaries of an experiment and saves the results.
+    With incremental=True only summaries whose inputs changed since their result was stored are scored again.
+    """
     pm = None
     cache_key = f'{experimentId}'
 
     try:
+        check_deliveries(self)
+        summary_ids = scorable_summary_ids(experimentId)
+        stale_ids = stale_summary_ids(metric, summary_ids, dims=dims) if incremental else summary_ids
+
+        # large experiments are split into shards that are scored by separate tasks and merged by a chord callback
+        shard_size = settings.METRIC_SHARD_SIZE
+        if shard_size and len(stale_ids) > shard_size:
+            shards = [stale_ids[start:start + shard_size] for start in range(0, len(stale_ids), shard_size)]
+            phases = sharded_phases(len(shards))
+            pm = CeleryProgressManager(self, phases, task_id=self.request.id)
+            pm.enter_phase('fetch_summaries')
+            pm.exit_phase('fetch_summaries')
+
+            header = group(
+                calculate_metric_shard.s(experimentId, metric, api_key, shard_ids, shard, self.request.id, phases,
+                                         dims=dims)
+                for shard, shard_ids in enumerate(shards)
+            )
+            callback = merge_metric_shards.s(experimentId, metric, summary_ids, phases, dims=dims)
+            if not register_chord(self.request.id):
+                raise TaskCancelled(self.request.id)
+            # the callback takes over the id of this task, so clients keep polling the same task id
+            raise self.replace(chord(header, callback))
+
         phases = {
             'fetch_summaries': {
                 'name': 'Fetch Summaries',
@@ -67,82 +423,100 @@ def calculate_and_save_metric(self, experimentId, metric, api_key):
         pm = CeleryProgressManager(self, phases)
 
         pm.enter_phase('fetch_summaries')
-        pm.update_phase('fetch_summaries', 1)
-
-        experiment = Experiment.objects.get(pk=experimentId)
-        summaries = Summary.objects.filter(experiment=experimentId)
-        summary_texts = summaries.values_list("summary", flat=True)
-        ref_summaries = [FullText.objects.get(pk=summary.full_text.pk).reference_summary for summary in summaries]
-
         pm.exit_phase('fetch_summaries')
 
         pm.enter_phase('calculate_metrics')
         pm.update_phase('calculate_metrics', 1)
 
-        if metric == "unieval":
-            full_texts = [FullText.objects.get(pk=summary.full_text.pk).full_text for summary in summaries]
-            evaluation_results = settings.EVALUATION_HANDLER.function_map[metric](summary_texts, ref_summaries,
-                                                                                  full_texts)
-        elif metric == "factscore":
+        if metric == "factscore":
             pm.enter_phase('calculate_metrics_factscore')
-            full_texts = [FullText.objects.get(pk=summary.full_text.pk).full_text for summary in summaries]
-            evaluation_results = settings.EVALUATION_HANDLER.function_map[metric](full_texts, list(summary_texts), pm)
-            pm.exit_phase('calculate_metrics_factscore')
 
-        elif metric == "llm_evaluation":
-            full_texts = [FullText.objects.get(pk=summary.full_text.pk).full_text for summary in summaries]
-            evaluation_results = settings.EVALUATION_HANDLER.function_map[metric](api_key, full_texts, summary_texts)
+            def update_progress(done, total):
+                pm.update_phase('calculate_metrics_factscore', done, total_steps=total)
+
+            scored = score_summaries(experimentId, metric, stale_ids, progress_callback=update_progress,
+                                     cancel_task_id=self.request.id)
+            pm.exit_phase('calculate_metrics_factscore')
         else:
-            evaluation_results = settings.EVALUATION_HANDLER.function_map[metric](summary_texts, ref_summaries)
+            scored = score_summaries(experimentId, metric, stale_ids, api_key=api_key, dims=dims,
+                                     cancel_task_id=self.request.id)
 
         pm.exit_phase('calculate_metrics')
 
         pm.enter_phase('update_database')
         pm.update_phase('update_database', 1)
-        # Save total evaluation results to experiment
-        auto_eval_total = AutoEvaluation.objects.filter(content_type=ContentType.objects.get_for_model(Experiment),
-                                                        object_id=experiment.pk).first()
-        if not auto_eval_total:
-            auto_eval_total = AutoEvaluation.objects.create(
-                content_type=ContentType.objects.get_for_model(Experiment),
-                object_id=experimentId,
-            )
-        evaluation_results = clean_json(evaluation_results)
-        setattr(auto_eval_total, metric, evaluation_results[0])
-        auto_eval_total.save()
-
-        # Save individual evaluation results to summaries
-        for i, summary in enumerate(summaries):
-            pm.update_phase('update_database', 1, total_steps=len(summaries))
-            # Save total evaluation results to experiment
-            auto_eval = AutoEvaluation.objects.filter(content_type=ContentType.objects.get_for_model(Summary),
-                                                      object_id=summary.pk).first()
-            if not auto_eval:
-                auto_eval = AutoEvaluation.objects.create(
-                    content_type=ContentType.objects.get_for_model(Summary),
-                    object_id=summary.pk,
-                )
-            setattr(auto_eval, metric, evaluation_results[i + 1])
-            auto_eval.save()
-
+        save_scored_results(experimentId, metric, summary_ids, scored, dims=dims)
         pm.exit_phase('update_database')
         cache.delete(cache_key)
 
+    except Ignore:
+        # raised by self.replace, the chord callback deletes the cache key
+        raise
+    except TaskCancelled as e:
+        handle_task_cancellation(self, experimentId, metric, e, dims=dims)
+        cache.delete(cache_key)
+        raise Ignore()
     except Exception as e:
         logger.error(f"Error in calculate_and_save_metric for experiment {experimentId} and metric {metric}: {str(e)}")
+        handle_task_failure(self, pm, e)
+        cache.delete(cache_key)
+        raise
 
-        if pm is not None:
-            pm.handle_failure(e)
-        else:
-            self.update_state(
-                state='FAILURE',
-                meta={
-                    'error': str(e),
-                    'message': 'Failed during evaluation',
-                    'exc_type': type(e).__name__,
-                    'exc_message': e.__str__(),
-                }
-            )
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def calculate_metric_shard(self, experimentId, metric, api_key, summary_ids, shard, parent_task_id, phases,
+                           dims=None):
+    pm = None
+    phase_id = f'calculate_metrics_shard_{shard}'
+    try:
+        pm = CeleryProgressManager(self, phases, task_id=parent_task_id)
+        check_deliveries(self)
+        pm.enter_phase(phase_id)
+
+        def update_progress(done, total):
+            pm.update_phase(phase_id, done, total_steps=total)
+
+        scored = score_summaries(experimentId, metric, summary_ids, api_key=api_key, dims=dims,
+                                 progress_callback=update_progress, cancel_task_id=parent_task_id)
+
+        pm.exit_phase(phase_id)
+        return scored
+
+    except TaskCancelled as e:
+        # the chord callback saves or discards the results of all shards
+        model_pool.collect()
+        return e.scored
+    except Exception as e:
+        logger.error(f"Error in calculate_metric_shard {shard} for experiment {experimentId} and metric {metric}: "
+                     f"{str(e)}")
+        handle_task_failure(self, pm, e)
+        cache.delete(f'{experimentId}')
+        raise
+
+
+@shared_task(bind=True)
+def merge_metric_shards(self, shard_results, experimentId, metric, summary_ids, phases, dims=None):
+    pm = None
+    cache_key = f'{experimentId}'
+    try:
+        if handle_chord_cancellation(self, experimentId, [metric] * len(shard_results), shard_results, dims=dims):
+            cache.delete(cache_key)
+            raise Ignore()
+
+        pm = CeleryProgressManager(self, phases, task_id=self.request.id)
+        pm.enter_phase('update_database')
+
+        # the corpus score is built from the merged statistics, not from the shard totals
+        scored = [item for shard in shard_results for item in shard]
+        save_scored_results(experimentId, metric, summary_ids, scored, dims=dims)
+        pm.exit_phase('update_database')
+        cache.delete(cache_key)
+
+    except Ignore:
+        raise
+    except Exception as e:
+        logger.error(f"Error in merge_metric_shards for experiment {experimentId} and metric {metric}: {str(e)}")
+        handle_task_failure(self, pm, e)
         cache.delete(cache_key)
         raise
 
@@ -158,13 +532,22 @@ class AutoEvaluationView(APIView):
             metric = data["metric"]
             api_key = data["api_key"]
             experimentId = data["experiment"]
+            # optional subset of the unieval dimensions, e.g. ["coherence", "fluency"]
+            dims = data.get("dims") or None
+            if dims is not None and (not isinstance(dims, list) or any(dim not in UNIEVAL_DIMENSIONS for dim in dims)):
+                return JsonResponse({'error': f'dims must be a list of the dimensions '
+                                              f'{", ".join(UNIEVAL_DIMENSIONS)}, got {dims}'}, status=400)
+            # only score summaries that are new or changed since the metric was last computed
+            incremental = bool(data.get("incremental", False))
 
-            task = calculate_and_save_metric.delay(experimentId, metric, api_key)
+            task = calculate_and_save_metric.delay(experimentId, metric, api_key, dims=dims, incremental=incremental)
             # cache the task_id with the experiment_id as the key
             cache.set(f'{experimentId}', task.id, 60 * 60 * 24)
+            record_task_experiment(task.id, experimentId)
 
             return JsonResponse({'task_id': task.id,
                                  'status_endpoint': f'/api/tasks/{task.id}/status/',
+                                 'events_endpoint': events_endpoint(task.id, request.user),
                                  'monitoring_interval': 5000
                                  }, status=201)
         except AutoEvaluation.DoesNotExist:
@@ -1,8 +1,20 @@
+import json
+
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from celery import states
 from celery.result import AsyncResult
+from django.conf import settings
 from django.core.cache import cache
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view
 
+from ..evaluation.task_access import can_access_task, events_endpoint, events_token_user
+from ..evaluation.task_cancellation import is_chord, request_cancellation
+from ..evaluation.task_events import channel_name, status_event
+
 
 @api_view(["GET"])
 def task_status(request, task_id):
@@ -11,13 +23,7 @@ def task_status(request, task_id):
         task = AsyncResult(task_id)
 
         if task.state == 'PROGRESS':
-            meta = task.info
-            response = {
-                'state': task.state,
-                'progress': meta['total_progress'],
-                'active_phases': meta.get('active_phases', []),
-                'completed_phases': meta.get('completed_phases', [])
-            }
+            response = status_event(task.state, task.info)
         else:
             response = {
                 'state': task.state,
@@ -33,6 +39,87 @@ def task_status(request, task_id):
         )
 
 
+def current_task_event(task_id):
+    task = AsyncResult(task_id)
+    if task.state == 'PROGRESS':
+        return status_event(task.state, task.info)
+    return status_event(task.state, str(task.info) if task.failed() else None,
+                        task.result if task.successful() else None)
+
+
+def format_event(event):
+    return f"data: {json.dumps(event, default=str)}\n\n"
+
+
+async def stream_task_events(task_id):
+    client = redis.asyncio.Redis.from_url(settings.TASK_EVENTS_REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        # subscribe before reading the current state, so no update is missed in between
+        await pubsub.subscribe(channel_name(task_id))
+        event = await sync_to_async(current_task_event)(task_id)
+        yield format_event(event)
+
+        while event['state'] not in states.READY_STATES:
+            message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                               timeout=settings.TASK_EVENTS_KEEPALIVE)
+            if message is None:
+                # keeps proxies from closing the idle connection
+                yield ": keepalive\n\n"
+                continue
+            event = json.loads(message['data'])
+            yield format_event(event)
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+
+def stream_task_events_sync(task_id):
+    # WSGI servers (e.g. runserver in development) would read an async stream to the end before sending it. Every
+    # open stream holds a server thread here, deployments serve the app with uvicorn (see the Dockerfile)
+    client = redis.Redis.from_url(settings.TASK_EVENTS_REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        pubsub.subscribe(channel_name(task_id))
+        event = current_task_event(task_id)
+        yield format_event(event)
+
+        while event['state'] not in states.READY_STATES:
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=settings.TASK_EVENTS_KEEPALIVE)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            event = json.loads(message['data'])
+            yield format_event(event)
+    finally:
+        pubsub.close()
+        client.close()
+
+
+def task_events(request, task_id):
+    """
+    Server-Sent Events stream of a task, an alternative to polling task_status.
+    The first event is the current status, followed by every update the workers publish, in the format of task_status.
+    The stream ends after SUCCESS, FAILURE or REVOKED. Under ASGI the stream does not hold a thread per client.
+    EventSource cannot send the JWT, the stream is opened with the signed token of events_endpoint instead.
+    """
+    user = events_token_user(request.GET.get('token', ''), task_id)
+    if user is None:
+        return JsonResponse({'error': 'Invalid or expired events token'}, status=401)
+    if not can_access_task(user, task_id):
+        return JsonResponse({'error': 'Unauthorized access'}, status=403)
+
+    if isinstance(request, ASGIRequest):
+        events = stream_task_events(task_id)
+    else:
+        events = stream_task_events_sync(task_id)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # disables response buffering in nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(["GET"])
 def get_task_id_from_cache(request, cache_key):
     task_id = cache.get(cache_key)
@@ -42,5 +129,48 @@ def get_task_id_from_cache(request, cache_key):
             {'error': f'Task ID not found in cache'},
             status=404
         )
+    if not can_access_task(request.user, task_id):
+        return JsonResponse({'error': 'Unauthorized access'}, status=403)
+
+    return JsonResponse({'task_id': task_id, 'events_endpoint': events_endpoint(task_id, request.user)})
+
+
+@api_view(["POST"])
+def cancel_task(request, task_id):
+    """
+    Cancels a task. A queued task is revoked, a running metric task stops before its next batch of summaries.
+    With {"save_partial": true} the results scored so far are saved, otherwise they are discarded.
+    Tasks that were replaced by a chord are not revoked: every subtask of the chord checks the cancellation of this
+    task id, returns what it scored so far, and the chord callback, which keeps the task id, saves or discards the
+    results of all subtasks.
+    Only the author of, or users invited to, the project of the task's experiment can cancel it.
+    """
+    try:
+        if not can_access_task(request.user, task_id):
+            return JsonResponse({'error': 'Unauthorized access'}, status=403)
+
+        data = json.loads(request.body) if request.body else {}
+        save_partial = bool(data.get('save_partial', False))
 
-    return JsonResponse({'task_id': task_id})
+        task = AsyncResult(task_id)
+        if task.ready():
+            return JsonResponse(
+                {'error': f'Task already finished with state {task.state}'},
+                status=409
+            )
+
+        # the cancellation is requested before looking for a chord, see register_chord
+        request_cancellation(task_id, save_partial=save_partial)
+        if not is_chord(task_id):
+            task.revoke()
+
+        return JsonResponse({'task_id': task_id,
+                             'state': 'CANCELLING',
+                             'save_partial': save_partial,
+                             'status_endpoint': f'/api/tasks/{task_id}/status/'
+                             }, status=202)
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Invalid task ID or backend issue: {str(e)}'},
+            status=400
+        )
@@ -30,9 +30,11 @@ metrics_map = {
 llm_metrics = ["Fluency", "Domain_Adaptation", "Coherence"]
 
 
-# Helper function to calculate the geometric mean of a list of numbers
+# Helper function to calculate the geometric mean of a list of numbers, missing (None) scores are left out
 def geo_mean(iterable):
-    a = np.array(iterable)
+    a = np.array([value for value in iterable if value is not None], dtype=float)
+    if len(a) == 0:
+        return None
     return a.prod() ** (1.0 / len(a))
 
 
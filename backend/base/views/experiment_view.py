@@ -1,7 +1,9 @@
-import csv
+import binascii
 import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 
-from celery import shared_task
+from celery import chord, group, shared_task
+from celery.exceptions import Ignore
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
@@ -9,6 +11,7 @@ from django.core.cache import cache
 from django.core.paginator import Paginator
 from django.core.serializers import serialize
 from django.db import transaction, IntegrityError
+from django.db.models import F, Q
 from django.http import HttpResponse, HttpResponseServerError, JsonResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -17,194 +20,312 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from base.models.project_invite_model import ProjectInvite
+from .auto_evaluation_view import (handle_chord_cancellation, handle_task_failure, mark_cancelled, save_scored_results,
+                                   scorable_summary_ids, score_summaries)
+from ..csv_ingest import CSVIngestError, ingest_csv
 from ..evaluation.celery_progress_manager import CeleryProgressManager
-from ..models.auto_evaluation_model import AutoEvaluation
+from ..evaluation.model_pool import model_pool
+from ..evaluation.task_access import events_endpoint, record_task_experiment
+from ..evaluation.task_deliveries import check_deliveries
+from ..evaluation.task_cancellation import TaskCancelled, register_chord
+from ..models.auto_evaluation_model import AutoEvaluation, RESULT_FIELDS
 from ..models.experiment_model import Experiment
+from ..models.experiment_overview_model import ExperimentOverview
 from ..models.fulltext_model import FullText
 from ..models.project_model import Project
 from ..models.summary_model import Summary
-from ..summarization_models.open_ai_summarization import OpenAISummarization
-from ..summarization_models.together_ai_summarization import TogetherAISummarization
+from ..summarization_models.summary_generation import (API_LINK_PROVIDER, generate_summary, generate_summary_from_api,
+                                                       provider_for, request_engine)
 
 logger = get_task_logger(__name__)
 
 
+def metric_phases(eval_metrics):
+    phases = {
+        f'calculate_metrics_{metric}': {
+            'name': f'Calculate Metric: {metric}',
+            'message': f'Calculating Metric: {metric}',
+            'weight': 0.8 / len(eval_metrics),  # assume equal weight for each metric
+            'steps': None
+        } for metric in eval_metrics
+    }
+    phases['save_results'] = {
+        'name': 'Save results',
+        'message': 'Saving total and individual results',
+        'weight': 0.2,
+        'steps': len(eval_metrics)
+    }
+    return phases
+
+
+@shared_task(bind=True)
+def calculate_metrics(self, eval_metrics, experimentId, api_key):
+    """
+    Computes every metric in its own subtask, so the metrics run in parallel on the worker pool.
+    A chord callback saves the results once all metrics are done.
+    Only ids are sent through the broker, the subtasks load the texts from the database.
+    """
+    summary_ids = scorable_summary_ids(experimentId)
+    if not summary_ids:
+        cache.delete(experimentId)
+        return {'unscored_summaries': list(Summary.objects.filter(experiment=experimentId).order_by("pk")
+                                           .values_list("pk", flat=True))}
+    phases = metric_phases(eval_metrics)
+    header = group(
+        calculate_metric.s(metric, experimentId, summary_ids, api_key, self.request.id, phases)
+        for metric in eval_metrics
+    )
+    callback = save_metric_results.s(eval_metrics, summary_ids, experimentId, phases)
+    if not register_chord(self.request.id):
+        mark_cancelled(self, self.request.id)
+        cache.delete(experimentId)
+        raise Ignore()
+    # the callback takes over the id of this task, so clients keep polling the same task id for progress and result
+    raise self.replace(chord(header, callback))
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def calculate_metric(self, metric, experimentId, summary_ids, api_key, parent_task_id, phases):
+    pm = None
+    try:
+        # the progress of all metric subtasks is aggregated on the parent task id
+        pm = CeleryProgressManager(self, phases, task_id=parent_task_id)
+        check_deliveries(self)
+        pm.enter_phase(f'calculate_metrics_{metric}')
+
+        def update_progress(done, total):
+            pm.update_phase(f'calculate_metrics_{metric}', done, total_steps=total)
+
+        pm.update_phase(f'calculate_metrics_{metric}', 1)
+        scored = score_summaries(experimentId, metric, summary_ids, api_key=api_key, progress_callback=update_progress,
+                                 cancel_task_id=parent_task_id)
+
+        pm.exit_phase(f'calculate_metrics_{metric}')
+        return scored
+
+    except TaskCancelled as e:
+        # the chord callback saves or discards the results of all metrics
+        model_pool.collect()
+        return e.scored
+    except Exception as e:
+        logger.error(f"Error in calculate_metric for experiment {experimentId} and metric {metric}: {str(e)}")
+        handle_task_failure(self, pm, e)
+        cache.delete(experimentId)
+        raise
+
+
 @shared_task(bind=True)
-def calculate_metrics(self, eval_metrics, summary_texts, summary_ids, ref_summaries, full_texts, experimentId, api_key):
+def save_metric_results(self, metric_results, eval_metrics, summary_ids, experimentId, phases):
     pm = None
     cache_key = experimentId
     try:
+        if handle_chord_cancellation(self, experimentId, eval_metrics, metric_results):
+            cache.delete(cache_key)
+            raise Ignore()
+
+        pm = CeleryProgressManager(self, phases, task_id=self.request.id)
+        pm.enter_phase('save_results')
+        # all results are saved in one transaction, with the content hashes that incremental runs compare against
+        with transaction.atomic():
+            # chord results are ordered like the header, i.e. like eval_metrics
+            for i, (metric, scored) in enumerate(zip(eval_metrics, metric_results)):
+                save_scored_results(experimentId, metric, summary_ids, scored, refresh_overview=False)
+                pm.update_phase('save_results', i + 1)
+            ExperimentOverview.objects.refresh_results([experimentId])
+        pm.exit_phase('save_results')
+        cache.delete(cache_key)
+        # summaries whose generation failed are not scored, generate_summaries can be run again for them
+        return {'unscored_summaries': sorted(
+            set(Summary.objects.filter(experiment=experimentId).values_list("pk", flat=True)) - set(summary_ids)
+        )}
+
+    except Ignore:
+        raise
+    except Exception as e:
+        logger.error(f"Error in save_metric_results for experiment {experimentId}: {str(e)}")
+        handle_task_failure(self, pm, e)
+        cache.delete(cache_key)
+        raise
+
+
+@shared_task(bind=True)
+def generate_summaries(self, experimentId, eval_metrics=None, api_key=None, api_link=None):
+    """
+    Generates the missing summaries of an experiment with concurrent API calls, rate limited per provider.
+    With api_link the summaries are generated by that API instead of their summarization model.
+    The summaries are saved with bulk_update after every chunk of SUMMARY_GENERATION_CHUNK_SIZE summaries.
+    With eval_metrics the metrics are computed afterwards, under the same task id, on the summaries that were
+    generated. Otherwise the ids of the summaries that failed are returned. The task can be run again for them, see
+    GenerateSummariesView.
+    """
+    pm = None
+    cache_key = f'{experimentId}'
+    try:
+        experiment = Experiment.objects.get(pk=experimentId)
+        summaries = Summary.objects.filter(experiment=experimentId).filter(
+            Q(generated_summary__isnull=True) | Q(generated_summary="")
+        )
+        if not api_link:
+            summaries = summaries.filter(summarization_model__gt="")
+        summaries = list(summaries.select_related("full_text").order_by("index"))
         phases = {
-            f'calculate_metrics_{metric}': {
-                'name': f'Calculate Metric: {metric}',
-                'message': f'Calculating Metric: {metric}',
-                'weight': 0.8 / len(eval_metrics),  # assume equal weight for each metric
-                'steps': None
-            } for i, metric in enumerate(eval_metrics)
+            'generate_summaries': {
+                'name': 'Generate Summaries',
+                'message': 'Generating summaries',
+                'weight': 1.0,
+                'steps': len(summaries) or None,
+            }
         }
-        phases['save_total_results'] = {
-            'name': 'Save total results',
-            'message': 'Saving total results',
-            'weight': 0.1,
-            'steps': None
-        }
-        phases['save_individual_results'] = {
-            'name': 'Save individual results',
-            'message': 'Saving individual results',
-            'weight': 0.1,
-            'steps': None
-        }
-
         pm = CeleryProgressManager(self, phases)
+        pm.enter_phase('generate_summaries')
 
-        # Evaluate the summary and store the results
-        auto_eval_results = {}
-        for i, metric in enumerate(eval_metrics):
-            pm.enter_phase(f'calculate_metrics_{metric}')
-            pm.update_phase(f'calculate_metrics_{metric}', (i + 1))
-
-            if metric == "unieval":
-                auto_eval_results[metric] = settings.EVALUATION_HANDLER.function_map[metric](summary_texts,
-                                                                                             ref_summaries, full_texts)
-            elif metric == "llm_evaluation":
-                auto_eval_results[metric] = settings.EVALUATION_HANDLER.function_map[metric](api_key, full_texts,
-                                                                                             summary_texts)
-            elif metric == "factscore":
-                auto_eval_results[metric] = settings.EVALUATION_HANDLER.function_map[metric](full_texts,
-                                                                                             summary_texts,
-                                                                                             pm)
-            else:
-                auto_eval_results[metric] = settings.EVALUATION_HANDLER.function_map[metric](summary_texts,
-                                                                                             ref_summaries)
-            pm.exit_phase(f'calculate_metrics_{metric}')
-
-        # Store total results in the experiment
-        pm.enter_phase('save_total_results')
-        pm.update_phase('save_total_results', 1)
-        total_eval_results = {k: v[0] for k, v in auto_eval_results.items()}
-        AutoEvaluation.objects.create(
-            content_type=ContentType.objects.get_for_model(Experiment),
-            object_id=experimentId,
-            **total_eval_results
-        )
-        pm.exit_phase('save_total_results')
-
-        # Store individual results in the summaries
-        pm.enter_phase('save_individual_results')
-
-        for i, summary_id in enumerate(summary_ids):
-            pm.update_phase('save_individual_results', (i + 1), len(summary_ids))
-            # Update progress state every 1% progress or 10 steps to prevent frequent writes to celery backend
-            single_eval_results = {k: v[i + 1] for k, v in auto_eval_results.items()}
-            AutoEvaluation.objects.create(
-                content_type=ContentType.objects.get_for_model(Summary),
-                object_id=summary_id,
-                **single_eval_results
-            )
-        pm.exit_phase('save_individual_results')
+        def generate(summary):
+            try:
+                if api_link:
+                    return generate_summary_from_api(api_link, summary.prompt, summary.full_text.full_text,
+                                                     experiment.max_new_tokens)
+                return generate_summary(summary.summarization_model, summary.prompt, summary.full_text.full_text,
+                                        experiment.context_window, experiment.max_new_tokens)
+            except Exception as e:
+                logger.error(f"Error generating summary {summary.pk}: {e}")
+                return None
+
+        failed, done = [], 0
+        chunk_size = settings.SUMMARY_GENERATION_CHUNK_SIZE
+        for start in range(0, len(summaries), chunk_size):
+            chunk = summaries[start:start + chunk_size]
+            # the summaries of an experiment share their model, and so their provider
+            engine = request_engine(API_LINK_PROVIDER if api_link else provider_for(chunk[0].summarization_model))
+            generated = []
+            for summary, text in zip(chunk, engine.map(generate, chunk)):
+                if not text:
+                    failed.append(summary.pk)
+                    continue
+                summary.summary = text
+                summary.generated_summary = text
+                generated.append(summary)
+            Summary.objects.bulk_update(generated, ["summary", "generated_summary"])
+            done += len(chunk)
+            pm.update_phase('generate_summaries', done)
+
+        pm.exit_phase('generate_summaries')
+        if failed:
+            logger.warning(f"{len(failed)} of {len(summaries)} summaries of experiment {experimentId} could not be "
+                           f"generated")
+
+        if eval_metrics:
+            # the metric tasks take over the id of this task, so clients keep following the same task. Their result
+            # lists the summaries that could not be scored because their generation failed.
+            raise self.replace(calculate_metrics.si(eval_metrics, experimentId, api_key))
         cache.delete(cache_key)
+        return {'generated': len(summaries) - len(failed), 'failed_summaries': failed}
 
+    except Ignore:
+        raise
     except Exception as e:
-        logger.error(f"Error in calculate_and_save_metric for experiment {experimentId} and metric {metric}: {str(e)}")
-
-        if pm is not None:
-            pm.handle_failure(e)
-        else:
-            self.update_state(
-                state='FAILURE',
-                meta={
-                    'error': str(e),
-                    'message': 'Failed during evaluation',
-                    'exc_type': type(e).__name__,
-                    'exc_message': e.__str__(),
-                }
-            )
+        logger.error(f"Error in generate_summaries for experiment {experimentId}: {str(e)}")
+        handle_task_failure(self, pm, e)
         cache.delete(cache_key)
         raise
 
 
-def creating_summaries(experiment):
-    summaries_dict = []
-
-    summaries = Summary.objects.filter(experiment=experiment.pk).select_related("experiment", "full_text").all()
-    print("Experiment is: ", experiment)
-    print("Experiment context_window:", experiment.context_window)
-    print("Experiment max_tokens:", experiment.max_new_tokens)
+def build_experiment_dicts(experiments):
+    """
+    Builds the responses of several experiments with a fixed number of queries: one for the summaries with their
+    full texts, and batched lookups by object_id for the evaluation results of the summaries and the experiments.
+    """
+    experiments = list(experiments)
+    summaries_by_experiment = {experiment.pk: [] for experiment in experiments}
+    summaries = Summary.objects.filter(experiment__in=list(summaries_by_experiment)).select_related("full_text")
     for summary in summaries:
-        try:
-            if summary.summarization_model and not summary.generated_summary:
-                print("There's a summary model but generated summary is EMPTY. Now it's time to create it.")
-                print("Summary model: ", summary.summarization_model)
-                if summary.summarization_model == 'gpt-4o-mini' or summary.summarization_model == 'o1-mini' or summary.summarization_model == 'o1-preview':
-                    print("OpenAI part is entered")
-
-                    try:
-                        open_ai_summarization = OpenAISummarization()
-                        print("OpenAI summarization instance created")
-                    except Exception as e:
-                        print("Error creating OpenAI summarization instance:", str(e))
-
-                    summary.generated_summary = open_ai_summarization.generate_summary(summary.summarization_model,
-                                                                                       summary.prompt,
-                                                                                       summary.full_text.full_text,
-                                                                                       experiment.context_window,
-                                                                                       experiment.max_new_tokens)
-                else:
-                    print("TogetherAI part is entered")
-                    together_ai_summarization = TogetherAISummarization()
-                    summary.generated_summary = together_ai_summarization.generate_summary(summary.summarization_model,
-                                                                                           summary.prompt,
-                                                                                           summary.full_text.full_text,
-                                                                                           experiment.context_window,
-                                                                                           experiment.max_new_tokens)
-                summary.save()
+        summaries_by_experiment[summary.experiment_id].append(summary)
+
+    summary_results = AutoEvaluation.objects.results_for(
+        Summary, [summary.pk for summaries in summaries_by_experiment.values() for summary in summaries]
+    )
+    experiment_results = AutoEvaluation.objects.results_for(Experiment, list(summaries_by_experiment))
+
+    responses = []
+    for experiment in experiments:
+        summaries_dict = [{"pk": summary.pk, "fields": {"experiment": experiment.pk,
+                                                        "prompt": summary.prompt,
+                                                        "summary": summary.summary,
+                                                        "reference_summary": summary.full_text.reference_summary,
+                                                        "full_text": summary.full_text.full_text,
+                                                        "summarization_model": summary.summarization_model,
+                                                        "generated_summary": summary.generated_summary,
+                                                        "evaluation_results": summary_results.get(summary.pk),
+                                                        "index": summary.index, }}
+                          for summary in summaries_by_experiment[experiment.pk]]
+        responses.append({
+            "pk": experiment.pk,
+            "fields": {
+                "project": experiment.project_id,
+                "name": experiment.name,
+                "llm_name": experiment.llm_name,
+                "context_window": experiment.context_window,
+                "max_new_tokens": experiment.max_new_tokens,
+                "summaries": summaries_dict,
+                "evaluation_results": experiment_results.get(experiment.pk)
+            }
+        })
+    return responses
 
-        except Exception as e:
-            logger.error(f"Error generating summarization model for summary {summary.pk}: {e}")
 
-        auto_evaluations = AutoEvaluation.objects.filter(content_type=ContentType.objects.get_for_model(Summary),
-                                                         object_id=summary.pk).values().first()
-        summaries_dict.append({"pk": summary.pk, "fields": {"experiment": experiment.pk,
-                                                            "prompt": summary.prompt,
-                                                            "summary": summary.summary,
-                                                            "reference_summary": summary.full_text.reference_summary,
-                                                            "full_text": summary.full_text.full_text,
-                                                            "summarization_model": summary.summarization_model,
-                                                            "generated_summary": summary.generated_summary,
-                                                            "evaluation_results": auto_evaluations,
-                                                            "index": summary.index, }})
+def build_experiment_dict(experiment):
+    return build_experiment_dicts([experiment])[0]
 
-    return summaries_dict
 
+# fields of the summary listing, with the columns they are loaded from
+SUMMARY_LIST_FIELDS = {
+    "experiment": (),
+    "prompt": ("prompt",),
+    "summary": ("summary",),
+    "evaluation_results": (),
+    "reference_summary": ("full_text__reference_summary",),
+    "summarization_model": ("summarization_model",),
+    "index": ("index",),
+    "generated_summary": ("generated_summary",),
+    "full_text": ("full_text__full_text",),
+}
 
-def build_experiment_dict(experiment):
-    auto_evaluation_total = AutoEvaluation.objects.filter(content_type=ContentType.objects.get_for_model(Experiment),
-                                                          object_id=experiment.pk).values().first()
-    summaries = Summary.objects.filter(experiment=experiment.pk).select_related("experiment", "full_text").all()
-    summaries_dict = []
-    for summary in summaries:
-        auto_evaluations = AutoEvaluation.objects.filter(content_type=ContentType.objects.get_for_model(Summary),
-                                                         object_id=summary.pk).values().first()
-        summaries_dict.append({"pk": summary.pk, "fields": {"experiment": experiment.pk, "prompt": summary.prompt,
-                                                            "summary": summary.summary,
-                                                            "reference_summary": summary.full_text.reference_summary,
-                                                            "evaluation_results": auto_evaluations,
-                                                            "index": summary.index, }})
-
-    summaries_dict = creating_summaries(experiment=experiment)
-    response = {
-        "pk": experiment.pk,
-        "fields": {
-            "project": experiment.project.pk,
-            "name": experiment.name,
-            "llm_name": experiment.llm_name,
-            "context_window": experiment.context_window,
-            "max_new_tokens": experiment.max_new_tokens,
-            "summaries": summaries_dict,
-            "evaluation_results": auto_evaluation_total
-        }
-    }
-    return response
+
+def summary_field(summary, field, experiment, evaluation_results):
+    if field == "experiment":
+        return experiment.pk
+    if field == "evaluation_results":
+        return evaluation_results.get(summary.pk)
+    if field == "reference_summary":
+        return summary.full_text.reference_summary
+    if field == "full_text":
+        return summary.full_text.full_text
+    return getattr(summary, field)
+
+
+def encode_cursor(summary):
+    return urlsafe_b64encode(json.dumps([summary.index, summary.pk]).encode()).decode()
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def decode_cursor(cursor):
+    """(index, pk) of a cursor made by encode_cursor, raises InvalidCursor for tampered or truncated cursors"""
+    try:
+        index, pk = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise InvalidCursor(cursor) from e
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in (pk, 0 if index is None else index)):
+        raise InvalidCursor(cursor)
+    return index, pk
+
+
+def summaries_after(index, pk):
+    """Summaries after (index, pk) in the order (index nulls last, pk)"""
+    if index is None:
+        return Q(index__isnull=True, pk__gt=pk)
+    return Q(index__gt=index) | Q(index=index, pk__gt=pk) | Q(index__isnull=True)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -218,11 +339,7 @@ class ExperimentView(APIView):
             if project.author != user and not ProjectInvite.objects.filter(project=project, user=user).exists():
                 return HttpResponse({"error": "Unauthorized access"}, status=403)
             experiments = Experiment.objects.filter(project=request.GET.get("project"))
-            print("Experiment count: ", len(experiments))
-            responses = []
-            for experiment in experiments:
-                print("Experiment in for loop:", experiment)
-                responses.append(build_experiment_dict(experiment))
+            responses = build_experiment_dicts(experiments)
             return HttpResponse(json.dumps(responses), content_type='application/json')
         except Experiment.DoesNotExist:
             return HttpResponseServerError("No experiment with such project id.")
@@ -250,45 +367,63 @@ class ExperimentView(APIView):
             return HttpResponseServerError("No experiment with such id.")
 
     def get_paginated_summaries(request):
+        """
+        Summaries of an experiment ordered by (index, id).
+        With a cursor parameter the page after the cursor is returned (empty for the first page), with next_cursor
+        for the following one. Otherwise page selects the page by offset.
+        fields selects the summary fields to return, e.g. fields=summary,index,evaluation_results leaves out the
+        full texts.
+        """
         user = request.user
         try:
             experiment_id = request.GET.get("experiment")
             page = int(request.GET.get("page", 1))
             page_size = int(request.GET.get("page_size", 10))
+            cursor = request.GET.get("cursor")
+            fields = request.GET.get("fields")
+            fields = fields.split(",") if fields else list(SUMMARY_LIST_FIELDS)
 
             if not experiment_id:
                 return JsonResponse({"error": "Missing experiment id."}, status=400)
+            unknown_fields = [field for field in fields if field not in SUMMARY_LIST_FIELDS]
+            if unknown_fields:
+                return JsonResponse({"error": f"Unknown fields: {', '.join(unknown_fields)}."}, status=400)
 
             experiment = Experiment.objects.get(pk=experiment_id)
-            summaries = Summary.objects.filter(experiment=experiment_id).order_by("index", "created_at")
+            columns = [column for field in fields for column in SUMMARY_LIST_FIELDS[field]]
+            summaries = Summary.objects.filter(experiment=experiment_id).order_by(
+                F("index").asc(nulls_last=True), "pk"
+            )
+            if any(column.startswith("full_text__") for column in columns):
+                summaries = summaries.select_related("full_text")
+                columns.append("full_text")
+            summaries = summaries.only("pk", "index", *columns)
 
             total_count = summaries.count()
-            start = (page - 1) * page_size
-            end = start + page_size
-
-            summaries_page = summaries[start:end]
-
-            auto_evaluation_total = AutoEvaluation.objects.filter(
-                content_type=ContentType.objects.get_for_model(Experiment),
-                object_id=experiment.pk
-            ).values().first()
+            if cursor is not None:
+                # keyset pagination, the cost of a page does not depend on its position
+                if cursor:
+                    summaries = summaries.filter(summaries_after(*decode_cursor(cursor)))
+                summaries_page = list(summaries[:page_size + 1])
+                has_next = len(summaries_page) > page_size
+                summaries_page = summaries_page[:page_size]
+                next_cursor = encode_cursor(summaries_page[-1]) if has_next else None
+            else:
+                start = (page - 1) * page_size
+                summaries_page = list(summaries[start:start + page_size])
+                next_cursor = None
+
+            evaluation_results = {}
+            if "evaluation_results" in fields:
+                evaluation_results = AutoEvaluation.objects.results_for(
+                    Summary, [summary.pk for summary in summaries_page]
+                )
 
             summaries_list = [
                 {
                     "pk": summary.pk,
                     "fields": {
-                        "experiment": experiment.pk,
-                        "prompt": summary.prompt,
-                        "summary": summary.summary,
-                        "evaluation_results": AutoEvaluation.objects.filter(
-                            content_type=ContentType.objects.get_for_model(Summary),
-                            object_id=summary.pk
-                        ).values().first(),
-                        "reference_summary": summary.full_text.reference_summary,
-                        "summarization_model": summary.summarization_model,
-                        "index": summary.index,
-                        "generated_summary": summary.generated_summary,
-                        "full_text": summary.full_text.full_text,
+                        field: summary_field(summary, field, experiment, evaluation_results) for field in fields
                     }
                 }
                 for summary in summaries_page
@@ -297,7 +432,7 @@ class ExperimentView(APIView):
             return JsonResponse({
                 "pk": experiment.pk,
                 "fields": {
-                    "project": experiment.project.pk,
+                    "project": experiment.project_id,
                     "name": experiment.name,
                     "llm_name": experiment.llm_name,
                     "context_window": experiment.context_window,
@@ -306,10 +441,13 @@ class ExperimentView(APIView):
                 },
                 "total_count": total_count,
                 "page": page,
-                "page_size": page_size
+                "page_size": page_size,
+                "next_cursor": next_cursor
             }, status=200)
 
 
+        except InvalidCursor:
+            return JsonResponse({"error": "Invalid cursor."}, status=400)
         except ValueError:
             return JsonResponse({"error": "Invalid page or page_size."}, status=400)
         except Experiment.DoesNotExist:
@@ -335,7 +473,6 @@ class ExperimentView(APIView):
             eval_metrics = request.POST.get("eval_metrics", "").split(",") if request.POST.get("eval_metrics",
                                                                                                "") else []
             api_key = request.POST.get("api_key", "")
-            max_new_tokens = request.POST.get("max_new_tokens", None)
             context_window = request.POST.get("context_window", None)
             summary_ids = []
 
@@ -365,15 +502,6 @@ class ExperimentView(APIView):
                 if not invite:
                     return JsonResponse({"error": "Unauthorized access"}, status=403)
 
-            # Parse and validate CSV if provided
-            csv_data = []
-            if csv_file:
-                data = csv_file.read().decode("utf-8")
-                csv_reader = list(csv.DictReader(data.splitlines()))
-                if not csv_reader:
-                    return JsonResponse({"error": "CSV file is empty or invalid."}, status=400)
-                csv_data = csv_reader
-
             # Parse ranges
             selected_indices = []
             if fixed_range:
@@ -437,127 +565,66 @@ class ExperimentView(APIView):
                         invite.save()
 
                 # Process summaries
-                bulk_summaries = []
-                summaries = []
-                reference_summaries = []
-                print("Experiment in pagination: ", new_experiment)
-                print("Experiment max new tokens in pagination: ", new_experiment.max_new_tokens)
-                print("Experiment context_window in pagination: ", new_experiment.context_window)
-
+                generation_api_link = None
                 if csv_file:
-                    # Validate CSV row count matches selected indices
-                    if len(csv_data) != len(full_texts):
-                        raise IntegrityError("Mismatch between CSV rows and selected indices.")
-
-                    for idx, (row, full_text) in enumerate(zip(csv_data, full_texts), start=1):
-                        prompt = row.get(request.POST.get("prompt_column", ""), "").strip() or request.POST.get(
-                            "prompt", "").strip()
-                        summary = row.get(request.POST.get("summary_column", ""), "").strip()
-
+                    # the rows are streamed from the upload and paired with the selected full texts in index order
+                    full_text_rows = full_texts.iterator()
+                    prompt_column = request.POST.get("prompt_column", "")
+                    summary_column = request.POST.get("summary_column", "")
+                    default_prompt = request.POST.get("prompt", "").strip()
+
+                    def build_summary(row_number, row):
+                        full_text = next(full_text_rows, None)
+                        if full_text is None:
+                            raise ValueError("More CSV rows than selected indices")
+                        summary = (row.get(summary_column) or "").strip()
                         if not summary:
-                            raise IntegrityError(f"Missing summary for FullText in row {idx}.")
+                            raise ValueError("Missing summary")
 
                         # Assign the full text index for experiment summaries
-                        bulk_summaries.append(
-                            Summary(
-                                experiment=new_experiment,
-                                full_text=full_text,
-                                prompt=prompt,
-                                summary=summary,
-                                index=full_text.index,
-                            )
+                        return Summary(
+                            experiment=new_experiment,
+                            full_text=full_text,
+                            prompt=(row.get(prompt_column) or "").strip() or default_prompt,
+                            summary=summary,
+                            index=full_text.index,
                         )
-                        summaries.append(summary)
-                        reference_summaries.append(full_text.reference_summary)
 
-                    created_summaries = Summary.objects.bulk_create(bulk_summaries)
-                    summary_ids = [summary.pk for summary in created_summaries]
+                    if not ingest_csv(csv_file, Summary, build_summary):
+                        raise CSVIngestError([{"row": None, "error": "CSV file is empty or invalid."}])
+                    # Validate CSV row count matches selected indices
+                    if next(full_text_rows, None) is not None:
+                        raise IntegrityError("Mismatch between CSV rows and selected indices.")
                 elif use_model:
-                    # Generate summaries using the selected model
-                    for idx, full_text in enumerate(full_texts, start=1):
-                        prompt = request.POST.get("prompt", "").strip()
-                        if summarization_model in ['gpt-4o-mini', 'o1-mini', 'o1-preview']:
-                            open_ai_summarization = OpenAISummarization()
-                            generated_summary = open_ai_summarization.generate_summary(
-                                summarization_model, prompt, full_text.full_text, new_experiment.context_window,
-                                new_experiment.max_new_tokens
-                            )
-                        else:
-                            together_ai_summarization = TogetherAISummarization()
-                            generated_summary = together_ai_summarization.generate_summary(
-                                summarization_model, prompt, full_text.full_text, new_experiment.context_window,
-                                new_experiment.max_new_tokens
-                            )
-
-                        new_summary = Summary.objects.create(
+                    # the summaries are generated by the generate_summaries task, the request does not wait for them
+                    prompt = request.POST.get("prompt", "").strip()
+                    created_summaries = Summary.objects.bulk_create([
+                        Summary(
                             experiment=new_experiment,
                             full_text=full_text,
                             prompt=prompt,
-                            summary=generated_summary,
-                            generated_summary=generated_summary,
                             summarization_model=summarization_model,
                             index=full_text.index,
                         )
-                        summaries.append(generated_summary)
-                        reference_summaries.append(full_text.reference_summary)
-                        summary_ids.append(new_summary.pk)
+                        for full_text in full_texts
+                    ])
+                    summary_ids = [summary.pk for summary in created_summaries]
                 elif api_link:
-                    import requests
-
-                    for idx, full_text in enumerate(full_texts, start=1):
-                        prompt = request.POST.get("prompt", "").strip()
-                        text_content = full_text.full_text.strip()
-                        final_prompt = f"{prompt} {text_content}"
-
-                        payload = {
-                            "prompt": final_prompt,
-                            "full_text": text_content,
-                            "max_new_tokens": max_new_tokens,
-                        }
-
-                        try:
-
-                            print(f"Payload for index {full_text.index}: {payload}")
-                            # 192.168.0.77 needs to be replaced by actual localhost address
-                            api_link = api_link.replace("localhost", "192.168.0.77")
-                            print(f"Sending request to API Link: {api_link}")
-                            response = requests.post(api_link, json=payload)
-                            print("response:", response)
-                            response.raise_for_status()
-                            generated_summary = response.json().get("response", "")
-                            print("generated summary:", generated_summary)
-
-                            if not generated_summary:
-                                raise Exception("API failed to generate summary for index {full_text.index}.")
-
-                            new_summary = Summary.objects.create(
-                                experiment=new_experiment,
-                                full_text=full_text,
-                                prompt=prompt,
-                                summary=generated_summary,
-                                generated_summary=generated_summary,
-                                summarization_model=llm_name,
-                                index=full_text.index,
-                            )
-                            summaries.append(generated_summary)
-                            reference_summaries.append(full_text.reference_summary)
-
-                        except requests.ConnectionError as conn_err:
-                            print(f"Connection error for index {full_text.index}: {conn_err}")
-                            return JsonResponse(
-                                {"error": f"Failed to connect to the API: {conn_err}"}, status=500
-                            )
-                        except requests.Timeout:
-                            print(f"Timeout error for index {full_text.index}")
-                            return JsonResponse(
-                                {"error": "The request to the API timed out. Please check the endpoint."},
-                                status=500,
-                            )
-                        except requests.RequestException as req_err:
-                            print(f"Request error for index {full_text.index}: {req_err}")
-                            return JsonResponse(
-                                {"error": f"An error occurred while calling the API: {req_err}"}, status=500
-                            )
+                    # like use_model, the summaries are generated by the API in the generate_summaries task
+                    prompt = request.POST.get("prompt", "").strip()
+                    Summary.objects.bulk_create([
+                        Summary(
+                            experiment=new_experiment,
+                            full_text=full_text,
+                            prompt=prompt,
+                            summarization_model=llm_name,
+                            index=full_text.index,
+                        )
+                        for full_text in full_texts
+                    ])
+                    generation_api_link = api_link
+
+                ExperimentOverview.objects.refresh([new_experiment.pk])
 
                 # Handle pagination
                 page = int(request.POST.get("page", 1))
@@ -570,16 +637,18 @@ class ExperimentView(APIView):
                 except Exception:
                     return JsonResponse({"error": "Invalid page number."}, status=400)
 
-                # Construct the full_texts_list
-            full_texts_list = [ft.full_text for ft in full_texts]
-            summary_texts = [summary.summary or summary.generated_summary for summary in
-                             Summary.objects.filter(experiment=new_experiment)]
-
-            if eval_metrics:
-                task = calculate_metrics.delay(eval_metrics, summary_texts, summary_ids, reference_summaries,
-                                               full_texts_list, new_experiment.pk, api_key)
+            task = None
+            if use_model or generation_api_link:
+                # generates the summaries, then computes the metrics under the same task id
+                task = generate_summaries.delay(new_experiment.pk, eval_metrics=eval_metrics, api_key=api_key,
+                                                api_link=generation_api_link)
+            elif eval_metrics:
+                # the task loads the summaries and texts of the experiment from the database
+                task = calculate_metrics.delay(eval_metrics, new_experiment.pk, api_key)
+            if task is not None:
                 # cache task_id for a day
                 cache.set(f'{new_experiment.pk}', task.id, 60 * 60 * 24)
+                record_task_experiment(task.id, new_experiment.pk)
 
 
             summaries_data = [
@@ -599,13 +668,16 @@ class ExperimentView(APIView):
                 "summaries": summaries_data,
                 "total_pages": paginator.num_pages,
                 "current_page": page,
-                "task": {} if not eval_metrics else {
+                "task": {} if task is None else {
                     'task_id': task.id,
                     'status_endpoint': f'/api/tasks/{task.id}/status/',
+                    'events_endpoint': events_endpoint(task.id, request.user),
                     'monitoring_interval': 5000
                 },
             }, status=201)
 
+        except CSVIngestError as e:
+            return JsonResponse({"error": str(e), "invalid_rows": e.invalid_rows, "rows": e.errors}, status=400)
         except Project.DoesNotExist:
             return JsonResponse({"error": "No project found with the given project ID."}, status=404)
         except Exception as e:
@@ -662,38 +734,22 @@ class ExperimentSummaryView(APIView):
             project = Project.objects.get(pk=project_id)
 
             # Check if the user is the author or an invited user
-            if project.author != user and not ProjectInvite.objects.filter(project=project, user=user).exists():
+            invite = ProjectInvite.objects.filter(project=project, user=user).first()
+            if project.author != user and invite is None:
                 return JsonResponse({"error": "Unauthorized access."}, status=403)
 
-            experiments = Experiment.objects.filter(project=project_id)
+            experiments = list(Experiment.objects.filter(project=project_id).select_related("overview"))
+            # experiments created before the overviews existed get theirs on the first read
+            missing = [experiment.pk for experiment in experiments if not hasattr(experiment, "overview")]
+            overviews = {overview.experiment_id: overview for overview in ExperimentOverview.objects.refresh(missing)}
+
+            experiment_ids = set(invite.experiment_ids) if invite is not None else set()
             experiment_list = []
             for experiment in experiments:
-                evaluation_results = AutoEvaluation.objects.filter(
-                    content_type=ContentType.objects.get_for_model(Experiment),
-                    object_id=experiment.pk
-                ).values().first()
-
-                # Determine if pagination is supported
-                summary_count = Summary.objects.filter(experiment=experiment.pk).count()
-                supports_pagination = summary_count > 10
-
-                # Fetch indices used in this experiment
-                summary_indices = Summary.objects.filter(experiment=experiment.pk).values_list("index", flat=True)
-                indexed_range = {
-                    "start": min(summary_indices) if summary_indices else None,
-                    "end": max(summary_indices) if summary_indices else None,
-                    "indices": list(summary_indices),
-                }
+                overview = overviews.get(experiment.pk) or experiment.overview
 
-                # Check if the user is the owner of the experiment
-                is_experiment_owner = (
-                        project.author == user or  # Project owner
-                        ProjectInvite.objects.filter(
-                            user=user,
-                            project=project,
-                            experiment_ids__contains=[experiment.pk]
-                        ).exists()  # Experiment creator
-                )
+                # Check if the user is the owner of the experiment: project owner or experiment creator
+                is_experiment_owner = project.author == user or experiment.pk in experiment_ids
 
                 # Build experiment data with fields
                 experiment_list.append({
@@ -703,11 +759,16 @@ class ExperimentSummaryView(APIView):
                         "llm_name": experiment.llm_name,
                         "context_window": experiment.context_window,
                         "max_new_tokens": experiment.max_new_tokens,
-                        "evaluation_results": evaluation_results or None,
-                        "project": experiment.project.pk,
+                        "evaluation_results": overview.evaluation_results or None,
+                        "project": experiment.project_id,
                         "experiment": experiment.pk,
-                        "supportsPagination": supports_pagination,
-                        "indexedRange": indexed_range,
+                        "supportsPagination": overview.summary_count > 10,
+                        "indexedRange": {
+                            "start": overview.index_start,
+                            "end": overview.index_end,
+                            "ranges": overview.index_ranges,
+                            "count": overview.summary_count,
+                        },
                         "owner": is_experiment_owner,
                     }
                 })
@@ -751,3 +812,47 @@ class ExperimentOwnershipView(APIView):
         except Exception as e:
             print(f"Error: {e}")
             return JsonResponse({"error": "An unexpected error occurred."}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GenerateSummariesView(APIView):
+    def post(self, request):
+        """
+        Generates the summaries of an experiment that are still missing, e.g. because their generation failed, and
+        optionally computes the metrics afterwards under the same task id.
+        Experiments whose summaries were generated by an API link pass it again as "api_link".
+        """
+        user = request.user
+        try:
+            data = json.loads(request.body) if request.body else {}
+            experiment_id = data.get("experiment")
+            if not experiment_id:
+                return JsonResponse({"error": "Experiment ID is required."}, status=400)
+            eval_metrics = data.get("eval_metrics") or []
+            api_key = data.get("api_key", "")
+            api_link = (data.get("api_link") or "").strip() or None
+
+            try:
+                experiment = Experiment.objects.select_related("project").get(pk=experiment_id)
+            except Experiment.DoesNotExist:
+                return JsonResponse({"error": "Experiment not found."}, status=404)
+            project = experiment.project
+            if project.author != user and not ProjectInvite.objects.filter(project=project, user=user).exists():
+                return JsonResponse({"error": "Unauthorized access"}, status=403)
+
+            task = generate_summaries.delay(experiment.pk, eval_metrics=eval_metrics, api_key=api_key,
+                                            api_link=api_link)
+            # cache task_id for a day
+            cache.set(f'{experiment.pk}', task.id, 60 * 60 * 24)
+            record_task_experiment(task.id, experiment.pk)
+
+            return JsonResponse({'task_id': task.id,
+                                 'status_endpoint': f'/api/tasks/{task.id}/status/',
+                                 'events_endpoint': events_endpoint(task.id, request.user),
+                                 'monitoring_interval': 5000
+                                 }, status=202)
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Invalid JSON body."}, status=400)
+        except Exception as e:
+            print(f"Error: {e}")
+            return JsonResponse({"error": "An unexpected error occurred."}, status=500)
@@ -1,9 +1,10 @@
-import csv
 from django.http import HttpResponse, HttpResponseServerError, JsonResponse
 import json
 from django.utils.decorators import method_decorator
 from django.db import transaction, IntegrityError
 from django.views import View
+from ..csv_ingest import CSVIngestError, ingest_csv
+from ..models.experiment_overview_model import ExperimentOverview
 from ..models.fulltext_model import FullText
 from ..models.project_model import Project
 from django.views.decorators.csrf import csrf_exempt
@@ -63,6 +64,11 @@ class FullTextView(APIView):
 
     # TODO: May not be needed
     def post(self, request):
+        """
+        Inserts the full texts of one chunk of an uploaded CSV file.
+        Responds with {"created": number of inserted rows} and status 201. The inserted rows are not serialized into
+        the response anymore, as they are streamed into the database without being kept in memory.
+        """
         user = request.user
         try:
             csv_file = request.FILES.get("csv_file", "")
@@ -72,8 +78,6 @@ class FullTextView(APIView):
             if not csv_file or not csv_file.name.endswith(".csv"):
                 return HttpResponseServerError(json.dumps({"error": "Please upload a .csv file."}))
 
-            data = csv_file.read().decode("utf-8")
-            csv_reader = csv.DictReader(data.splitlines())
             project_id = request.POST.get('project')
             project = Project.objects.get(pk=project_id)
 
@@ -89,33 +93,27 @@ class FullTextView(APIView):
             if not full_text_column:
                 return HttpResponseServerError(json.dumps({"error": "Missing attribute."}))
 
+            # rows of earlier chunks of the file, the row numbers of errors refer to the whole file
+            row_offset = chunk_index * chunk_size
+
+            def build_full_text(row_number, row):
+                full_text = (row.get(full_text_column) or "").strip()
+                # If full text is missing from one row the upload is rejected
+                if not full_text:
+                    raise ValueError("No Full text given")
+                return FullText(
+                    project=project,
+                    full_text=full_text,
+                    reference_summary=(row.get(reference_summary_column) or "").strip(),
+                    index=row_number - 2
+                )
+
             with transaction.atomic():
-                full_texts = []
-            
-                # Iterate over the csv
-                for index, row in enumerate(csv_reader):
-                    full_text = row.get(full_text_column, "").strip()
-                    reference_summary = row.get(reference_summary_column, "").strip()
-                    whole_file_index = (chunk_index * chunk_size) + index
-                    # If full text is missing from one row skip it
-                    if not full_text:
-                        raise IntegrityError(
-                            f"No Full text given in row {whole_file_index + 2}"
-                        )
-
-                    # For each row, store a new prompt-summary pair together with its FK to the experiment
-                    full_text = FullText.objects.create(
-                        project=project,
-                        full_text=full_text,
-                        reference_summary=reference_summary,
-                        index=whole_file_index
-                    )
-                    #print("Full text is in FULLTEXT VIEW: " + full_text)
-                    #print("Summarized field is in FULLTEXT VIEW: " + summarization_text)
-                    full_texts.append(full_text)
-                # Return new full texts as HTTP
-                return HttpResponse(serialize("json", full_texts), status=201)
+                created = ingest_csv(csv_file, FullText, build_full_text, row_offset=row_offset)
+            return JsonResponse({"created": created}, status=201)
 
+        except CSVIngestError as e:
+            return JsonResponse({"error": str(e), "invalid_rows": e.invalid_rows, "rows": e.errors}, status=400)
         except Project.DoesNotExist:
             return HttpResponseServerError(json.dumps({"error": "No project found for the given project id."}))
         except Exception as e:
@@ -128,7 +126,11 @@ class FullTextView(APIView):
             full_text = FullText.objects.get(pk=request.GET.get('id'))
             if full_text.project.author != user:
                 return Response({"error": "Unauthorized access"}, status=403)
-            full_text.delete()
+            # the summaries of the full text are deleted with it
+            experiment_ids = list(full_text.summary_set.values_list("experiment", flat=True).distinct())
+            with transaction.atomic():
+                full_text.delete()
+                ExperimentOverview.objects.refresh(experiment_ids)
             return Response({"message": "FullText deleted successfully"}, status=200)
         except FullText.DoesNotExist:
             return Response({"error": "No FullText with such id."}, status=404)
@@ -0,0 +1,11 @@
+#!/bin/sh
+set -e
+
+# Only the web container prepares the database, the celery workers share the image and skip this
+if [ "${RUN_DB_SETUP:-false}" = "true" ]; then
+  # the unique (content_type, object_id) constraint on AutoEvaluation cannot be added while duplicates exist
+  python manage.py dedupe_auto_evaluations
+  python manage.py migrate --noinput
+fi
+
+exec "$@"
@@ -1,10 +1,16 @@
+import logging
 import os
+import threading
 
-from celery import Celery
+from celery import Celery, states
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import task_postrun, worker_process_init, worker_ready
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'summeval.settings')
 
+logger = logging.getLogger(__name__)
+
 app = Celery('summeval')
 
 # Using a string here means the worker doesn't have to serialize
@@ -14,4 +20,87 @@ app = Celery('summeval')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+MODEL_BOUND_QUEUE = 'model_bound'  # transformer and n-gram metrics, prefork workers with low concurrency
+API_BOUND_QUEUE = 'api_bound'  # metrics waiting on external APIs, thread workers with high concurrency
+DB_WRITES_QUEUE = 'db_writes'  # dispatching chords and saving results
+
+API_BOUND_METRICS = ('llm_evaluation', 'factscore')
+
+# tasks that compute a metric, with the position of the metric in their arguments
+METRIC_TASKS = {
+    'base.views.experiment_view.calculate_metric': 0,
+    'base.views.auto_evaluation_view.calculate_and_save_metric': 1,
+    'base.views.auto_evaluation_view.calculate_metric_shard': 1,
+}
+
+# tasks that only wait on external APIs
+API_BOUND_TASKS = (
+    'base.views.experiment_view.generate_summaries',
+)
+
+DB_WRITES_TASKS = (
+    'base.views.experiment_view.calculate_metrics',
+    'base.views.experiment_view.save_metric_results',
+    'base.views.auto_evaluation_view.merge_metric_shards',
+)
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Routes metric tasks by the kind of metric they compute, all other tasks go to the default queue"""
+    if name in METRIC_TASKS:
+        position = METRIC_TASKS[name]
+        metric = kwargs.get('metric') or (args[position] if len(args) > position else None)
+        return {'queue': API_BOUND_QUEUE if metric in API_BOUND_METRICS else MODEL_BOUND_QUEUE}
+    if name in API_BOUND_TASKS:
+        return {'queue': API_BOUND_QUEUE}
+    if name in DB_WRITES_TASKS:
+        return {'queue': DB_WRITES_QUEUE}
+    return None
+
+
+app.conf.task_routes = (route_task,)
+
+
+def warmup_metrics():
+    from django.conf import settings
+
+    metric_names = settings.EVALUATION_WARMUP_METRICS
+    try:
+        settings.EVALUATION_HANDLER.warmup(None if metric_names == ["all"] else metric_names)
+    except Exception:
+        # the metrics are built on first use instead
+        logger.exception("Warming up the metrics %s failed", metric_names)
+
+
+def start_warmup():
+    # loading the models takes far longer than celery waits for a pool process to start (worker_proc_alive_timeout),
+    # so they are built in the background. Tasks arriving earlier wait in get_metric for the metric they need.
+    from django.conf import settings
+
+    if settings.EVALUATION_WARMUP_METRICS:
+        threading.Thread(target=warmup_metrics, name="metric-warmup", daemon=True).start()
+
+
+@worker_process_init.connect
+def warmup_pool_process(**kwargs):
+    # every prefork pool process builds the configured metrics once, tasks of that process then reuse them
+    start_warmup()
+
+
+@worker_ready.connect
+def warmup_worker(sender=None, **kwargs):
+    # thread and solo pools run the tasks in the worker process itself, which never sends worker_process_init
+    if not isinstance(sender.pool, PreforkPool):
+        start_warmup()
+
+
+@task_postrun.connect
+def publish_final_state(task_id=None, retval=None, state=None, **kwargs):
+    # progress is published by CeleryProgressManager, the final state of a task by this handler. Replaced tasks
+    # (chords) end as IGNORED, their callback publishes the final state under the same task id.
+    if state in states.READY_STATES:
+        from base.evaluation.task_events import publish_task_event
+
+        publish_task_event(task_id, state, meta=str(retval) if state == states.FAILURE else None, result=retval)
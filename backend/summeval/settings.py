@@ -147,6 +147,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "summeval.wsgi.application"
+ASGI_APPLICATION = "summeval.asgi.application"
 
 
 # Database
@@ -235,5 +236,52 @@ CELERY_TASK_TRACK_STARTED = True  # Persist STARTED state
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
 
+# Redis used to push task progress to the clients streaming /api/tasks/<id>/events
+TASK_EVENTS_REDIS_URL = os.getenv("TASK_EVENTS_REDIS_URL", "redis://redis:6379/0")
+# Seconds between keepalive comments on idle event streams
+TASK_EVENTS_KEEPALIVE = float(os.getenv("TASK_EVENTS_KEEPALIVE", 15))
+# Event streams are opened with a signed token in the URL, as EventSource cannot send the JWT. Seconds a token is valid
+TASK_EVENTS_TOKEN_MAX_AGE = int(os.getenv("TASK_EVENTS_TOKEN_MAX_AGE", 60))
+
+# Metrics are built on first use. Workers can build them ahead of the first task by listing them here,
+# e.g. "rouge,bleu,bertscore" or "all". Web processes should leave this empty.
+EVALUATION_WARMUP_METRICS = [m.strip() for m in os.getenv("EVALUATION_WARMUP_METRICS", "").split(",") if m.strip()]
+
+# Task progress updates are sent at most every PROGRESS_UPDATE_MIN_INTERVAL seconds and only if the progress changed
+# by at least PROGRESS_UPDATE_MIN_CHANGE percent. Phase changes, completion and failures are always sent.
+PROGRESS_UPDATE_MIN_INTERVAL = float(os.getenv("PROGRESS_UPDATE_MIN_INTERVAL", 1.0))
+PROGRESS_UPDATE_MIN_CHANGE = float(os.getenv("PROGRESS_UPDATE_MIN_CHANGE", 1.0))
+
+# Number of AutoEvaluation rows per bulk query when saving metric results
+AUTO_EVALUATION_BATCH_SIZE = int(os.getenv("AUTO_EVALUATION_BATCH_SIZE", 500))
+
+# Number of summaries loaded per query when metric tasks fetch their texts
+METRIC_FETCH_CHUNK_SIZE = int(os.getenv("METRIC_FETCH_CHUNK_SIZE", 2000))
+
+# Experiments with more summaries than this are scored in shards of this size by parallel tasks (0 disables sharding)
+METRIC_SHARD_SIZE = int(os.getenv("METRIC_SHARD_SIZE", 500))
+
+# Uploaded CSV files are parsed row by row and inserted in batches of CSV_INGEST_BATCH_SIZE rows.
+# All invalid rows are counted, the details of at most CSV_INGEST_MAX_ERRORS of them are reported.
+CSV_INGEST_BATCH_SIZE = int(os.getenv("CSV_INGEST_BATCH_SIZE", 1000))
+CSV_INGEST_MAX_ERRORS = int(os.getenv("CSV_INGEST_MAX_ERRORS", 100))
+
+# Generated summaries are saved after every SUMMARY_GENERATION_CHUNK_SIZE summaries
+SUMMARY_GENERATION_CHUNK_SIZE = int(os.getenv("SUMMARY_GENERATION_CHUNK_SIZE", 50))
+
+# Metric tasks checkpoint their per-summary results in the cache every METRIC_CHECKPOINT_CHUNK_SIZE summaries.
+# A retried or resubmitted task only scores the summaries without a checkpoint.
+METRIC_CHECKPOINT_CHUNK_SIZE = int(os.getenv("METRIC_CHECKPOINT_CHUNK_SIZE", 200))
+METRIC_CHECKPOINT_TIMEOUT = int(os.getenv("METRIC_CHECKPOINT_TIMEOUT", 60 * 60 * 24 * 7))
+
+# SQLite cache of the G-Eval scores, shared by all workers of a host
+GEVAL_CACHE_FILE = os.getenv("GEVAL_CACHE_FILE", str(BASE_DIR / ".cache" / "geval" / "geval.sqlite"))
+
+# Metric tasks are acknowledged late and redelivered if their worker dies. Redis redelivers messages that are not
+# acknowledged within the visibility timeout, so it has to be longer than the longest metric task.
+CELERY_BROKER_TRANSPORT_OPTIONS = {"visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", 60 * 60 * 12))}
+# Redelivered metric tasks fail after MAX_TASK_DELIVERIES deliveries, e.g. when a chunk kills the worker every time
+MAX_TASK_DELIVERIES = int(os.getenv("MAX_TASK_DELIVERIES", 3))
+
 AUTH_USER_MODEL = "users.CustomUser"  # Set the custom user model to the CustomUser model in the users app
 
@@ -198,7 +198,7 @@ export default function ProjectDetails() {
               evaluation_results: experiment.fields.evaluation_results,
               supportsPagination: experiment.fields.supportsPagination,
               indexedRange: experiment.fields.indexedRange, // index range
-              indices: experiment.fields.indexedRange?.indices || [], // exact indices
+              indexRanges: experiment.fields.indexedRange?.ranges || [], // [first, last] ranges of the indices
               owner: experiment.fields.owner,
               project: experiment.fields.project,
             },
@@ -4,6 +4,7 @@ import axios from '../../utils/axios.js';
 
 const TaskOverlay = ({ children, cacheKey, onPollingChange, onPollingComplete }) => {
   const [taskId, setTaskId] = useState(null);
+  const [eventsEndpoint, setEventsEndpoint] = useState(null);
   const [progress, setProgress] = useState(null);
   const [loading, setLoading] = useState(false);
   const containerRef = useRef(null);
@@ -14,7 +15,7 @@ const TaskOverlay = ({ children, cacheKey, onPollingChange, onPollingComplete })
       const response = await axios.get(`/api/tasks/from-cache/${cacheKey}`);
       if (response.status !== 200) throw new Error('No task found');
 
-      return response.data.task_id;
+      return response.data;
     } catch (error) {
       console.error('Error fetching task ID:', error);
       return null;
@@ -39,9 +40,10 @@ const TaskOverlay = ({ children, cacheKey, onPollingChange, onPollingComplete })
   };
 
   const startTask = useCallback(async () => {
-    const id = await fetchTaskId();
-    if (id) {
-      setTaskId(id);
+    const task = await fetchTaskId();
+    if (task) {
+      setTaskId(task.task_id);
+      setEventsEndpoint(task.events_endpoint);
       setLoading(true);
       if (onPollingChange) onPollingChange(true);
     }
@@ -51,33 +53,54 @@ const TaskOverlay = ({ children, cacheKey, onPollingChange, onPollingComplete })
     startTask();
   }, [startTask]);
 
+  const handleStatus = useCallback(
+    (status) => {
+      // a queued task is PENDING, the event stream reports that state as soon as it connects
+      if (['SUCCESS', 'FAILURE', 'REVOKED', 'CANCELLED'].includes(status.state)) {
+        setLoading(false);
+        setTaskId(null);
+        if (onPollingChange) onPollingChange(false);
+        if (onPollingComplete) onPollingComplete(true);
+        return true;
+      }
+      if (status.progress !== undefined) setProgress(status.progress);
+      return false;
+    },
+    [onPollingChange, onPollingComplete]
+  );
+
   useEffect(() => {
     if (!taskId) return;
 
-    const interval = setInterval(async () => {
-      const status = await fetchTaskStatus(taskId);
-      console.log('status: ', status);
-      if (status) {
-        if (['SUCCESS', 'FAILURE', 'PENDING'].includes(status.state)) {
+    // progress is pushed by the server, polling is only used if the event stream is not available.
+    // EventSource cannot send the JWT, the events endpoint carries a short-lived signed token instead
+    let interval = null;
+    const events = new EventSource(`${axios.defaults.baseURL}${eventsEndpoint}`);
+
+    const startPolling = () => {
+      interval = setInterval(async () => {
+        const status = await fetchTaskStatus(taskId);
+        if (!status || handleStatus(status)) {
           clearInterval(interval);
-          setLoading(false);
-          setTaskId(null);
-          if (onPollingChange) onPollingChange(false);
-          if (onPollingComplete) onPollingComplete(true);
-        } else {
-          setProgress(status.progress);
+          if (!status && onPollingChange) onPollingChange(false);
         }
-      } else {
-        clearInterval(interval);
-        if (onPollingChange) onPollingChange(false);
-      }
-    }, pollIntervalInMilliseconds);
+      }, pollIntervalInMilliseconds);
+    };
+
+    events.onmessage = (event) => {
+      if (handleStatus(JSON.parse(event.data))) events.close();
+    };
+    events.onerror = () => {
+      events.close();
+      if (!interval) startPolling();
+    };
 
     return () => {
+      events.close();
       clearInterval(interval);
       if (onPollingChange) onPollingChange(false);
     };
-  }, [taskId, onPollingChange]);
+  }, [taskId, eventsEndpoint, onPollingChange, handleStatus]);
 
   return (
     <Box className="relative w-full">